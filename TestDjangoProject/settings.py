@@ -44,8 +44,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'goods.middleware.RequestIdMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'goods.middleware.PrimaryPinningMiddleware',
+    'goods.middleware.BuyerKeyMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -89,12 +92,94 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения каталога: POSTGRES_REPLICA_HOSTS=replica1,replica2
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = DATABASES['default'] | {
+        'HOST': host,
+        'ATOMIC_REQUESTS': False,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['goods.db_router.PrimaryReplicaRouter']
+
+# Допустимое отставание реплики и период его проверки, в секундах
+REPLICA_MAX_LAG = 2
+REPLICA_LAG_CHECK_INTERVAL = 5
+# Сколько секунд после записи клиент читает только с основной БД
+PRIMARY_PIN_SECONDS = 5
+
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
         "LOCATION": BASE_DIR / "caches",
-    }
+    },
+    # Счётчики лимитов частоты и одновременных вызовов Stripe (goods.ratelimit): общие для всех воркеров,
+    # incr в Redis атомарен
+    "ratelimit": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://redis:6379/0"),
+    },
+}
+
+# Сессии читаются из кэша, в БД пишутся только при изменении
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+# Время жизни куки с ключом анонимного покупателя, в секундах
+BUYER_KEY_MAX_AGE = 60 * 60 * 24 * 30
+
+# Лимиты частоты запросов: область -> {ведро: (ёмкость, за сколько секунд восстанавливается)}.
+RATE_LIMITS = {
+    'buy': {
+        'session': (20, 60),
+        'ip': (60, 60),
+        'global': (100, 1),
+    },
+    'webhook': {
+        'ip': (100, 1),
+        'global': (200, 1),
+    },
+    # один оптовый запрос — до BULK_ORDER_MAX_ORDERS заказов
+    'bulk_order': {
+        'session': (10, 60),
+        'ip': (30, 60),
+    },
 }
+# Сколько одновременных вызовов Stripe допускается до сброса нагрузки (503)
+STRIPE_MAX_IN_FLIGHT = 50
+# Сколько Payment Intent один оптовый запрос создаёт параллельно
+STRIPE_BULK_CONCURRENCY = 8
+
+# Курсы валют для цен в валюте показа: базовая валюта курсов и источник для update_fx_rates
+# (JSON {"base": "usd", "rates": {"rub": "92.5", "eur": "0.92"}} в файле или по адресу локального фида)
+FX_BASE_CURRENCY = "usd"
+FX_RATES_FILE = os.getenv("FX_RATES_FILE", "")
+FX_RATES_URL = os.getenv("FX_RATES_URL", "")
+
+# Фоновые задачи после ответа (goods.tasks): потоков и очередь на воркер, 0 потоков — выполнять сразу.
+# При остановке воркер ждёт очередь не дольше BACKGROUND_TASK_DRAIN_TIMEOUT секунд
+BACKGROUND_TASK_WORKERS = int(os.getenv("BACKGROUND_TASK_WORKERS", 4))
+BACKGROUND_TASK_QUEUE_SIZE = 1000
+BACKGROUND_TASK_DRAIN_TIMEOUT = 10
+# Сколько раз повторять надёжную задачу, прежде чем оставить её для разбора
+BACKGROUND_TASK_MAX_ATTEMPTS = 5
+
+# Память воркеров (goods.memory): RSS замеряется раз в MEMORY_SAMPLE_INTERVAL секунд и пишется в лог.
+# Воркер с RSS больше MEMORY_RECYCLE_RSS_MB мягко перезапускается (0 — не перезапускать)
+MEMORY_SAMPLE_INTERVAL = 60
+MEMORY_SAMPLES_KEPT = 60
+MEMORY_RECYCLE_RSS_MB = int(os.getenv("MEMORY_RECYCLE_RSS_MB", 0))
+# Глубина стека мест выделения для /internal/memory/?group=traceback
+MEMORY_TRACEMALLOC_FRAMES = 10
+
+# Кэш каталога (товары, скидки, сборы) в памяти воркера; инвалидация через NOTIFY,
+# а раз в LOCAL_CACHE_VERSION_CHECK секунд версии сверяются с БД на случай потерянных сообщений
+LOCAL_CACHE_VERSION_CHECK = 5
+LOCAL_CACHE_MAX_ENTRIES = 10000
+# Время жизни отрисованной страницы категории; изменения каталога меняют ключ, а не ждут истечения
+CATEGORY_PAGE_CACHE_TIMEOUT = 60 * 10
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -129,7 +214,32 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = '/static/'
-STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_DIRS = [BASE_DIR / 'static']
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Адрес сайта для абсолютных ссылок в фиде товаров и sitemap (build_feeds)
+SITE_URL = os.getenv("SITE_URL", "http://localhost")
+# Фид делится на части по диапазонам id товаров; sitemap допускает до 50 000 ссылок в файле
+FEED_SHARD_SIZE = 10000
+
+# Микрокэш страниц товаров в nginx: сколько секунд nginx отдаёт страницу без Django.
+# Изменённые товары обновляются раньше через служебный server nginx (EDGE_CACHE_PURGE_URL, пусто — не обновлять)
+EDGE_CACHE_TTL = int(os.getenv("EDGE_CACHE_TTL", 60))
+EDGE_CACHE_PURGE_URL = os.getenv("EDGE_CACHE_PURGE_URL", "")
+EDGE_CACHE_PURGE_WORKERS = 8
+
+# collectstatic пишет файлы с хэшем в имени, минифицирует их и сохраняет .gz/.br версии
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'goods.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -139,6 +249,46 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Адрес API Stripe; для тестов можно направить SDK на локальный фейковый API (например, stripe-mock)
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+
+# Логи пишутся JSON строками в stderr из отдельного потока, запрос только кладёт запись в очередь.
+# LOG_SAMPLING — доля DEBUG записей, которая пишется для шумных логгеров.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLING = {
+    'goods.ratelimit': 0.01,
+    'goods.services.db_service': 0.1,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'goods.log.RequestIdFilter'},
+        'sampling': {'()': 'goods.log.SamplingFilter', 'rates': LOG_SAMPLING},
+    },
+    'handlers': {
+        'queue': {
+            'class': 'goods.log.NonBlockingHandler',
+            'maxsize': 10000,
+            'filters': ['request_id', 'sampling'],
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['queue'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'goods': {
+            'level': LOG_LEVEL,
+        },
+    },
+}
 
 INTERNAL_IPS = [
     "172.18.0.1",
@@ -15,6 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
@@ -26,4 +27,5 @@ urlpatterns = [
 if settings.DEBUG:
     urlpatterns += [
         path('silk/', include('silk.urls', namespace='silk'))
-    ]
\ No newline at end of file
+    ]
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
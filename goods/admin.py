@@ -1,14 +1,29 @@
 from django.contrib import admin
 
-from .models import Item, Order, Discount, Tax
+from django.db.models import Sum
+
+from .models import (Item, Order, Discount, Tax, ArchivedOrder, SalesRollup, Category, PromoCode, OrderStatusEvent,
+                     ExchangeRate)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "parent", "depth", "item_count", "total_item_count")
+    search_fields = ("name", "slug")
+    prepopulated_fields = {"slug": ("name",)}
+    readonly_fields = ("path", "depth", "item_count", "total_item_count")
+    ordering = ("path",)
 
 
 @admin.register(Item)
 class ItemAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "price")
+    list_display = ("id", "name", "price", "category")
     search_fields = ("name", "description")
-    list_filter = ("price",)
+    list_filter = ("price", "category")
+    list_select_related = ("category",)
     ordering = ("id",)
+    readonly_fields = ("image_hash",)
+    exclude = ("image_variants",)
 
 
 @admin.register(Discount)
@@ -27,6 +42,28 @@ class TaxAdmin(admin.ModelAdmin):
     ordering = ("id",)
 
 
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ("currency", "rate", "updated_at")
+    ordering = ("currency",)
+
+
+@admin.register(PromoCode)
+class PromoCodeAdmin(admin.ModelAdmin):
+    list_display = ("id", "code", "discount", "max_uses", "used", "expires_at", "is_active")
+    search_fields = ("code",)
+    list_filter = ("is_active", "discount")
+    list_select_related = ("discount",)
+    ordering = ("id",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(used_total=Sum("counters__used"))
+
+    @admin.display(description="Использовано", ordering="used_total")
+    def used(self, obj):
+        return obj.used_total or 0
+
+
 class ItemInline(admin.TabularInline):
     model = Order.items.through
     extra = 1
@@ -34,7 +71,7 @@ class ItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "created_at", "discount", "tax", 'status', 'session_key')
+    list_display = ("id", "created_at", "discount", "tax", 'status', 'session_key', 'payment_intent_id')
     list_filter = ("created_at", "discount", "tax")
     search_fields = ("id",)
     ordering = ("id",)
@@ -42,3 +79,52 @@ class OrderAdmin(admin.ModelAdmin):
 
     inlines = [ItemInline]
     exclude = ("items",)
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ("order_id", "created_at", "archived_at", "status", "currency", "session_key")
+    list_filter = ("status", "currency")
+    search_fields = ("order_id", "payment_intent_id")
+    ordering = ("order_id",)
+    date_hierarchy = "created_at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(OrderStatusEvent)
+class OrderStatusEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "order_id", "occurred_at", "from_status", "to_status", "source", "stripe_event_id")
+    list_filter = ("source", "to_status")
+    search_fields = ("order_id", "stripe_event_id")
+    # id растёт вместе с occurred_at: новые события по индексу первичного ключа, без сортировки всей таблицы
+    ordering = ("-id",)
+    date_hierarchy = "occurred_at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SalesRollup)
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ("day", "item_id", "currency", "status", "orders_count", "quantity", "gross", "discount", "tax")
+    list_filter = ("currency", "status")
+    search_fields = ("item_id",)
+    ordering = ("-day", "item_id")
+    date_hierarchy = "day"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
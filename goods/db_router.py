@@ -0,0 +1,119 @@
+import random
+import time
+from contextvars import ContextVar, Token
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+
+# Модели каталога, чтение которых можно отдавать репликам
+REPLICATED_MODELS = frozenset({"item", "discount", "tax"})
+
+
+@dataclass
+class PrimaryPin:
+    """Состояние закрепления за основной БД в рамках запроса."""
+    pinned: bool = False
+    wrote: bool = False
+
+
+_primary_pin: ContextVar[Optional[PrimaryPin]] = ContextVar("primary_pin", default=None)
+_replica_lag_cache: dict[str, tuple[float, float]] = {}
+
+
+def begin_primary_pin(pinned: bool) -> Token:
+    """Открывает новое состояние закрепления для запроса. Возвращает токен для end_primary_pin."""
+    return _primary_pin.set(PrimaryPin(pinned=pinned))
+
+
+def end_primary_pin(token: Token) -> None:
+    _primary_pin.reset(token)
+
+
+def mark_primary_write() -> None:
+    """Отмечает запись в основную БД: дальнейшее чтение в этом контексте идёт только с неё."""
+    state = _primary_pin.get()
+    if state is None:
+        _primary_pin.set(PrimaryPin(wrote=True))
+    else:
+        state.wrote = True
+
+
+def wrote_to_primary() -> bool:
+    state = _primary_pin.get()
+    return bool(state and state.wrote)
+
+
+def is_pinned_to_primary() -> bool:
+    state = _primary_pin.get()
+    return bool(state and (state.pinned or state.wrote))
+
+
+def _replica_lag(alias: str) -> float:
+    """
+    Отставание реплики в секундах; если весь полученный WAL уже применён, отставания нет.
+    Реплика без потоковой репликации (приёмник WAL не в статусе streaming) не получает новых изменений,
+    поэтому её отставание неизвестно и считается бесконечным.
+    """
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE "
+            "WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL "
+            "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        lag = cursor.fetchone()[0]
+    return float("inf") if lag is None else float(lag)
+
+
+def healthy_replicas() -> list[str]:
+    """Возвращает реплики, отставание которых не превышает REPLICA_MAX_LAG. Отставание кэшируется в процессе."""
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        cached = _replica_lag_cache.get(alias)
+        if cached is None or now - cached[0] > settings.REPLICA_LAG_CHECK_INTERVAL:
+            try:
+                lag = _replica_lag(alias)
+            except DatabaseError:
+                lag = float("inf")
+            cached = _replica_lag_cache[alias] = (now, lag)
+        if cached[1] <= settings.REPLICA_MAX_LAG:
+            healthy.append(alias)
+    return healthy
+
+
+class PrimaryReplicaRouter:
+    """
+    Роутер БД: чтение Item/Discount/Tax уходит на реплики, всё остальное и любые записи — на основную БД.
+    После записи контекст закрепляется за основной БД, чтобы клиент сразу видел свои изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != "goods" or model._meta.model_name not in REPLICATED_MODELS:
+            return None
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if is_pinned_to_primary():
+            return "default"
+        replicas = healthy_replicas()
+        return random.choice(replicas) if replicas else "default"
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != "goods":
+            return None
+        mark_primary_write()
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
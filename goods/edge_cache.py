@@ -0,0 +1,103 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+
+from goods import metrics
+from goods.middleware import PRIMARY_PIN_COOKIE
+from goods.models import RelatedItem
+from goods.services.fx_service import CURRENCIES
+
+logger = logging.getLogger(__name__)
+
+PURGE_TIMEOUT = 5
+# Валюта показа, разобранная nginx ($display_currency): она же входит в ключ кэша страницы
+DISPLAY_CURRENCY_HEADER = "X-Display-Currency"
+# Запрос служебного server nginx, который обновляет запись кэша (ставит только nginx)
+REFRESH_HEADER = "X-Edge-Refresh"
+# Варианты страницы в кэше nginx: ключ включает валюту показа ($display_currency в nginx.conf)
+PAGE_VARIANTS = ("", *CURRENCIES)
+
+
+def surrogate_key(item_id: int) -> str:
+    return f"item-{item_id}"
+
+
+def mark_cacheable(request, response: HttpResponse, item_ids: Iterable[int]) -> HttpResponse:
+    """
+    Разрешает nginx держать ответ EDGE_CACHE_TTL секунд и помечает его ключами item-<id> показанных товаров.
+    Кэшируются только запросы с X-Display-Currency: страница нарисована в валюте из ключа кэша nginx.
+    Ответы посетителям с сессией (админка) и ответы, которые ставят куки, остаются приватными.
+    """
+    if (DISPLAY_CURRENCY_HEADER not in request.headers or settings.SESSION_COOKIE_NAME in request.COOKIES
+            or response.cookies or response.status_code != 200):
+        patch_cache_control(response, private=True)
+        return response
+    patch_cache_control(response, public=True, max_age=0, s_maxage=settings.EDGE_CACHE_TTL)
+    response["X-Accel-Expires"] = settings.EDGE_CACHE_TTL
+    response["Surrogate-Key"] = " ".join(surrogate_key(item_id) for item_id in dict.fromkeys(item_ids))
+    return response
+
+
+def is_refresh(request) -> bool:
+    """
+    Запрос обновляет запись кэша nginx и ответ будет отдаваться весь EDGE_CACHE_TTL: данные читаются из БД
+    мимо кэша воркера, который мог ещё не получить NOTIFY об изменении.
+    """
+    return REFRESH_HEADER in request.headers
+
+
+def pages_showing(item_ids: Iterable[int]) -> list[int]:
+    """Товары, на страницах которых показаны item_ids: сами товары и те, у кого они в рекомендациях."""
+    item_ids = set(item_ids)
+    item_ids.update(RelatedItem.objects.filter(related_id__in=item_ids).values_list("item_id", flat=True))
+    return sorted(item_ids)
+
+
+def _refresh(path: str) -> bool:
+    site = urlsplit(settings.SITE_URL)
+    request = Request(settings.EDGE_CACHE_PURGE_URL.rstrip("/") + path,
+                      # кука закрепления читает страницу с основной БД, а не с отстающей реплики
+                      headers={"Host": site.hostname, "X-Forwarded-Proto": site.scheme,
+                               "Cookie": f"{PRIMARY_PIN_COOKIE}=1"})
+    try:
+        with urlopen(request, timeout=PURGE_TIMEOUT):
+            pass
+    except HTTPError as e:
+        # 404 удалённого товара тоже заменяет запись кэша
+        if e.code == 404:
+            return True
+        logger.warning("edge cache purge failed", extra={"path": path, "error": repr(e)})
+        return False
+    except OSError as e:
+        logger.warning("edge cache purge failed", extra={"path": path, "error": repr(e)})
+        return False
+    return True
+
+
+def refresh_pages(item_ids: Iterable[int]) -> int:
+    """
+    Обновляет в кэше nginx все варианты страниц товаров item_ids. Open source nginx не удаляет записи кэша
+    по запросу, поэтому страница запрашивается через служебный server с proxy_cache_bypass: свежий ответ Django
+    (или 404 удалённого товара) заменяет запись. Без EDGE_CACHE_PURGE_URL ничего не делает.
+    Возвращает число обновлённых вариантов.
+    """
+    if not settings.EDGE_CACHE_PURGE_URL:
+        return 0
+    paths = [reverse("goods:item_lookout", kwargs={"id": item_id}) + (f"?{urlencode({'currency': c})}" if c else "")
+             for item_id in item_ids for c in PAGE_VARIANTS]
+    with ThreadPoolExecutor(max_workers=settings.EDGE_CACHE_PURGE_WORKERS) as pool:
+        refreshed = sum(pool.map(_refresh, paths))
+    metrics.incr("edge_cache.refreshed", refreshed)
+    metrics.incr("edge_cache.refresh_failed", len(paths) - refreshed)
+    return refreshed
+
+
+metrics.register("edge_cache.refreshed", "edge_cache.refresh_failed")
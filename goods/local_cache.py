@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Hashable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from goods.models import CacheVersion
+from goods.services.notify_service import hub
+
+INVALIDATION_CHANNEL = "cache_invalidation"
+# Ключ, означающий «всё пространство»: для маленьких таблиц (скидки, сборы) сбрасываем всё сразу
+ALL = "*"
+
+_MISSING = object()
+
+
+class LocalCache:
+    """
+    Кэш горячих данных каталога в памяти воркера.
+    Изменение модели рассылает сообщение «пространство:ключ:версия» через NotificationHub (NOTIFY на PostgreSQL),
+    и каждый воркер вычищает у себя этот ключ. Если сообщение потерялось (разрыв соединения слушателя),
+    разрыв в номерах версий или периодическая сверка с таблицей cache_version сбрасывают всё пространство,
+    поэтому устаревание ограничено LOCAL_CACHE_VERSION_CHECK секундами.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[Hashable, Any]] = {}
+        # поколение пространства растёт при каждой инвалидации: значение, загруженное до неё, не сохраняется
+        self._generations: dict[str, int] = {}
+        self._versions: dict[str, int] = {}
+        self._versions_checked_at = 0.0
+        self._subscribed_pid: int | None = None
+
+    def _ensure_subscribed(self) -> None:
+        if self._subscribed_pid != os.getpid():
+            self._subscribed_pid = os.getpid()
+            hub.subscribe(INVALIDATION_CHANNEL, self.handle_message)
+
+    def _check_versions(self) -> None:
+        """Раз в LOCAL_CACHE_VERSION_CHECK секунд сверяет версии с БД и сбрасывает отставшие пространства."""
+        now = time.monotonic()
+        if now - self._versions_checked_at < settings.LOCAL_CACHE_VERSION_CHECK:
+            return
+        self._versions_checked_at = now
+        current = dict(CacheVersion.objects.values_list("namespace", "version"))
+        with self._lock:
+            for namespace in set(self._entries) | set(current):
+                if self._versions.get(namespace) != current.get(namespace, 0):
+                    self._flush(namespace)
+                    self._versions[namespace] = current.get(namespace, 0)
+
+    def version(self, namespace: str) -> int:
+        """Текущая версия пространства (не старше LOCAL_CACHE_VERSION_CHECK секунд) — для ключей общего кэша."""
+        self._ensure_subscribed()
+        self._check_versions()
+        with self._lock:
+            # пространства без строки в cache_version ещё не менялись: версия 0 известна, а не пропущена
+            return self._versions.setdefault(namespace, 0)
+
+    def get_or_load(self, namespace: str, key: Hashable, loader: Callable[[], Any], cache_none: bool = False) -> Any:
+        """Значение из памяти воркера, иначе из loader(). None сохраняется только с cache_none."""
+        self._ensure_subscribed()
+        self._check_versions()
+        with self._lock:
+            value = self._entries.get(namespace, {}).get(key, _MISSING)
+            generation = self._generations.get(namespace, 0)
+        if value is not _MISSING:
+            return value
+
+        value = loader()
+        if value is None and not cache_none:
+            return value
+        with self._lock:
+            entries = self._entries.setdefault(namespace, {})
+            if self._generations.get(namespace, 0) == generation:
+                if len(entries) >= settings.LOCAL_CACHE_MAX_ENTRIES:
+                    entries.clear()
+                entries[key] = value
+        return value
+
+    def _flush(self, namespace: str) -> None:
+        self._entries.pop(namespace, None)
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def evict(self, namespace: str, key: Hashable) -> None:
+        """Удаляет ключ (или всё пространство для ALL) в текущем процессе."""
+        with self._lock:
+            if key == ALL:
+                self._flush(namespace)
+            else:
+                self._entries.get(namespace, {}).pop(key, None)
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def handle_message(self, payload: str) -> None:
+        """Обрабатывает сообщение об инвалидации «пространство:ключ:версия» от другого процесса или ноды."""
+        namespace, key, version = payload.rsplit(":", 2)
+        version = int(version)
+        with self._lock:
+            known = self._versions.get(namespace)
+            if known is not None and version > known + 1:
+                # пропустили сообщения между known и version — не знаем, какие ключи устарели
+                self._flush(namespace)
+            elif key == ALL:
+                self._flush(namespace)
+            else:
+                self._entries.get(namespace, {}).pop(_parse_key(key), None)
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            if known is not None and version > known:
+                self._versions[namespace] = version
+
+    def clear(self) -> None:
+        with self._lock:
+            for namespace in list(self._entries):
+                self._flush(namespace)
+            self._versions.clear()
+            self._versions_checked_at = 0.0
+
+
+def _parse_key(key: str) -> Hashable:
+    return int(key) if key.isdigit() else key
+
+
+def _bump_version(namespace: str) -> int:
+    """Увеличивает версию пространства в отдельной короткой транзакции."""
+    with transaction.atomic():
+        CacheVersion.objects.get_or_create(namespace=namespace)
+        CacheVersion.objects.filter(namespace=namespace).update(version=F("version") + 1)
+        return CacheVersion.objects.filter(namespace=namespace).values_list("version", flat=True).get()
+
+
+def _publish(namespace: str, key: Hashable) -> None:
+    message = f"{namespace}:{key}:{_bump_version(namespace)}"
+    # ещё раз вычищаем ключ у себя: до коммита другой поток воркера мог загрузить старое значение
+    local_cache.handle_message(message)
+    hub.publish(INVALIDATION_CHANNEL, message)
+
+
+def invalidate(namespace: str, key: Hashable = ALL) -> None:
+    """
+    Сообщает об изменении данных: сразу вычищает ключ в текущем процессе,
+    а после коммита увеличивает версию пространства и рассылает сообщение остальным воркерам и нодам.
+    Строка версии не блокируется в транзакции вызывающего, поэтому записи каталога не выстраиваются за ней.
+    Вызывается из сигналов моделей и после queryset.update(), который сигналов не шлёт.
+    """
+    local_cache.evict(namespace, key)
+    transaction.on_commit(partial(_publish, namespace, key))
+
+
+local_cache = LocalCache()
@@ -0,0 +1,157 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Принимаем id от nginx ($request_id) или клиента, только если он похож на id, а не на произвольную строку
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9_.-]{8,64}$")
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Атрибуты LogRecord, которые не являются полями extra
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+def begin_request_id(request_id: Optional[str]) -> Token:
+    return _request_id.set(request_id)
+
+
+def end_request_id(token: Token) -> None:
+    _request_id.reset(token)
+
+
+def get_request_id() -> Optional[str]:
+    """id текущего запроса (или задачи), к которому относятся записи лога."""
+    return _request_id.get()
+
+
+def valid_request_id(value: Optional[str]) -> Optional[str]:
+    return value if value and REQUEST_ID_RE.match(value) else None
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Добавляет в запись id текущего запроса; срабатывает в потоке запроса, до постановки записи в очередь.
+    Записи django.request о 4xx/5xx пишутся уже после выхода из RequestIdMiddleware, их id берётся из record.request.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = get_request_id() or getattr(getattr(record, "request", None), "request_id", None)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю DEBUG записей логгера: rates = {"goods.ratelimit": 0.01}.
+    Доля берётся по самому длинному совпавшему префиксу имени логгера, записи INFO и выше проходят всегда.
+    """
+
+    def __init__(self, rates: Optional[dict[str, float]] = None):
+        super().__init__()
+        self.rates = sorted((rates or {}).items(), key=lambda rate: -len(rate[0]))
+
+    def _rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной JSON строкой: время, уровень, логгер, сообщение, request_id и поля из extra"""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        data.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class NonBlockingHandler(QueueHandler):
+    """
+    Обработчик, который только кладёт запись в ограниченную очередь; форматирование и запись в stderr
+    выполняет отдельный поток QueueListener. При переполнении очереди запись отбрасывается, запрос не ждёт.
+    Поток запускается при первой записи в каждом процессе, поэтому переживает fork воркеров gunicorn.
+    """
+
+    def __init__(self, maxsize: int = 10000, stream=None):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.target.setFormatter(JsonFormatter())
+        self.dropped = 0
+        self._listener: Optional[QueueListener] = None
+        self._pid: Optional[int] = None
+
+    def _ensure_listener(self) -> None:
+        if self._pid == os.getpid():
+            return
+        # self.lock logging пересоздаёт после fork, поэтому он не останется захваченным потоком родителя
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+            # после fork поток родителя не существует: очередь и поток создаются заново
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.stop)
+
+    def prepare(self, record):
+        # сообщение и исключение формируются здесь, чтобы в очередь не попадали ссылки на объекты запроса
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for key, value in list(vars(record).items()):
+            if key not in _RECORD_ATTRS and not isinstance(value, (str, int, float, bool, list, dict, type(None))):
+                setattr(record, key, str(value))
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def stop(self) -> None:
+        """Останавливает поток записи, дописав очередь."""
+        if self._listener is not None and self._listener._thread is not None:
+            self._listener.stop()
+
+    def flush(self):
+        """Дожидается записи всего, что уже в очереди (для тестов и завершения процесса)."""
+        if self._pid == os.getpid() and self._listener is not None and self._listener._thread is not None:
+            self.queue.join()
+            self.target.flush()
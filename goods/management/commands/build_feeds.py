@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from goods.services.feed_service import build_feeds, feeds_root
+
+
+class Command(BaseCommand):
+    help = ("Собирает фид товаров и sitemap в MEDIA_ROOT/feeds сжатыми частями по диапазонам id товаров. "
+            "Пересобираются только части, товары которых изменились с прошлой сборки")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true",
+                            help="Пересобрать все части (например, после смены SITE_URL или формата)")
+
+    def handle(self, *args, **options):
+        progress = lambda done, total: self.stdout.write(f"Собрано частей: {done} из {total}")
+        built = build_feeds(full=options["full"], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Готово: пересобрано частей {built}, фиды в {feeds_root()}"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from goods.services.recommendation_service import RELATED_ITEMS_LIMIT, rebuild_recommendations, update_recommendations
+
+
+class Command(BaseCommand):
+    help = ("Обновляет рекомендации «часто покупают вместе» по заказам, оплаченным после прошлого запуска. "
+            "С --full пересчитывает их по всем оплаченным заказам; не запускайте параллельно с другим запуском")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Полный пересчёт счётчиков")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Сколько заказов читать за один запрос")
+        parser.add_argument("--items-per-pass", type=int, default=10000,
+                            help="Диапазон id товаров за один проход полного пересчёта (ограничивает память)")
+        parser.add_argument("--limit", type=int, default=RELATED_ITEMS_LIMIT,
+                            help="Сколько рекомендаций хранить для товара")
+
+    def handle(self, *args, **options):
+        if options["items_per_pass"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--batch-size и --items-per-pass должны быть больше нуля")
+        progress = lambda done: self.stdout.write(f"Обработано заказов: {done}")
+        if options["full"]:
+            processed = rebuild_recommendations(batch_size=options["batch_size"],
+                                                items_per_pass=options["items_per_pass"],
+                                                limit=options["limit"], progress=progress)
+        else:
+            processed = update_recommendations(batch_size=options["batch_size"], limit=options["limit"],
+                                               progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Готово: обработано заказов {processed}"))
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from goods.services.order_expiry_service import expire_stale_orders, archive_orders
+
+
+class Command(BaseCommand):
+    help = "Переводит брошенные заказы в статус Expired и переносит старые заказы в архив"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--expire-after-hours", type=int, default=24,
+                            help="Через сколько часов заказ в статусе Created считается брошенным")
+        parser.add_argument("--archive-after-days", type=int, default=30,
+                            help="Через сколько дней выполненные и истёкшие заказы переносятся в архив")
+        parser.add_argument("--batch-size", type=int, default=500, help="Размер пачки заказов")
+        parser.add_argument("--workers", type=int, default=8,
+                            help="Количество параллельных запросов на отмену Payment Intent")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        batch_size = options["batch_size"]
+
+        expired = expire_stale_orders(
+            created_before=now - timedelta(hours=options["expire_after_hours"]),
+            batch_size=batch_size,
+            workers=options["workers"],
+            progress=lambda done: self.stdout.write(f"Истекло заказов: {done}"),
+        )
+        archived = archive_orders(
+            created_before=now - timedelta(days=options["archive_after_days"]),
+            batch_size=batch_size,
+            progress=lambda done: self.stdout.write(f"Перенесено в архив: {done}"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Готово: истекло {expired}, перенесено в архив {archived}"))
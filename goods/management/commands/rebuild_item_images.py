@@ -0,0 +1,48 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from goods.local_cache import invalidate
+from goods.models import Item
+from goods.services.image_service import build_variants
+
+
+class Command(BaseCommand):
+    help = "Пересобирает варианты изображений всего каталога параллельно, пропуская неизменённые по хэшу"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Количество процессов (по умолчанию — по числу CPU)")
+        parser.add_argument("--batch-size", type=int, default=200, help="Сколько товаров обрабатывать за раз")
+        parser.add_argument("--force", action="store_true", help="Обработать все изображения, даже неизменённые")
+
+    def handle(self, *args, **options):
+        items = (
+            Item.objects.exclude(image="")
+            .order_by("id")
+            .values_list("id", "image", "image_hash")
+        )
+        batch_size = options["batch_size"]
+        processed = skipped = 0
+        last_id = 0
+        # spawn, а не fork: дочерние процессы не наследуют соединения с БД, Django настраивается в initializer
+        with ProcessPoolExecutor(max_workers=options["workers"], mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=django.setup) as pool:
+            while True:
+                batch = list(items.filter(id__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                known_hashes = ["" if options["force"] else image_hash for _, _, image_hash in batch]
+                results = pool.map(build_variants, [image for _, image, _ in batch], known_hashes)
+                for (item_id, _, _), result in zip(batch, results):
+                    if result is None:
+                        skipped += 1
+                        continue
+                    content_hash, variants = result
+                    Item.objects.filter(pk=item_id).update(image_hash=content_hash, image_variants=variants)
+                    invalidate("item", item_id)
+                    processed += 1
+                self.stdout.write(f"Обработано: {processed}, без изменений: {skipped}")
+        self.stdout.write(self.style.SUCCESS(f"Готово: обработано {processed}, без изменений {skipped}"))
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from goods.models import ArchivedOrder, Order
+from goods.services.sales_service import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает агрегаты продаж из заказов параллельными отрезками по дням. "
+            "Дни, заказы которых уже перенесены в архив, по умолчанию не пересчитываются")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=date.fromisoformat, help="Первый день пересчёта (YYYY-MM-DD)")
+        parser.add_argument("--until", type=date.fromisoformat, help="Последний день пересчёта (YYYY-MM-DD)")
+        parser.add_argument("--chunk-days", type=int, default=7, help="Сколько дней пересчитывать в одной транзакции")
+        parser.add_argument("--workers", type=int, default=4, help="Количество параллельно пересчитываемых отрезков")
+
+    def _default_since(self) -> date | None:
+        """Первый день, все заказы которого ещё в основной таблице: архив хранит заказы без цен."""
+        first_order = Order.objects.aggregate(first=Min("created_at"))["first"]
+        if first_order is None:
+            return None
+        since = timezone.localdate(first_order)
+        last_archived = ArchivedOrder.objects.aggregate(last=Max("created_at"))["last"]
+        if last_archived is not None:
+            since = max(since, timezone.localdate(last_archived) + timedelta(days=1))
+        return since
+
+    def handle(self, *args, **options):
+        if options["chunk_days"] < 1:
+            raise CommandError("--chunk-days должен быть больше нуля")
+        since = options["since"] or self._default_since()
+        until = options["until"] or timezone.localdate()
+        if since is None or since > until:
+            self.stdout.write("Нет дней для пересчёта")
+            return
+
+        rows = rebuild_sales_rollups(
+            since, until,
+            chunk_days=options["chunk_days"],
+            workers=options["workers"],
+            progress=lambda done: self.stdout.write(f"Строк агрегата: {done}"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Готово: пересчитано {since} — {until}, строк агрегата {rows}"))
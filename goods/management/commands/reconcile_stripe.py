@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from goods.services.reconcile_service import last_reconciled_until, reconcile_stripe
+
+
+def _aware_datetime(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+class Command(BaseCommand):
+    help = ("Сверяет Payment Intent из Stripe с заказами: отмечает оплаченными заказы с пропущенным вебхуком, "
+            "находит intent-сироты и повторные оплаты. Продолжает с последней контрольной точки")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=_aware_datetime,
+                            help="Начало периода (ISO); по умолчанию — конец прошлой сверки или --days назад")
+        parser.add_argument("--until", type=_aware_datetime,
+                            help="Конец периода (ISO); по умолчанию — --settle-minutes назад")
+        parser.add_argument("--days", type=int, default=30, help="Глубина первой сверки в днях")
+        parser.add_argument("--settle-minutes", type=int, default=60,
+                            help="Свежие intent не сверяются: оплата по ним может быть ещё в процессе")
+        parser.add_argument("--window-hours", type=int, default=24, help="Размер окна между контрольными точками")
+        parser.add_argument("--cancel-orphans", action="store_true",
+                            help="Отменять неоплаченные intent без заказа или вытесненные более новым intent")
+
+    def handle(self, *args, **options):
+        if options["window_hours"] < 1:
+            raise CommandError("--window-hours должен быть больше нуля")
+        now = timezone.now()
+        since = options["since"] or last_reconciled_until() or now - timedelta(days=options["days"])
+        until = options["until"] or now - timedelta(minutes=options["settle_minutes"])
+        if since >= until:
+            self.stdout.write("Нет новых Payment Intent для сверки")
+            return
+
+        stats = reconcile_stripe(
+            since, until,
+            window=timedelta(hours=options["window_hours"]),
+            cancel_orphans=options["cancel_orphans"],
+            progress=lambda window_end, total: self.stdout.write(
+                f"Сверено до {window_end.isoformat()}: intent {total.intents}, оплачено {total.paid}"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: intent {stats.intents}, отмечено оплаченными {stats.paid}, сирот {stats.orphans}, "
+            f"отменено {stats.cancelled}, повторных оплат {stats.duplicates}"))
+        if stats.duplicates:
+            self.stdout.write(self.style.WARNING("Есть заказы, оплаченные несколькими intent: проверьте их в Stripe"))
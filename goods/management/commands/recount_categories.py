@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from goods.services.category_service import recount_categories
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики товаров категорий с нуля (после массовых изменений товаров в обход сигналов)"
+
+    def handle(self, *args, **options):
+        categories = recount_categories()
+        self.stdout.write(self.style.SUCCESS(f"Готово: пересчитано категорий {categories}"))
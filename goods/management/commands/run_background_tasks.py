@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from goods.tasks import due_tasks, run_stored_task
+
+
+class Command(BaseCommand):
+    help = "Выполняет надёжные фоновые задачи, не выполненные воркером (перезапуск, ошибка)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=1000, help="Сколько задач выполнить за запуск")
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        for task_id in due_tasks(options["limit"]):
+            if run_stored_task(task_id):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f"Готово: выполнено задач {done}, не выполнено {failed}"))
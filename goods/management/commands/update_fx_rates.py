@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from goods.services.fx_service import FxError, fetch_rates, read_rates_file, refresh_item_prices, update_rates
+
+
+class Command(BaseCommand):
+    help = "Загружает курсы валют и пересчитывает цены товаров в валютах показа, если курсы изменились"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", default=settings.FX_RATES_FILE, help="JSON файл курсов (FX_RATES_FILE)")
+        parser.add_argument("--url", default=settings.FX_RATES_URL, help="Адрес локального фида курсов (FX_RATES_URL)")
+        parser.add_argument("--refresh", action="store_true",
+                            help="Пересчитать цены всех товаров, даже если курсы не изменились")
+
+    def handle(self, *args, **options):
+        try:
+            if options["file"]:
+                rates = read_rates_file(Path(options["file"]))
+            elif options["url"]:
+                rates = fetch_rates(options["url"])
+            else:
+                raise CommandError("Укажите --file или --url (FX_RATES_FILE, FX_RATES_URL)")
+        except (FxError, OSError, ValueError) as e:
+            raise CommandError(f"Курсы не загружены: {e}")
+
+        changed = update_rates(rates)
+        self.stdout.write(f"Изменились курсы: {', '.join(changed) or 'нет'}")
+        if changed or options["refresh"]:
+            written = refresh_item_prices()
+            self.stdout.write(self.style.SUCCESS(f"Готово: пересчитано цен {written}"))
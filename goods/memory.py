@@ -0,0 +1,164 @@
+import gc
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Callable
+
+from django.conf import settings
+
+from goods import metrics
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+# Служебные выделения, которые не относятся к приложению
+TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса из /proc/self/statm; вне Linux — пиковый RSS из getrusage."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemorySampler:
+    """
+    Раз в MEMORY_SAMPLE_INTERVAL секунд замеряет RSS воркера, пишет его в лог и хранит последние
+    MEMORY_SAMPLES_KEPT замеров. Если RSS превысил MEMORY_RECYCLE_RSS_MB, один раз вызывает on_threshold
+    (в gunicorn — мягкая остановка воркера, мастер запускает новый).
+    Поток создаётся в каждом процессе при start(), как пул goods.tasks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._samples: deque[tuple[float, int]] = deque()
+        self._on_threshold: Callable[[], None] | None = None
+        self._recycling = False
+
+    def start(self, on_threshold: Callable[[], None] | None = None) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._samples = deque(maxlen=settings.MEMORY_SAMPLES_KEPT)
+            self._on_threshold = on_threshold
+            self._recycling = False
+        threading.Thread(target=self._run, name="memory-sampler", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            self.sample()
+            time.sleep(settings.MEMORY_SAMPLE_INTERVAL)
+
+    def samples(self) -> list[tuple[float, int]]:
+        """Замеры текущего процесса: (время, RSS в байтах), от старых к новым."""
+        return list(self._samples) if self._pid == os.getpid() else []
+
+    def sample(self) -> int:
+        """Замеряет RSS и проверяет порог перезапуска. Возвращает RSS в байтах."""
+        rss = rss_bytes()
+        self._samples.append((time.time(), rss))
+        logger.info("worker memory", extra={"pid": os.getpid(), "rss_bytes": rss,
+                                             "growth_bytes": rss - self._samples[0][1]})
+        limit = settings.MEMORY_RECYCLE_RSS_MB * 1024 * 1024
+        if limit and rss > limit and self._on_threshold and not self._recycling:
+            self._recycling = True
+            metrics.incr("memory.recycles")
+            logger.warning("worker memory over threshold, recycling", extra={"pid": os.getpid(), "rss_bytes": rss,
+                                                                            "limit_bytes": limit})
+            self._on_threshold()
+        return rss
+
+
+sampler = MemorySampler()
+
+_baseline: tracemalloc.Snapshot | None = None
+_type_counts: Counter | None = None
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    # мусор с циклами не должен выглядеть как утечка
+    gc.collect()
+    return tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+
+
+def start_tracing() -> None:
+    """Включает tracemalloc в текущем процессе; следующий allocation_diff покажет рост от этого момента."""
+    global _baseline
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(settings.MEMORY_TRACEMALLOC_FRAMES)
+    _baseline = _snapshot()
+
+
+def stop_tracing() -> None:
+    """Выключает tracemalloc и освобождает его память."""
+    global _baseline
+    _baseline = None
+    tracemalloc.stop()
+
+
+def allocation_diff(limit: int, group: str = "lineno") -> list[dict] | None:
+    """
+    Места выделения памяти с наибольшим ростом с прошлого вызова (или с start_tracing), group — lineno,
+    filename или traceback. Текущий снимок становится базой для следующего вызова.
+    None — tracemalloc выключен.
+    """
+    global _baseline
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = _snapshot()
+    baseline, _baseline = _baseline or snapshot, snapshot
+    return [
+        {"site": [str(frame) for frame in stat.traceback] if group == "traceback" else str(stat.traceback[0]),
+         "size_diff": stat.size_diff, "size": stat.size, "count_diff": stat.count_diff, "count": stat.count}
+        for stat in snapshot.compare_to(baseline, group)[:limit]
+    ]
+
+
+def type_growth(limit: int) -> list[dict]:
+    """
+    Типы объектов под управлением gc, число которых выросло сильнее всего с прошлого вызова
+    (объекты Stripe, модели, шаблоны и т.п.). Работает без tracemalloc, но обходит все объекты процесса.
+    """
+    global _type_counts
+    gc.collect()
+    counts = Counter(f"{type(obj).__module__}.{type(obj).__qualname__}" for obj in gc.get_objects())
+    previous, _type_counts = _type_counts or counts, counts
+    growth = Counter({name: count - previous.get(name, 0) for name, count in counts.items()})
+    return [{"type": name, "count": counts[name], "count_diff": diff}
+            for name, diff in growth.most_common(limit) if diff > 0]
+
+
+def report(limit: int, group: str = "lineno", types: bool = False) -> dict:
+    """Память текущего воркера для /internal/memory/."""
+    samples = sampler.samples()
+    result = {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "recycle_rss_bytes": settings.MEMORY_RECYCLE_RSS_MB * 1024 * 1024 or None,
+        "samples": [{"at": at, "rss_bytes": rss} for at, rss in samples],
+        "tracing": tracemalloc.is_tracing(),
+        "allocations": allocation_diff(limit, group),
+    }
+    if types:
+        result["types"] = type_growth(limit)
+    return result
+
+
+metrics.register("memory.recycles")
+metrics.register_gauge("memory.rss_bytes", rss_bytes)
@@ -0,0 +1,41 @@
+from typing import Callable
+
+from django.core.cache import cache
+
+METRICS_KEY_PREFIX = "metrics"
+# Счётчики живут в общем кэше, чтобы их видели все воркеры; таймаут большой, сбросом занимается кэш
+METRICS_TIMEOUT = 60 * 60 * 24 * 7
+
+_registry: set[str] = set()
+# Показатели текущего процесса (глубина очереди и т.п.), считываются в момент запроса метрик
+_gauges: dict[str, Callable[[], int]] = {}
+
+
+def register(*names: str) -> None:
+    """Регистрирует имена счётчиков, которые отдаёт эндпоинт метрик."""
+    _registry.update(names)
+
+
+def register_gauge(name: str, read: Callable[[], int]) -> None:
+    """Регистрирует показатель процесса: значение берётся из read() воркера, отвечающего на запрос метрик."""
+    _gauges[name] = read
+
+
+def incr(name: str, value: int = 1) -> None:
+    """Атомарно увеличивает счётчик (атомарность обеспечивает бэкенд кэша)."""
+    key = f"{METRICS_KEY_PREFIX}:{name}"
+    cache.add(key, 0, timeout=METRICS_TIMEOUT)
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        # ключ истёк между add и incr
+        cache.set(key, value, timeout=METRICS_TIMEOUT)
+
+
+def snapshot() -> dict[str, int]:
+    """Текущие значения всех зарегистрированных счётчиков и показателей процесса."""
+    names = sorted(_registry)
+    values = cache.get_many([f"{METRICS_KEY_PREFIX}:{name}" for name in names])
+    result = {name: values.get(f"{METRICS_KEY_PREFIX}:{name}", 0) for name in names}
+    result.update((name, read()) for name, read in sorted(_gauges.items()))
+    return result
@@ -0,0 +1,70 @@
+from uuid import uuid4
+
+from django.conf import settings
+
+from goods.db_router import begin_primary_pin, end_primary_pin, wrote_to_primary
+from goods.log import REQUEST_ID_HEADER, begin_request_id, end_request_id, valid_request_id
+
+PRIMARY_PIN_COOKIE = "pin_primary"
+BUYER_KEY_COOKIE = "buyer_key"
+BUYER_KEY_SALT = "goods.buyer_key"
+
+
+class RequestIdMiddleware:
+    """
+    Присваивает запросу id для сквозной трассировки: берёт X-Request-ID от nginx или генерирует новый.
+    id попадает во все записи лога запроса, в metadata Stripe и в заголовок ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.request_id = valid_request_id(request.headers.get(REQUEST_ID_HEADER)) or uuid4().hex
+        token = begin_request_id(request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request_id(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+
+class PrimaryPinningMiddleware:
+    """
+    Закрепляет клиента за основной БД на PRIMARY_PIN_SECONDS после того, как его запрос что-то записал.
+    Пока кука жива, чтение каталога не уходит на реплики, которые могут ещё не догнать запись.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = begin_primary_pin(pinned=PRIMARY_PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+            if wrote_to_primary():
+                response.set_cookie(PRIMARY_PIN_COOKIE, "1", max_age=settings.PRIMARY_PIN_SECONDS,
+                                    httponly=True, samesite="Lax")
+        finally:
+            end_primary_pin(token)
+        return response
+
+
+class BuyerKeyMiddleware:
+    """
+    Стабильный ключ анонимного покупателя в подписанной куке вместо строки в django_session.
+    Новый ключ выдаётся только тем запросам, которые его запросили (см. DataMixin.get_session).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.buyer_key = request.get_signed_cookie(BUYER_KEY_COOKIE, default=None, salt=BUYER_KEY_SALT)
+        request.new_buyer_key = None
+        response = self.get_response(request)
+        if request.new_buyer_key:
+            response.set_signed_cookie(BUYER_KEY_COOKIE, request.new_buyer_key, salt=BUYER_KEY_SALT,
+                                       max_age=settings.BUYER_KEY_MAX_AGE, httponly=True, samesite="Lax")
+        return response
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:42
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField(unique=True, verbose_name='ID заказа')),
+                ('created_at', models.DateTimeField(verbose_name='Время создания')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Время архивации')),
+                ('status', models.CharField(choices=[('Created', 'Создан'), ('InProgress', 'В процессе'), ('Done', 'Выполнен'), ('Expired', 'Истёк')], max_length=15, verbose_name='Статус')),
+                ('currency', models.CharField(blank=True, max_length=3, verbose_name='Валюта')),
+                ('session_key', models.CharField(max_length=255, verbose_name='Ключ Сессии')),
+                ('discount_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID скидки')),
+                ('tax_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID доп. сбора')),
+                ('item_ids', models.JSONField(default=list, verbose_name='ID товаров')),
+                ('payment_intent_id', models.CharField(blank=True, max_length=255, verbose_name='Stripe Payment Intent ID')),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архивные заказы',
+                'db_table': 'order_archive',
+                'ordering': ('order_id',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Discount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название')),
+                ('percentage', models.PositiveIntegerField(validators=[django.core.validators.MaxValueValidator(100)], verbose_name='Процент')),
+                ('stripe_id', models.CharField(blank=True, max_length=255, verbose_name='Stripe ID')),
+            ],
+            options={
+                'verbose_name': 'Скидка',
+                'verbose_name_plural': 'Скидки',
+                'db_table': 'discount',
+            },
+        ),
+        migrations.CreateModel(
+            name='Item',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название')),
+                ('description', models.TextField(max_length=800, verbose_name='Описание')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Цена')),
+                ('currency', models.CharField(choices=[('usd', 'Доллар'), ('rub', 'Рубль')], default='usd', max_length=3, verbose_name='Валюта')),
+            ],
+            options={
+                'verbose_name': 'Товар',
+                'verbose_name_plural': 'Товары',
+                'db_table': 'item',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Tax',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название')),
+                ('percentage', models.PositiveIntegerField(validators=[django.core.validators.MaxValueValidator(100)], verbose_name='Процент')),
+                ('stripe_id', models.CharField(blank=True, max_length=255, verbose_name='Stripe ID')),
+            ],
+            options={
+                'verbose_name': 'Дополнительный сбор',
+                'verbose_name_plural': 'Дополнительные сборы',
+                'db_table': 'tax',
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('currency', models.CharField(blank=True, choices=[('usd', 'Доллар'), ('rub', 'Рубль')], default='usd', max_length=3, verbose_name='Валюта')),
+                ('status', models.CharField(choices=[('Created', 'Создан'), ('InProgress', 'В процессе'), ('Done', 'Выполнен'), ('Expired', 'Истёк')], default='Created', max_length=15, verbose_name='Статус')),
+                ('session_key', models.CharField(max_length=255, verbose_name='Ключ Сессии')),
+                ('payment_intent_id', models.CharField(blank=True, max_length=255, verbose_name='Stripe Payment Intent ID')),
+                ('discount', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='goods.discount', verbose_name='Скидка')),
+                ('items', models.ManyToManyField(to='goods.item', verbose_name='Товары')),
+                ('tax', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='goods.tax', verbose_name='Доп. сбор')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Заказы',
+                'db_table': 'order',
+                'ordering': ('id',),
+                'indexes': [models.Index(fields=['status', 'created_at'], name='order_status_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Превращает автоматическую таблицу order_items в явную модель OrderItem без пересоздания таблицы
+    и добавляет в неё количество.
+    """
+
+    dependencies = [
+        ('goods', '0002_item_image'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='OrderItem',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='goods.item', verbose_name='Товар')),
+                        ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='goods.order', verbose_name='Заказ')),
+                    ],
+                    options={
+                        'verbose_name': 'Позиция заказа',
+                        'verbose_name_plural': 'Позиции заказа',
+                        'db_table': 'order_items',
+                        'unique_together': {('order', 'item')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='items',
+                    field=models.ManyToManyField(through='goods.OrderItem', to='goods.item', verbose_name='Товары'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Количество'),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='item_quantities',
+            field=models.JSONField(default=dict, verbose_name='Количество по товарам'),
+        ),
+    ]
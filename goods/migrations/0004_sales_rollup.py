@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0003_orderitem_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('item_id', models.BigIntegerField(verbose_name='ID товара')),
+                ('currency', models.CharField(choices=[('usd', 'Доллар'), ('rub', 'Рубль')], max_length=3, verbose_name='Валюта')),
+                ('status', models.CharField(choices=[('Created', 'Создан'), ('InProgress', 'В процессе'), ('Done', 'Выполнен'), ('Expired', 'Истёк')], max_length=15, verbose_name='Статус')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='Количество заказов')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Количество товара')),
+                ('gross', models.BigIntegerField(default=0, verbose_name='Сумма без скидки и сбора')),
+                ('discount', models.BigIntegerField(default=0, verbose_name='Скидка')),
+                ('tax', models.BigIntegerField(default=0, verbose_name='Доп. сбор')),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+                'db_table': 'sales_rollup',
+                'ordering': ('day', 'item_id'),
+                'unique_together': {('day', 'item_id', 'currency', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0004_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('paid_before', models.DateTimeField(verbose_name='Учтены заказы, оплаченные до')),
+                ('full', models.BooleanField(default=False, verbose_name='Полный пересчёт')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Обработано заказов')),
+            ],
+            options={
+                'verbose_name': 'Расчёт рекомендаций',
+                'verbose_name_plural': 'Расчёты рекомендаций',
+                'db_table': 'recommendation_run',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Время оплаты'),
+        ),
+        migrations.CreateModel(
+            name='ItemCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_id', models.BigIntegerField(verbose_name='ID товара')),
+                ('related_id', models.BigIntegerField(verbose_name='ID товара в том же заказе')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество заказов')),
+            ],
+            options={
+                'verbose_name': 'Совместная покупка',
+                'verbose_name_plural': 'Совместные покупки',
+                'db_table': 'item_cooccurrence',
+                'indexes': [models.Index(fields=['item_id', '-count'], name='cooccurrence_item_count_idx')],
+                'unique_together': {('item_id', 'related_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(verbose_name='Количество совместных заказов')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Позиция')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_items', to='goods.item', verbose_name='Товар')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='goods.item', verbose_name='Рекомендуемый товар')),
+            ],
+            options={
+                'verbose_name': 'Рекомендуемый товар',
+                'verbose_name_plural': 'Рекомендуемые товары',
+                'db_table': 'related_item',
+                'ordering': ('item', 'rank'),
+                'unique_together': {('item', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0005_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('window_start', models.DateTimeField(verbose_name='Начало окна')),
+                ('window_end', models.DateTimeField(db_index=True, verbose_name='Конец окна')),
+                ('intents', models.PositiveIntegerField(default=0, verbose_name='Payment Intent в окне')),
+                ('paid', models.PositiveIntegerField(default=0, verbose_name='Заказов отмечено оплаченными')),
+                ('orphans', models.PositiveIntegerField(default=0, verbose_name='Payment Intent без актуального заказа')),
+                ('cancelled', models.PositiveIntegerField(default=0, verbose_name='Отменено Payment Intent')),
+                ('duplicates', models.PositiveIntegerField(default=0, verbose_name='Повторных оплат заказа')),
+            ],
+            options={
+                'verbose_name': 'Сверка со Stripe',
+                'verbose_name_plural': 'Сверки со Stripe',
+                'db_table': 'stripe_reconciliation',
+                'ordering': ('window_end',),
+            },
+        ),
+    ]
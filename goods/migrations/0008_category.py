@@ -0,0 +1,46 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0007_cache_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Название')),
+                ('slug', models.SlugField(max_length=255, unique=True, verbose_name='Слаг')),
+                ('path', models.CharField(editable=False, max_length=255, verbose_name='Путь')),
+                ('depth', models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина')),
+                ('item_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Товаров в категории')),
+                ('total_item_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Товаров в поддереве')),
+                ('parent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='goods.category', verbose_name='Родительская категория')),
+            ],
+            options={
+                'verbose_name': 'Категория',
+                'verbose_name_plural': 'Категории',
+                'db_table': 'category',
+                'ordering': ('path',),
+            },
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='category',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='goods.category', verbose_name='Категория'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'id'], name='item_category_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
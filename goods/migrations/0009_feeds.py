@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0008_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(unique=True, verbose_name='Номер части')),
+                ('item_count', models.PositiveIntegerField(default=0, verbose_name='Товаров')),
+                ('watermark', models.DateTimeField(verbose_name='Учтены изменения до')),
+                ('built_at', models.DateTimeField(auto_now=True, verbose_name='Время сборки')),
+            ],
+            options={
+                'verbose_name': 'Часть фида',
+                'verbose_name_plural': 'Части фида',
+                'db_table': 'feed_shard',
+                'ordering': ('number',),
+            },
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Время изменения'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0009_feeds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reference',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Номер заказа покупателя'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('reference', ''), _negated=True), fields=('session_key', 'reference'), name='order_session_reference_uniq'),
+        ),
+    ]
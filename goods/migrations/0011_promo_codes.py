@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:11
+
+import django.core.validators
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0010_order_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=64, verbose_name='Код')),
+                ('max_uses', models.PositiveIntegerField(blank=True, help_text='Пусто — без лимита', null=True, verbose_name='Лимит использований')),
+                ('counter_shards', models.PositiveSmallIntegerField(default=1, help_text='Больше частей — меньше ожидания блокировок при массовых покупках по одному коду', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(64)], verbose_name='Частей счётчика')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Действует до')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('discount', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promo_codes', to='goods.discount', verbose_name='Скидка')),
+            ],
+            options={
+                'verbose_name': 'Промокод',
+                'verbose_name_plural': 'Промокоды',
+                'db_table': 'promo_code',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='promo_code',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='goods.promocode', verbose_name='Промокод'),
+        ),
+        migrations.CreateModel(
+            name='PromoCodeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Часть')),
+                ('used', models.PositiveIntegerField(default=0, verbose_name='Использовано')),
+                ('limit', models.PositiveIntegerField(default=0, verbose_name='Лимит части')),
+                ('promo_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to='goods.promocode', verbose_name='Промокод')),
+            ],
+            options={
+                'verbose_name': 'Счётчик промокода',
+                'verbose_name_plural': 'Счётчики промокодов',
+                'db_table': 'promo_code_counter',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='promocode',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Upper('code'), name='promo_code_upper_uniq'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='promocodecounter',
+            unique_together={('promo_code', 'shard')},
+        ),
+    ]
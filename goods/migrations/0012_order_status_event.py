@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:14
+
+import django.contrib.postgres.indexes
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0011_promo_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField(verbose_name='ID заказа')),
+                ('from_status', models.CharField(blank=True, max_length=15, verbose_name='Прежний статус')),
+                ('to_status', models.CharField(choices=[('Created', 'Создан'), ('InProgress', 'В процессе'), ('Done', 'Выполнен'), ('Expired', 'Истёк')], max_length=15, verbose_name='Новый статус')),
+                ('source', models.CharField(choices=[('webhook', 'Вебхук Stripe'), ('reconcile', 'Сверка со Stripe'), ('expiry', 'Истечение заказа')], max_length=15, verbose_name='Источник')),
+                ('stripe_event_id', models.CharField(blank=True, max_length=255, verbose_name='Stripe Event ID')),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время')),
+            ],
+            options={
+                'verbose_name': 'Смена статуса заказа',
+                'verbose_name_plural': 'Смены статусов заказов',
+                'db_table': 'order_status_event',
+                'ordering': ('occurred_at', 'id'),
+                'indexes': [django.contrib.postgres.indexes.BrinIndex(fields=['occurred_at'], name='order_event_occurred_brin'), models.Index(fields=['order_id', 'occurred_at'], include=('from_status', 'to_status', 'source'), name='order_event_order_idx')],
+            },
+        ),
+    ]
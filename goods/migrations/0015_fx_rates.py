@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:24
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0014_order_session_status_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('currency', models.CharField(choices=[('usd', 'Доллар'), ('rub', 'Рубль'), ('eur', 'Евро')], max_length=3, primary_key=True, serialize=False, verbose_name='Валюта')),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Курс')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Время обновления')),
+            ],
+            options={
+                'verbose_name': 'Курс валюты',
+                'verbose_name_plural': 'Курсы валют',
+                'db_table': 'exchange_rate',
+                'ordering': ('currency',),
+            },
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_amount',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Цена в центах валюты заказа'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='currency',
+            field=models.CharField(blank=True, choices=[('usd', 'Доллар'), ('rub', 'Рубль'), ('eur', 'Евро')], default='usd', max_length=3, verbose_name='Валюта'),
+        ),
+        migrations.AlterField(
+            model_name='salesrollup',
+            name='currency',
+            field=models.CharField(choices=[('usd', 'Доллар'), ('rub', 'Рубль'), ('eur', 'Евро')], max_length=3, verbose_name='Валюта'),
+        ),
+        migrations.CreateModel(
+            name='ItemPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('usd', 'Доллар'), ('rub', 'Рубль'), ('eur', 'Евро')], max_length=3, verbose_name='Валюта')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Цена')),
+                ('unit_amount', models.PositiveBigIntegerField(verbose_name='Цена в центах')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='goods.item', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Цена товара в валюте',
+                'verbose_name_plural': 'Цены товаров в валютах',
+                'db_table': 'item_price',
+                'unique_together': {('item', 'currency')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-19 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('goods', '0016_exchange_rate_positive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='orderstatusevent',
+            name='order_event_order_idx',
+        ),
+        migrations.AddIndex(
+            model_name='orderstatusevent',
+            index=models.Index(fields=['order_id', 'occurred_at'], include=('id', 'from_status', 'to_status', 'source', 'stripe_event_id'), name='order_event_order_idx'),
+        ),
+    ]
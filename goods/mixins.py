@@ -1,8 +1,19 @@
+import json
+from uuid import uuid4
+
+from django.conf import settings
 from django.core.cache import cache
-from django.http import Http404
+from django.db import transaction
+from django.http import Http404, JsonResponse
 
-from TestDjangoProject.settings import STRIPE_PUBLIC_KEY
-from goods.models import Item
+from goods.edge_cache import DISPLAY_CURRENCY_HEADER, mark_cacheable
+from goods.local_cache import local_cache
+from goods.models import Category, Discount, Item, Order, PromoCode, Tax, path_ids
+from goods.ratelimit import check_rate_limit, StripeOverloaded
+from goods.services.basket_service import BasketError
+from goods.services.fx_service import CURRENCIES, display_prices
+from goods.services.promo_service import PromoCodeError, find_promo_code
+from goods.utils import get_client_ip
 
 
 
@@ -12,35 +23,180 @@ class DataMixin:
         context = kwargs
         public = context.get("stripe_public_key", None)
         if public:
-            context["STRIPE_PUBLIC_KEY"] = STRIPE_PUBLIC_KEY
+            context["STRIPE_PUBLIC_KEY"] = settings.STRIPE_PUBLIC_KEY
         return context
 
-    def get_item(self, pk: int) -> Item:
-        """Получаем товар, если нет возвращаем 404"""
-        item = Item.objects.filter(pk=pk).first()
+    def get_item(self, pk: int, fresh: bool = False) -> Item:
+        """Получаем товар из кэша воркера или БД (с fresh — только из БД), если нет возвращаем 404"""
+        load = lambda: Item.objects.filter(pk=pk).first()
+        item = load() if fresh else local_cache.get_or_load("item", pk, load)
         if not item:
             raise Http404("Item not found")
         return item
 
+    def get_category(self, slug: str) -> Category:
+        """Получаем категорию из кэша воркера или БД, если нет возвращаем 404"""
+        category = local_cache.get_or_load("category", slug, lambda: Category.objects.filter(slug=slug).first())
+        if not category:
+            raise Http404("Category not found")
+        return category
+
+    def get_category_ancestors(self, category: Category) -> list[Category]:
+        """Предки категории от корня одним запросом по id из материализованного пути"""
+        return list(Category.objects.filter(pk__in=path_ids(category.path)[:-1]).order_by("depth"))
+
+    def get_discount(self) -> Discount | None:
+        """Скидка магазина по умолчанию (первая) из кэша воркера"""
+        return local_cache.get_or_load("discount", "first", lambda: Discount.objects.first(), cache_none=True)
+
+    def get_tax(self) -> Tax | None:
+        """Доп. сбор магазина по умолчанию (первый) из кэша воркера"""
+        return local_cache.get_or_load("tax", "first", lambda: Tax.objects.first(), cache_none=True)
+
+    def get_order_adjustments(self, promo_code: PromoCode | None = None) -> tuple[Discount | None, Tax | None]:
+        """Скидка и доп. сбор заказа: скидка промокода, без него — скидка по умолчанию; сбор — по умолчанию"""
+        discount = promo_code.discount if promo_code else self.get_discount()
+        return discount, self.get_tax()
+
+    def get_display_currency(self, request) -> str | None:
+        """
+        Валюта показа цен из ?currency= или куки currency; None — каждый товар в своей валюте.
+        За nginx валюту уже выбрал он (заголовок X-Display-Currency), и страница рисуется в валюте ключа кэша.
+        """
+        if DISPLAY_CURRENCY_HEADER in request.headers:
+            currency = request.headers[DISPLAY_CURRENCY_HEADER]
+        else:
+            currency = request.GET.get("currency") or request.COOKIES.get("currency")
+        return currency if currency in CURRENCIES else None
+
+    def get_display_prices(self, items: list[Item], currency: str | None) -> dict[int, tuple]:
+        """Цены товаров в валюте показа одним запросом: {id товара: (цена, валюта)}"""
+        if not currency or not items:
+            return {}
+        return {item_id: (amount, currency) for item_id, amount in
+                display_prices([item.pk for item in items], currency).items()}
+
     def get_session(self, request) -> str:
-        if not request.session.session_key:
-            request.session.create()
-        return request.session.session_key
+        """Получаем ключ покупателя из подписанной куки; новый ключ не создаёт строку в django_session"""
+        if not request.buyer_key:
+            request.buyer_key = request.new_buyer_key = uuid4().hex
+        return request.buyer_key
+
+    def get_order_id(self, request) -> int | None:
+        """
+        Получаем заказ по payment_intent из адреса возврата Stripe, иначе последний заказ из сессии.
+        По payment_intent находится только заказ того же покупателя: чужой id платежа не раскрывает статус.
+        """
+        payment_intent_id = request.GET.get("payment_intent")
+        if payment_intent_id:
+            if not request.buyer_key:
+                return None
+            return (Order.objects.filter(payment_intent_id=payment_intent_id, session_key=request.buyer_key)
+                    .values_list("id", flat=True).first())
+        return request.session.get("order_id")
+
+    def remember_order(self, request, order_id: int) -> None:
+        """Сохраняем заказ в сессии; строка сессии пишется только при появлении нового заказа"""
+        if request.session.get("order_id") != order_id:
+            request.session["order_id"] = order_id
 
 
 class CacheMixin:
-    def get_cache_key(self, session_key: str, obj_id: int) -> str | None:
+    def get_cache_key(self, session_key: str, obj_id: int | str) -> str | None:
         """Генерируем ключ для кэша."""
         return f"session_buy_{session_key}_{obj_id}"
 
-    def get_cached_response(self, session_key: str, obj_id: int) -> dict | None:
+    def get_cached_response(self, session_key: str, obj_id: int | str) -> dict | None:
         """Получаем кэшированный ответ, если есть."""
         key = self.get_cache_key(session_key, obj_id)
         if key:
             return cache.get(key)
 
-    def set_cached_response(self, session_key: str, obj_id: int, data: dict, timeout: int) -> None:
-        """Сохраняем ответ в кэш."""
+    def set_cached_response(self, session_key: str, obj_id: int | str, data: dict, timeout: int) -> None:
+        """Сохраняем ответ в кэш до ответа клиенту: повторный запрос должен его застать."""
         key = self.get_cache_key(session_key, obj_id)
         if key:
             cache.set(key, data, timeout=timeout)
+
+
+class RateLimitMixin:
+    """Ограничение частоты запросов по вёдрам из settings.RATE_LIMITS и сброс нагрузки при перегрузке Stripe."""
+    rate_limit_scope: str = ""
+
+    def get_rate_limit_identities(self, request) -> dict[str, str | None]:
+        """Идентичности клиента для вёдер: ключ покупателя (если уже выдан) и IP."""
+        return {"session": getattr(request, "buyer_key", None), "ip": get_client_ip(request)}
+
+    def dispatch(self, request, *args, **kwargs):
+        retry_after = check_rate_limit(self.rate_limit_scope, self.get_rate_limit_identities(request))
+        if retry_after:
+            return self.too_many_requests(retry_after, status=429)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except StripeOverloaded:
+            # заказ, созданный до вызова Stripe, не должен закоммититься вместе с ответом 503
+            if transaction.get_connection().in_atomic_block:
+                transaction.set_rollback(True)
+            return self.too_many_requests(1, status=503)
+
+    @staticmethod
+    def too_many_requests(retry_after: float, status: int) -> JsonResponse:
+        response = JsonResponse({"error": "Too many requests"}, status=status)
+        response["Retry-After"] = str(int(retry_after))
+        return response
+
+
+class InternalOnlyMixin:
+    """Доступ только с адресов из settings.INTERNAL_IPS, для остальных — 404"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if get_client_ip(request) not in settings.INTERNAL_IPS:
+            raise Http404
+        return super().dispatch(request, *args, **kwargs)
+
+
+class EdgeCacheMixin:
+    """
+    Страница, которую nginx кэширует для анонимных посетителей (goods.edge_cache). View не должен трогать
+    сессию, чтобы ответ не ставил куки, и записывает id показанных товаров в edge_item_ids.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.edge_item_ids = []
+        response = super().dispatch(request, *args, **kwargs)
+        if request.method not in ("GET", "HEAD"):
+            return response
+        return mark_cacheable(request, response, self.edge_item_ids)
+
+
+class BasketMixin:
+    """Разбор JSON тела запроса корзины и ответ 400 на некорректные изменения корзины или промокод"""
+
+    def get_json(self, request) -> dict:
+        """Тело запроса application/json; тело другого типа (пустая форма) — как пустой объект"""
+        if request.content_type != "application/json":
+            return {}
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            raise BasketError("Некорректный JSON")
+        return data if isinstance(data, dict) else {}
+
+    def get_quantity(self, request, default: int = 1) -> int:
+        quantity = self.get_json(request).get("quantity", default)
+        if isinstance(quantity, bool) or not isinstance(quantity, int):
+            raise BasketError("Количество должно быть целым числом")
+        return quantity
+
+    def get_promo_code(self, request) -> PromoCode | None:
+        """Промокод из поля code тела запроса; неизвестный или недействующий — PromoCodeError"""
+        code = self.get_json(request).get("code")
+        if code is not None and not isinstance(code, str):
+            raise PromoCodeError("Промокод не найден")
+        return find_promo_code(code) if code else None
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except (BasketError, PromoCodeError) as e:
+            return JsonResponse({"error": str(e)}, status=400)
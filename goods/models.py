@@ -1,21 +1,35 @@
-import stripe
+from decimal import Decimal
+from typing import TYPE_CHECKING
+
+from django.contrib.postgres.indexes import BrinIndex
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr, Upper
 from django.urls import reverse
+from django.utils import timezone
+
+from goods.services.stripe_client import get_stripe
 
-from TestDjangoProject.settings import STRIPE_SECRET_KEY
+if TYPE_CHECKING:
+    import stripe
 
 
 CURRENCIES_CHOICES = [
     ("usd", "Доллар"),
     ("rub", "Рубль"),
 ]
+# Валюты показа цен и оформления заказа: цены товаров в них считаются по курсам (ItemPrice)
+DISPLAY_CURRENCIES_CHOICES = CURRENCIES_CHOICES + [
+    ("eur", "Евро"),
+]
 
 ORDER_STATUS_CHOICES = [
     ("Created", "Создан"),
     ("InProgress", "В процессе"),
     ("Done", "Выполнен"),
+    ("Expired", "Истёк"),
 ]
 
 
@@ -45,7 +59,6 @@ class StripeEntity(models.Model):
     stripe_create_kwargs: dict = {}  # дочерний класс должен определить: что передать в create()
 
     def save(self, *args, **kwargs):
-        stripe.api_key = STRIPE_SECRET_KEY
         if self.percentage is None:
             raise ValidationError("Укажите процент")
         # вызываем соответствующий метод Stripe, настроенный в дочернем классе
@@ -72,8 +85,8 @@ class Discount(StripeEntity):
         "duration": "forever",
     }
 
-    def _stripe_create(self) -> stripe.Coupon:
-        return stripe.Coupon.create(
+    def _stripe_create(self) -> "stripe.Coupon":
+        return get_stripe().Coupon.create(
             percent_off=self.percentage,
             name=self.name,
             **self.stripe_create_kwargs
@@ -91,14 +104,141 @@ class Tax(StripeEntity):
         "inclusive": False,
     }
 
-    def _stripe_create(self) -> stripe.TaxRate:
-        return stripe.TaxRate.create(
+    def _stripe_create(self) -> "stripe.TaxRate":
+        return get_stripe().TaxRate.create(
             display_name=self.name,
             percentage=self.percentage,
             **self.stripe_create_kwargs
         )
 
 
+class PromoCode(models.Model):
+    """
+    Модель PromoCode — промокод, который покупатель вводит при покупке; применяет скидку discount.
+    Код уникален без учёта регистра. Лимит использований делится между строками PromoCodeCounter,
+    чтобы одновременные покупки по одному коду не ждали блокировку одной строки.
+    """
+    code = models.CharField(max_length=64, verbose_name="Код")
+    discount = models.ForeignKey(Discount, on_delete=models.CASCADE, related_name="promo_codes",
+                                 verbose_name="Скидка")
+    max_uses = models.PositiveIntegerField(null=True, blank=True, verbose_name="Лимит использований",
+                                           help_text="Пусто — без лимита")
+    counter_shards = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1), MaxValueValidator(64)], verbose_name="Частей счётчика",
+        help_text="Больше частей — меньше ожидания блокировок при массовых покупках по одному коду",
+    )
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Действует до")
+    is_active = models.BooleanField(default=True, verbose_name="Активен")
+
+    class Meta:
+        db_table = "promo_code"
+        verbose_name = "Промокод"
+        verbose_name_plural = "Промокоды"
+        constraints = [
+            # поиск code__iexact на PostgreSQL — UPPER("code") = UPPER(%s), поэтому индекс по UPPER(code)
+            models.UniqueConstraint(Upper("code"), name="promo_code_upper_uniq"),
+        ]
+
+    def __str__(self):
+        return self.code
+
+
+class PromoCodeCounter(models.Model):
+    """Модель PromoCodeCounter — часть счётчика использований промокода со своей долей лимита"""
+    promo_code = models.ForeignKey(PromoCode, on_delete=models.CASCADE, related_name="counters",
+                                   verbose_name="Промокод")
+    shard = models.PositiveSmallIntegerField(verbose_name="Часть")
+    used = models.PositiveIntegerField(default=0, verbose_name="Использовано")
+    limit = models.PositiveIntegerField(default=0, verbose_name="Лимит части")
+
+    class Meta:
+        db_table = "promo_code_counter"
+        verbose_name = "Счётчик промокода"
+        verbose_name_plural = "Счётчики промокодов"
+        unique_together = (("promo_code", "shard"),)
+
+
+def path_ids(path: str) -> list[int]:
+    """id категорий материализованного пути "/1/5/12/" от корня до самой категории."""
+    return [int(part) for part in path.strip("/").split("/") if part]
+
+
+class Category(models.Model):
+    """
+    Модель Category — категория товаров с вложенностью.
+    path — материализованный путь из id предков и самой категории ("/1/5/12/"): всё поддерево выбирается
+    одним запросом path LIKE '/1/5/%' по индексу, без обхода дерева по уровням.
+    item_count и total_item_count — количество товаров в категории и во всём её поддереве, обновляются инкрементально.
+    """
+    name = models.CharField(max_length=255, verbose_name="Название")
+    slug = models.SlugField(max_length=255, unique=True, verbose_name="Слаг")
+    parent = models.ForeignKey("self", null=True, blank=True, on_delete=models.PROTECT,
+                               related_name="children", verbose_name="Родительская категория")
+    path = models.CharField(max_length=255, editable=False, verbose_name="Путь")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Глубина")
+    item_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Товаров в категории")
+    total_item_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Товаров в поддереве")
+
+    class Meta:
+        db_table = "category"
+        verbose_name = "Категория"
+        verbose_name_plural = "Категории"
+        ordering = ("path",)
+        indexes = [
+            # varchar_pattern_ops нужен PostgreSQL, чтобы LIKE 'prefix%' шёл по индексу при любой локали
+            models.Index(fields=["path"], name="category_path_idx", opclasses=["varchar_pattern_ops"]),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def _build_path(self) -> str:
+        return f"{self.parent.path if self.parent_id else '/'}{self.pk}/"
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id:
+            path = Category.objects.filter(pk=self.pk).values_list("path", flat=True).first()
+            if path and self._build_path().startswith(path):
+                raise ValidationError({"parent": "Категорию нельзя перенести в её собственное поддерево"})
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                self.path = self._build_path()
+                self.depth = len(path_ids(self.path)) - 1
+                Category.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            return
+
+        old = Category.objects.filter(pk=self.pk).values("path", "total_item_count").first()
+        new_path = self._build_path()
+        if old is None or old["path"] == new_path:
+            super().save(*args, **kwargs)
+            return
+        if new_path.startswith(old["path"]):
+            # форма админки отсекает это в clean(); сюда доходит только сохранение в обход валидации
+            raise IntegrityError("Категорию нельзя перенести в её собственное поддерево")
+
+        # перенос поддерева: пути потомков переписываются одним UPDATE, счётчики — у старых и новых предков
+        old_path, moved = old["path"], old["total_item_count"]
+        with transaction.atomic():
+            self.path, self.depth = new_path, len(path_ids(new_path)) - 1
+            super().save(*args, **kwargs)
+            Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr("path", len(old_path) + 1)),
+                depth=F("depth") + (len(path_ids(new_path)) - len(path_ids(old_path))),
+            )
+            if moved:
+                Category.objects.filter(pk__in=path_ids(old_path)[:-1]).update(
+                    total_item_count=F("total_item_count") - moved)
+                Category.objects.filter(pk__in=path_ids(new_path)[:-1]).update(
+                    total_item_count=F("total_item_count") + moved)
+
+    def get_absolute_url(self):
+        return reverse("goods:category", kwargs={"slug": self.slug})
+
+
 class Item(models.Model):
     """Модель Item для товара подлежащего покупке, содержит название, описание и цену товара"""
     name = models.CharField(max_length=255, verbose_name="Название")
@@ -112,12 +252,24 @@ class Item(models.Model):
         max_length=3, choices=CURRENCIES_CHOICES,
         default="usd", verbose_name="Валюта"
     )
+    image = models.ImageField(upload_to="items/originals/", blank=True, verbose_name="Изображение")
+    image_hash = models.CharField(max_length=64, blank=True, verbose_name="Хэш изображения")
+    image_variants = models.JSONField(default=dict, blank=True, verbose_name="Варианты изображения")
+    # отдельный индекс по category не нужен: его покрывает item_category_id_idx
+    category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.SET_NULL, db_index=False,
+                                 related_name="items", verbose_name="Категория")
+    # queryset.update() поле не обновляет — так обновляются только служебные поля изображения
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Время изменения")
 
     class Meta:
         db_table = "item"
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         ordering = ("id",)
+        indexes = [
+            # листинг категории: keyset-пагинация по id внутри категории
+            models.Index(fields=["category", "id"], name="item_category_id_idx"),
+        ]
 
     def get_absolute_url(self):
         return reverse("goods:item_lookout", kwargs={"id": self.pk})
@@ -128,7 +280,7 @@ class Order(TimestampedModel):
     Модель Order для оформления заказа.
     Заказ содержит несколько Item, дату создания, итоговую цену, внешние ключи, которые ссылаются на модель Discount (Скидка) и Tax (Доп. сбор)
     """
-    items = models.ManyToManyField(Item, verbose_name="Товары")
+    items = models.ManyToManyField(Item, through="OrderItem", verbose_name="Товары")
     discount = models.ForeignKey(
         Discount, null=True, blank=True, on_delete=models.SET_NULL,
         verbose_name="Скидка"
@@ -138,7 +290,7 @@ class Order(TimestampedModel):
         verbose_name="Доп. сбор"
     )
     currency = models.CharField(
-        max_length=3, choices=CURRENCIES_CHOICES,
+        max_length=3, choices=DISPLAY_CURRENCIES_CHOICES,
         default="usd", blank=True, verbose_name="Валюта"
     )
     status = models.CharField(
@@ -148,9 +300,284 @@ class Order(TimestampedModel):
     session_key = models.CharField(
         max_length=255, verbose_name="Ключ Сессии"
     )
+    payment_intent_id = models.CharField(
+        max_length=255, blank=True, verbose_name="Stripe Payment Intent ID"
+    )
+    paid_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Время оплаты")
+    promo_code = models.ForeignKey(PromoCode, null=True, blank=True, on_delete=models.SET_NULL,
+                                   related_name="orders", verbose_name="Промокод")
+    # номер заказа у оптового покупателя; повторная отправка того же номера не создаёт второй заказ
+    reference = models.CharField(max_length=64, blank=True, default="", verbose_name="Номер заказа покупателя")
 
     class Meta:
         db_table = "order"
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ("id",)
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+            # поиск неоплаченного заказа покупателя для повторного использования (reusable_orders)
+            models.Index(fields=["session_key", "status"], name="order_session_status_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["session_key", "reference"], condition=~models.Q(reference=""),
+                                    name="order_session_reference_uniq"),
+        ]
+
+
+ORDER_EVENT_SOURCES = [
+    ("webhook", "Вебхук Stripe"),
+    ("reconcile", "Сверка со Stripe"),
+    ("expiry", "Истечение заказа"),
+]
+
+
+class ExchangeRate(models.Model):
+    """
+    Модель ExchangeRate — курс валюты: сколько единиц currency стоит одна единица FX_BASE_CURRENCY.
+    Загружается командой update_fx_rates; по курсам заранее считаются цены товаров ItemPrice.
+    """
+    currency = models.CharField(max_length=3, primary_key=True, choices=DISPLAY_CURRENCIES_CHOICES,
+                                verbose_name="Валюта")
+    # нулевой курс обнулил бы цены товаров в этой валюте
+    rate = models.DecimalField(max_digits=18, decimal_places=8, validators=[MinValueValidator(Decimal("0.00000001"))],
+                               verbose_name="Курс")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Время обновления")
+
+    class Meta:
+        db_table = "exchange_rate"
+        constraints = [models.CheckConstraint(condition=models.Q(rate__gt=0), name="exchange_rate_positive")]
+        verbose_name = "Курс валюты"
+        verbose_name_plural = "Курсы валют"
+        ordering = ("currency",)
+
+    def __str__(self):
+        return f"{self.currency}: {self.rate}"
+
+
+class ItemPrice(models.Model):
+    """
+    Модель ItemPrice — цена товара в валюте показа, посчитанная заранее по курсам.
+    Пересчитывается пачками при смене курсов и при изменении товара, поэтому страница и оплата не считают курс.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="prices", verbose_name="Товар")
+    currency = models.CharField(max_length=3, choices=DISPLAY_CURRENCIES_CHOICES, verbose_name="Валюта")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Цена")
+    unit_amount = models.PositiveBigIntegerField(verbose_name="Цена в центах")
+
+    class Meta:
+        db_table = "item_price"
+        verbose_name = "Цена товара в валюте"
+        verbose_name_plural = "Цены товаров в валютах"
+        unique_together = (("item", "currency"),)
+
+
+class OrderStatusEvent(models.Model):
+    """
+    Модель OrderStatusEvent — смена статуса заказа; строки только добавляются, в той же транзакции, что и смена статуса.
+    order_id без внешнего ключа: история остаётся после переноса заказа в архив.
+    """
+    order_id = models.BigIntegerField(verbose_name="ID заказа")
+    from_status = models.CharField(max_length=15, blank=True, verbose_name="Прежний статус")
+    to_status = models.CharField(max_length=15, choices=ORDER_STATUS_CHOICES, verbose_name="Новый статус")
+    source = models.CharField(max_length=15, choices=ORDER_EVENT_SOURCES, verbose_name="Источник")
+    stripe_event_id = models.CharField(max_length=255, blank=True, verbose_name="Stripe Event ID")
+    occurred_at = models.DateTimeField(default=timezone.now, verbose_name="Время")
+
+    class Meta:
+        db_table = "order_status_event"
+        verbose_name = "Смена статуса заказа"
+        verbose_name_plural = "Смены статусов заказов"
+        ordering = ("occurred_at", "id")
+        indexes = [
+            # строки пишутся по возрастанию времени: BRIN в тысячи раз меньше B-tree и отсекает диапазоны страниц
+            BrinIndex(fields=["occurred_at"], name="order_event_occurred_brin"),
+            # история заказа читается только из индекса
+            models.Index(fields=["order_id", "occurred_at"],
+                         include=["id", "from_status", "to_status", "source", "stripe_event_id"],
+                         name="order_event_order_idx"),
+        ]
+
+
+class OrderItem(models.Model):
+    """Модель OrderItem — позиция заказа: товар, его количество и цена в валюте заказа на момент оформления"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="lines", verbose_name="Заказ")
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, verbose_name="Товар")
+    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)], verbose_name="Количество")
+    # пусто у позиций, добавленных в обход create_or_get_order (админка): тогда берётся цена товара
+    unit_amount = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Цена в центах валюты заказа")
+
+    class Meta:
+        db_table = "order_items"
+        verbose_name = "Позиция заказа"
+        verbose_name_plural = "Позиции заказа"
+        unique_together = (("order", "item"),)
+
+
+class ArchivedOrder(models.Model):
+    """
+    Модель ArchivedOrder — архивная копия выполненного или истёкшего заказа.
+    Хранит данные заказа в денормализованном виде, без внешних ключей, чтобы не нагружать основные таблицы.
+    """
+    order_id = models.BigIntegerField(unique=True, verbose_name="ID заказа")
+    created_at = models.DateTimeField(verbose_name="Время создания")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Время архивации")
+    status = models.CharField(max_length=15, choices=ORDER_STATUS_CHOICES, verbose_name="Статус")
+    currency = models.CharField(max_length=3, blank=True, verbose_name="Валюта")
+    session_key = models.CharField(max_length=255, verbose_name="Ключ Сессии")
+    discount_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID скидки")
+    tax_id = models.BigIntegerField(null=True, blank=True, verbose_name="ID доп. сбора")
+    item_ids = models.JSONField(default=list, verbose_name="ID товаров")
+    item_quantities = models.JSONField(default=dict, verbose_name="Количество по товарам")
+    payment_intent_id = models.CharField(max_length=255, blank=True, verbose_name="Stripe Payment Intent ID")
+
+    class Meta:
+        db_table = "order_archive"
+        verbose_name = "Архивный заказ"
+        verbose_name_plural = "Архивные заказы"
+        ordering = ("order_id",)
+
+
+class SalesRollup(models.Model):
+    """
+    Модель SalesRollup — агрегаты продаж за день по товару, валюте и статусу заказа в момент оплаты (SALE_STATUS).
+    Обновляется инкрементально при оплате заказа, суммы хранятся в минимальных единицах валюты (центах).
+    """
+    day = models.DateField(verbose_name="День")
+    item_id = models.BigIntegerField(verbose_name="ID товара")
+    currency = models.CharField(max_length=3, choices=DISPLAY_CURRENCIES_CHOICES, verbose_name="Валюта")
+    status = models.CharField(max_length=15, choices=ORDER_STATUS_CHOICES, verbose_name="Статус")
+    orders_count = models.PositiveIntegerField(default=0, verbose_name="Количество заказов")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="Количество товара")
+    gross = models.BigIntegerField(default=0, verbose_name="Сумма без скидки и сбора")
+    discount = models.BigIntegerField(default=0, verbose_name="Скидка")
+    tax = models.BigIntegerField(default=0, verbose_name="Доп. сбор")
+
+    class Meta:
+        db_table = "sales_rollup"
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+        ordering = ("day", "item_id")
+        unique_together = (("day", "item_id", "currency", "status"),)
+
+
+class ItemCooccurrence(models.Model):
+    """
+    Модель ItemCooccurrence — сколько оплаченных заказов содержат оба товара.
+    Хранится в обе стороны (item → related и related → item), используется только джобой рекомендаций.
+    """
+    item_id = models.BigIntegerField(verbose_name="ID товара")
+    related_id = models.BigIntegerField(verbose_name="ID товара в том же заказе")
+    count = models.PositiveIntegerField(default=0, verbose_name="Количество заказов")
+
+    class Meta:
+        db_table = "item_cooccurrence"
+        verbose_name = "Совместная покупка"
+        verbose_name_plural = "Совместные покупки"
+        unique_together = (("item_id", "related_id"),)
+        indexes = [
+            models.Index(fields=["item_id", "-count"], name="cooccurrence_item_count_idx"),
+        ]
+
+
+class RelatedItem(models.Model):
+    """Модель RelatedItem — предрассчитанные товары «часто покупают вместе» для страницы товара"""
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="related_items", verbose_name="Товар")
+    related = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="+", verbose_name="Рекомендуемый товар")
+    score = models.PositiveIntegerField(verbose_name="Количество совместных заказов")
+    rank = models.PositiveSmallIntegerField(verbose_name="Позиция")
+
+    class Meta:
+        db_table = "related_item"
+        verbose_name = "Рекомендуемый товар"
+        verbose_name_plural = "Рекомендуемые товары"
+        ordering = ("item", "rank")
+        unique_together = (("item", "rank"),)
+
+
+class RecommendationRun(TimestampedModel):
+    """Модель RecommendationRun — запуск джобы рекомендаций; paid_before служит водоразделом для следующего запуска"""
+    paid_before = models.DateTimeField(verbose_name="Учтены заказы, оплаченные до")
+    full = models.BooleanField(default=False, verbose_name="Полный пересчёт")
+    orders = models.PositiveIntegerField(default=0, verbose_name="Обработано заказов")
+
+    class Meta:
+        db_table = "recommendation_run"
+        verbose_name = "Расчёт рекомендаций"
+        verbose_name_plural = "Расчёты рекомендаций"
+        ordering = ("id",)
+
+
+class StripeReconciliation(TimestampedModel):
+    """
+    Модель StripeReconciliation — обработанное окно сверки Payment Intent из Stripe с заказами.
+    Окна идут подряд, поэтому сверка продолжается с конца последнего окна.
+    """
+    window_start = models.DateTimeField(verbose_name="Начало окна")
+    window_end = models.DateTimeField(db_index=True, verbose_name="Конец окна")
+    intents = models.PositiveIntegerField(default=0, verbose_name="Payment Intent в окне")
+    paid = models.PositiveIntegerField(default=0, verbose_name="Заказов отмечено оплаченными")
+    orphans = models.PositiveIntegerField(default=0, verbose_name="Payment Intent без актуального заказа")
+    cancelled = models.PositiveIntegerField(default=0, verbose_name="Отменено Payment Intent")
+    duplicates = models.PositiveIntegerField(default=0, verbose_name="Повторных оплат заказа")
+
+    class Meta:
+        db_table = "stripe_reconciliation"
+        verbose_name = "Сверка со Stripe"
+        verbose_name_plural = "Сверки со Stripe"
+        ordering = ("window_end",)
+
+
+class FeedShard(models.Model):
+    """
+    Модель FeedShard — собранная часть фида товаров и sitemap: товары с id в [number * size, (number + 1) * size).
+    Часть пересобирается, только если в ней изменился товар (updated_at позже watermark) или число товаров.
+    """
+    number = models.PositiveIntegerField(unique=True, verbose_name="Номер части")
+    item_count = models.PositiveIntegerField(default=0, verbose_name="Товаров")
+    watermark = models.DateTimeField(verbose_name="Учтены изменения до")
+    built_at = models.DateTimeField(auto_now=True, verbose_name="Время сборки")
+
+    class Meta:
+        db_table = "feed_shard"
+        verbose_name = "Часть фида"
+        verbose_name_plural = "Части фида"
+        ordering = ("number",)
+
+
+class CacheVersion(models.Model):
+    """
+    Модель CacheVersion — номер версии данных пространства локального кэша воркеров (item, discount, tax).
+    Увеличивается в транзакции изменения; по нему воркер замечает пропущенные сообщения об инвалидации.
+    """
+    namespace = models.CharField(max_length=32, primary_key=True, verbose_name="Пространство")
+    version = models.BigIntegerField(default=0, verbose_name="Версия")
+
+    class Meta:
+        db_table = "cache_version"
+        verbose_name = "Версия кэша"
+        verbose_name_plural = "Версии кэша"
+
+
+class BackgroundTask(models.Model):
+    """
+    Модель BackgroundTask — надёжная фоновая задача: пишется в транзакции запроса и удаляется после выполнения.
+    Задачи, не выполненные из-за перезапуска воркера или ошибки, дорабатывает команда run_background_tasks.
+    """
+    func = models.CharField(max_length=255, verbose_name="Функция")
+    args = models.JSONField(default=list, verbose_name="Аргументы")
+    kwargs = models.JSONField(default=dict, verbose_name="Именованные аргументы")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
+    run_after = models.DateTimeField(default=timezone.now, verbose_name="Выполнить после")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+
+    class Meta:
+        db_table = "background_task"
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ("run_after", "id")
+        indexes = [models.Index(fields=["run_after"], name="background_task_run_after_idx")]
+
+    def __str__(self):
+        return f"{self.func} #{self.pk}"
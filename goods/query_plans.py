@@ -0,0 +1,156 @@
+import json
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, Iterator
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.test import RequestFactory
+from django.utils import timezone
+
+from goods.models import Category, Discount, Item, Order, OrderStatusEvent, PromoCode, Tax
+from goods.services.category_service import subtree_items
+from goods.services.db_service import reusable_orders
+from goods.services.order_event_service import status_events_between
+
+# Объём данных для проверки планов: при таком размере таблиц планировщик уже выбирает между индексом
+# и последовательным чтением так же, как на боевой БД
+SEED_ITEMS = 20_000
+SEED_ORDERS = 100_000
+SEED_SESSIONS = 40_000
+SEED_PROMO_CODES = 5_000
+SEED_CATEGORY_ROOTS = 10
+SEED_EVENT_DAYS = 90
+SEED_BATCH_SIZE = 5_000
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    """
+    Горячий запрос приложения и требования к его плану:
+    indexes — индексы, которые план обязан использовать; no_seq_scan — таблицы, которые нельзя читать целиком;
+    max_rows — верхняя граница оценки строк результата.
+    """
+    name: str
+    build: Callable[[], QuerySet]
+    indexes: tuple[str, ...] = ()
+    no_seq_scan: tuple[str, ...] = ()
+    max_rows: int | None = None
+
+
+def _admin_changelist(model) -> QuerySet:
+    """Первая страница списка модели в админке — запрос строит ChangeList самого ModelAdmin."""
+    model_admin = admin.site._registry[model]
+    request = RequestFactory().get("/")
+    request.user = User(is_active=True, is_staff=True, is_superuser=True)
+    changelist = model_admin.get_changelist_instance(request)
+    return changelist.queryset[:changelist.list_per_page]
+
+
+def _event_window() -> QuerySet:
+    until = OrderStatusEvent.objects.order_by("-id").values_list("occurred_at", flat=True).first()
+    return status_events_between(until - timedelta(hours=1), until)
+
+
+HOT_QUERIES = [
+    HotQuery("order_reuse", lambda: reusable_orders("session-42", Discount.objects.order_by("pk").first()),
+             indexes=("order_session_status_idx",), no_seq_scan=("order",), max_rows=10),
+    HotQuery("discount_first", lambda: Discount.objects.order_by("pk")[:1], max_rows=1),
+    HotQuery("promo_code_lookup", lambda: PromoCode.objects.select_related("discount").filter(code__iexact="promo42"),
+             indexes=("promo_code_upper_uniq",), no_seq_scan=("promo_code",), max_rows=1),
+    HotQuery("category_page", lambda: subtree_items(Category.objects.filter(parent__isnull=True).first()),
+             no_seq_scan=("item",), max_rows=24),
+    HotQuery("order_timeline", lambda: OrderStatusEvent.objects.filter(order_id=42).order_by("occurred_at", "id"),
+             indexes=("order_event_order_idx",), no_seq_scan=("order_status_event",), max_rows=10),
+    HotQuery("order_events_window", _event_window,
+             indexes=("order_event_occurred_brin",), no_seq_scan=("order_status_event",)),
+    HotQuery("admin_order_changelist", lambda: _admin_changelist(Order),
+             indexes=("order_pkey",), no_seq_scan=("order",), max_rows=100),
+    HotQuery("admin_order_event_changelist", lambda: _admin_changelist(OrderStatusEvent),
+             indexes=("order_status_event_pkey",), no_seq_scan=("order_status_event",), max_rows=100),
+]
+
+
+def seed_dataset() -> None:
+    """
+    Заполняет пустую БД данными размера боевой: товары в дереве категорий, заказы покупателей,
+    журнал статусов за SEED_EVENT_DAYS дней в порядке времени, промокоды. Затем обновляет статистику планировщика.
+    Записи создаются через bulk_create, без сигналов и Stripe.
+    """
+    discounts = Discount.objects.bulk_create([Discount(name=f"D{i}", percentage=5 * i, stripe_id=f"coupon_{i}")
+                                              for i in range(1, 4)])
+    taxes = Tax.objects.bulk_create([Tax(name=f"T{i}", percentage=i, stripe_id=f"txr_{i}") for i in range(1, 3)])
+    leaves = []
+    for root_number in range(SEED_CATEGORY_ROOTS):
+        root = Category.objects.create(name=f"C{root_number}", slug=f"c{root_number}")
+        leaves += [Category.objects.create(name=f"C{root_number}-{i}", slug=f"c{root_number}-{i}", parent=root)
+                   for i in range(10)]
+    Item.objects.bulk_create([
+        Item(name=f"Item {i}", description="D", price=Decimal(i % 500 + 1), currency="usd",
+             category=leaves[i % len(leaves)])
+        for i in range(SEED_ITEMS)
+    ], batch_size=SEED_BATCH_SIZE)
+    PromoCode.objects.bulk_create([PromoCode(code=f"PROMO{i}", discount=discounts[i % len(discounts)])
+                                   for i in range(SEED_PROMO_CODES)], batch_size=SEED_BATCH_SIZE)
+
+    statuses = ["Done"] * 6 + ["InProgress"] * 2 + ["Created", "Expired"]
+    orders = Order.objects.bulk_create([
+        Order(session_key=f"session-{i % SEED_SESSIONS}", status=statuses[i % len(statuses)],
+              discount=discounts[0] if i % 3 else None, tax=taxes[0] if i % 2 else None)
+        for i in range(SEED_ORDERS)
+    ], batch_size=SEED_BATCH_SIZE)
+
+    start = timezone.now() - timedelta(days=SEED_EVENT_DAYS)
+    step = timedelta(days=SEED_EVENT_DAYS) / (2 * len(orders))
+    OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent(order_id=order.pk, from_status=from_status, to_status=to_status, source="webhook",
+                         occurred_at=start + step * (2 * number + offset))
+        for number, order in enumerate(orders)
+        for offset, (from_status, to_status) in enumerate((("Created", "InProgress"), ("InProgress", "Done")))
+    ], batch_size=SEED_BATCH_SIZE)
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def explain(queryset: QuerySet) -> dict:
+    """Корневой узел плана EXPLAIN (FORMAT JSON) запроса (PostgreSQL)."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        raw = cursor.fetchone()[0]
+    return (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+
+
+def _nodes(plan: dict, depth: int = 0) -> Iterator[tuple[int, dict]]:
+    yield depth, plan
+    for child in plan.get("Plans", ()):
+        yield from _nodes(child, depth + 1)
+
+
+def plan_shape(plan: dict) -> list[str]:
+    """Форма плана без стоимостей и оценок: узлы, таблицы и индексы. Её сравнивают с эталоном."""
+    lines = []
+    for depth, node in _nodes(plan):
+        line = "  " * depth + node["Node Type"]
+        if "Relation Name" in node:
+            line += f" on {node['Relation Name']}"
+        if "Index Name" in node:
+            line += f" using {node['Index Name']}"
+        lines.append(line)
+    return lines
+
+
+def check_plan(query: HotQuery, plan: dict) -> list[str]:
+    """Нарушения требований запроса к плану; пустой список — план в порядке."""
+    nodes = [node for _, node in _nodes(plan)]
+    used = {node["Index Name"] for node in nodes if "Index Name" in node}
+    problems = [f"не используется индекс {index}" for index in query.indexes if index not in used]
+    problems += [f"последовательное чтение таблицы {node['Relation Name']}" for node in nodes
+                 if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in query.no_seq_scan]
+    if query.max_rows is not None and plan["Plan Rows"] > query.max_rows:
+        problems.append(f"оценка {plan['Plan Rows']} строк больше {query.max_rows}")
+    return problems
@@ -0,0 +1,115 @@
+import logging
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from goods import metrics
+
+logger = logging.getLogger(__name__)
+
+# Алиас CACHES со счётчиками: общий для всех воркеров и нод бэкенд с атомарным incr (Redis)
+RATE_LIMIT_CACHE = "ratelimit"
+STRIPE_IN_FLIGHT_KEY = "stripe_in_flight"
+# Страховка от «застрявшего» счётчика, если воркер умер посреди вызова Stripe, в секундах
+STRIPE_IN_FLIGHT_TIMEOUT = 60
+
+
+class StripeOverloaded(Exception):
+    """Слишком много одновременных вызовов Stripe: запрос нужно отклонить."""
+
+
+def counters():
+    """Кэш счётчиков лимитов и слотов Stripe."""
+    return caches[RATE_LIMIT_CACHE]
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """Ведро на capacity запросов, полностью восстанавливающееся за period секунд."""
+    capacity: int
+    period: float
+
+
+def _consume(key: str, bucket: Bucket, now: float) -> float:
+    """
+    Забирает токен из ведра. Возвращает 0, если запрос разрешён, иначе через сколько секунд повторить.
+    Ведро построено на атомарных счётчиках кэша RATE_LIMIT_CACHE (скользящее окно из двух счётчиков), без блокировок.
+    """
+    cache = counters()
+    window = int(now // bucket.period)
+    elapsed = (now % bucket.period) / bucket.period
+    current_key = f"ratelimit:{key}:{window}"
+    previous = cache.get(f"ratelimit:{key}:{window - 1}", 0)
+    cache.add(current_key, 0, timeout=math.ceil(bucket.period * 2))
+    try:
+        current = cache.incr(current_key)
+    except ValueError:
+        cache.set(current_key, 1, timeout=math.ceil(bucket.period * 2))
+        current = 1
+
+    if previous * (1 - elapsed) + current <= bucket.capacity:
+        return 0.0
+
+    # отклонённый запрос токен не тратит
+    try:
+        cache.decr(current_key)
+    except ValueError:
+        pass
+    current -= 1
+    if previous and current < bucket.capacity:
+        wait = (1 - (bucket.capacity - current) / previous - elapsed) * bucket.period
+    else:
+        wait = (1 - elapsed) * bucket.period + (1 - (bucket.capacity - 1) / max(current, 1)) * bucket.period
+    return max(1.0, math.ceil(wait))
+
+
+def check_rate_limit(scope: str, identities: dict[str, Optional[str]]) -> float:
+    """
+    Проверяет вёдра области scope из settings.RATE_LIMITS для каждой идентичности (session, ip, global).
+    Возвращает 0, если запрос разрешён, иначе значение для Retry-After.
+    """
+    now = time.time()
+    for name, (capacity, period) in settings.RATE_LIMITS[scope].items():
+        identity = "all" if name == "global" else identities.get(name)
+        if not identity:
+            continue
+        retry_after = _consume(f"{scope}:{name}:{identity}", Bucket(capacity, period), now)
+        if retry_after:
+            metrics.incr(f"ratelimit.rejected.{scope}.{name}")
+            logger.debug("rate limited", extra={"scope": scope, "bucket": name, "retry_after": retry_after})
+            return retry_after
+    return 0.0
+
+
+@contextmanager
+def stripe_call_slot():
+    """Занимает слот вызова Stripe; при превышении STRIPE_MAX_IN_FLIGHT сбрасывает нагрузку через StripeOverloaded."""
+    cache = counters()
+    cache.add(STRIPE_IN_FLIGHT_KEY, 0, timeout=STRIPE_IN_FLIGHT_TIMEOUT)
+    try:
+        in_flight = cache.incr(STRIPE_IN_FLIGHT_KEY)
+    except ValueError:
+        cache.set(STRIPE_IN_FLIGHT_KEY, 1, timeout=STRIPE_IN_FLIGHT_TIMEOUT)
+        in_flight = 1
+    try:
+        if in_flight > settings.STRIPE_MAX_IN_FLIGHT:
+            metrics.incr("ratelimit.shed.stripe")
+            logger.warning("stripe call shed", extra={"in_flight": in_flight})
+            raise StripeOverloaded
+        yield
+    finally:
+        try:
+            cache.decr(STRIPE_IN_FLIGHT_KEY)
+        except ValueError:
+            pass
+
+
+metrics.register(
+    "ratelimit.shed.stripe",
+    *(f"ratelimit.rejected.{scope}.{name}" for scope, buckets in settings.RATE_LIMITS.items() for name in buckets),
+)
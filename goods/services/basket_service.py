@@ -0,0 +1,88 @@
+from decimal import Decimal
+from typing import Optional
+
+from django.core.cache import cache
+
+from goods.models import Item
+
+BASKET_TIMEOUT = 60 * 60 * 24 * 7
+BASKET_MAX_QUANTITY = 99
+
+
+class BasketError(ValueError):
+    """Некорректное изменение корзины"""
+
+
+class Basket:
+    """
+    Корзина покупателя в кэше по ключу покупателя: {id товара: количество} и валюта корзины.
+    Пока покупатель выбирает товары, в БД ничего не пишется; заказ создаётся один раз при оформлении.
+    """
+
+    def __init__(self, buyer_key: Optional[str]):
+        self.key = f"basket_{buyer_key}" if buyer_key else None
+        data = cache.get(self.key) if self.key else None
+        data = data or {}
+        self.currency: Optional[str] = data.get("currency")
+        self.lines: dict[int, int] = data.get("lines", {})
+
+    def __bool__(self) -> bool:
+        return bool(self.lines)
+
+    def _check_quantity(self, quantity: int) -> None:
+        if not 1 <= quantity <= BASKET_MAX_QUANTITY:
+            raise BasketError(f"Количество должно быть от 1 до {BASKET_MAX_QUANTITY}")
+
+    def add(self, item: Item, quantity: int = 1) -> None:
+        """Добавляет товар или увеличивает его количество"""
+        if self.currency and item.currency != self.currency:
+            raise BasketError("Все товары в корзине должны быть в одной валюте")
+        new_quantity = self.lines.get(item.pk, 0) + quantity
+        self._check_quantity(new_quantity)
+        self.lines[item.pk] = new_quantity
+        self.currency = item.currency
+        self.save()
+
+    def update(self, item_id: int, quantity: int) -> None:
+        """Устанавливает количество товара; 0 убирает товар из корзины"""
+        if item_id not in self.lines:
+            raise BasketError("Товара нет в корзине")
+        if quantity == 0:
+            self.remove(item_id)
+            return
+        self._check_quantity(quantity)
+        self.lines[item_id] = quantity
+        self.save()
+
+    def remove(self, item_id: int) -> None:
+        self.lines.pop(item_id, None)
+        if not self.lines:
+            self.currency = None
+        self.save()
+
+    def clear(self) -> None:
+        self.lines = {}
+        self.currency = None
+        if self.key:
+            cache.delete(self.key)
+
+    def save(self) -> None:
+        if self.key:
+            cache.set(self.key, {"currency": self.currency, "lines": self.lines}, timeout=BASKET_TIMEOUT)
+
+    def get_items(self) -> list[tuple[Item, int]]:
+        """Товары корзины с количеством одним запросом; удалённые из каталога товары пропускаются"""
+        items = Item.objects.in_bulk(list(self.lines))
+        return [(items[item_id], quantity) for item_id, quantity in self.lines.items() if item_id in items]
+
+    def as_dict(self) -> dict:
+        lines = self.get_items()
+        total = sum((item.price * quantity for item, quantity in lines), Decimal("0"))
+        return {
+            "items": [
+                {"id": item.pk, "name": item.name, "price": str(item.price), "quantity": quantity}
+                for item, quantity in lines
+            ],
+            "currency": self.currency,
+            "total": str(total),
+        }
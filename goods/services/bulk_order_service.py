@@ -0,0 +1,170 @@
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from goods.models import Discount, Item, Order, OrderItem, Tax
+from goods.ratelimit import StripeOverloaded, stripe_call_slot
+from goods.services.basket_service import BASKET_MAX_QUANTITY
+from goods.services.stripe_client import get_stripe
+from goods.services.stripe_service import StripeService
+from goods.utils import convert_price
+
+logger = logging.getLogger(__name__)
+
+# Ограничения одного оптового запроса
+BULK_ORDER_MAX_ORDERS = 500
+BULK_ORDER_MAX_LINES = 100
+REFERENCE_MAX_LENGTH = 64
+
+
+class BulkOrderError(ValueError):
+    """Некорректный оптовый запрос целиком"""
+
+
+@dataclass
+class BulkBasket:
+    """Корзина оптового запроса: номер заказа покупателя и количество по id товара"""
+    reference: str
+    quantities: dict[int, int]
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_bulk_orders(data) -> list[BulkBasket]:
+    """
+    Разбирает {"orders": [{"reference": "PO-1", "items": [{"id": 1, "quantity": 2}]}]}.
+    Ошибки формата отклоняют весь запрос; отсутствующие товары и разные валюты — только свой заказ.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("orders"), list) or not data["orders"]:
+        raise BulkOrderError('Ожидается {"orders": [{"reference": "...", "items": [{"id": 1, "quantity": 1}]}]}')
+    if len(data["orders"]) > BULK_ORDER_MAX_ORDERS:
+        raise BulkOrderError(f"Не больше {BULK_ORDER_MAX_ORDERS} заказов в одном запросе")
+
+    baskets = []
+    references = set()
+    for entry in data["orders"]:
+        reference = entry.get("reference") if isinstance(entry, dict) else None
+        if not isinstance(reference, str) or not 1 <= len(reference) <= REFERENCE_MAX_LENGTH:
+            raise BulkOrderError(f"reference заказа — строка от 1 до {REFERENCE_MAX_LENGTH} символов")
+        if reference in references:
+            raise BulkOrderError(f"reference {reference} повторяется")
+        references.add(reference)
+
+        lines = entry.get("items")
+        if not isinstance(lines, list) or not 1 <= len(lines) <= BULK_ORDER_MAX_LINES:
+            raise BulkOrderError(f"Заказ {reference}: от 1 до {BULK_ORDER_MAX_LINES} позиций")
+        quantities = {}
+        for line in lines:
+            item_id = line.get("id") if isinstance(line, dict) else None
+            quantity = line.get("quantity", 1) if isinstance(line, dict) else None
+            if not _is_int(item_id) or not _is_int(quantity) or not 1 <= quantity <= BASKET_MAX_QUANTITY:
+                raise BulkOrderError(
+                    f"Заказ {reference}: позиция — id товара и количество от 1 до {BASKET_MAX_QUANTITY}")
+            quantities[item_id] = quantities.get(item_id, 0) + quantity
+            if quantities[item_id] > BASKET_MAX_QUANTITY:
+                raise BulkOrderError(f"Заказ {reference}: количество товара больше {BASKET_MAX_QUANTITY}")
+        baskets.append(BulkBasket(reference, quantities))
+    return baskets
+
+
+def _request_intent(service: StripeService) -> tuple[Optional[object], Optional[str]]:
+    """Создает Payment Intent в потоке пула; БД не трогает. Возвращает (intent, None) или (None, ошибка)."""
+    stripe = get_stripe()
+    try:
+        with stripe_call_slot():
+            return service.request_payment_intent(idempotent=True), None
+    except StripeOverloaded:
+        return None, "Платежная система перегружена, повторите запрос позже"
+    except stripe.error.StripeError as e:
+        logger.warning("bulk payment intent failed", extra={"order_id": service.order.pk, "error": str(e)})
+        return None, "Ошибка платежной системы, повторите запрос"
+
+
+def _request_intents(services: list[StripeService]) -> list[tuple[Optional[object], Optional[str]]]:
+    """
+    Создает Payment Intent параллельно, не больше STRIPE_BULK_CONCURRENCY одновременных вызовов Stripe.
+    Каждая задача выполняется в копии контекста запроса, чтобы request_id попал в лог и metadata.
+    """
+    if not services:
+        return []
+    workers = min(settings.STRIPE_BULK_CONCURRENCY, len(services))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _request_intent, service) for service in services]
+        return [future.result() for future in futures]
+
+
+def _new_orders(baskets: list[BulkBasket], items: dict[int, Item], session_key: str, discount: Optional[Discount],
+                tax: Optional[Tax], results: dict[str, dict]) -> list[tuple[Order, dict[int, int]]]:
+    """Заказы для корзин с существующими товарами в одной валюте; ошибки остальных пишутся в results"""
+    orders = []
+    for basket in baskets:
+        missing = sorted(item_id for item_id in basket.quantities if item_id not in items)
+        if missing:
+            results[basket.reference] = {"reference": basket.reference, "error": f"Товары не найдены: {missing}"}
+            continue
+        currencies = {items[item_id].currency for item_id in basket.quantities}
+        if len(currencies) > 1:
+            results[basket.reference] = {"reference": basket.reference,
+                                         "error": "Все товары в заказе должны быть в одной валюте"}
+            continue
+        order = Order(session_key=session_key, reference=basket.reference, discount=discount, tax=tax,
+                      currency=currencies.pop())
+        orders.append((order, basket.quantities))
+    return orders
+
+
+def create_bulk_orders(baskets: list[BulkBasket], session_key: str, discount: Optional[Discount] = None,
+                       tax: Optional[Tax] = None) -> list[dict]:
+    """
+    Создает заказы оптового покупателя: товары и уже созданные заказы читаются двумя запросами,
+    новые заказы и позиции пишутся двумя bulk_create, Payment Intent создаются в пуле потоков.
+    Повторная отправка reference возвращает уже созданный заказ и (по ключу идемпотентности) его Payment Intent.
+    Возвращает результаты в порядке корзин.
+    """
+    items = Item.objects.in_bulk({item_id for basket in baskets for item_id in basket.quantities})
+    existing = {order.reference: order.pk for order in Order.objects.only("id", "reference").filter(
+        session_key=session_key, reference__in=[basket.reference for basket in baskets])}
+
+    results: dict[str, dict] = {}
+    new = _new_orders([basket for basket in baskets if basket.reference not in existing], items,
+                      session_key, discount, tax, results)
+    try:
+        with transaction.atomic():
+            Order.objects.bulk_create([order for order, _ in new])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, item_id=item_id, quantity=quantity,
+                          unit_amount=convert_price(items[item_id].price))
+                for order, quantities in new for item_id, quantity in quantities.items()
+            ])
+    except IntegrityError:
+        raise BulkOrderError("Заказы с этими reference создаются параллельным запросом, повторите запрос")
+
+    order_ids = list(existing.values()) + [order.pk for order, _ in new]
+    orders = list(Order.objects.filter(pk__in=order_ids).select_related("discount", "tax")
+                  .prefetch_related("items", "lines"))
+    payable = [order for order in orders if order.status == "Created"]
+    for order in orders:
+        results[order.reference] = {"reference": order.reference, "orderId": order.pk, "status": order.status}
+
+    changed = []
+    services = [StripeService(order=order) for order in payable]
+    for order, (intent, error) in zip(payable, _request_intents(services)):
+        if error:
+            results[order.reference]["error"] = error
+            continue
+        results[order.reference]["clientSecret"] = intent.client_secret
+        if order.payment_intent_id != intent.id:
+            order.payment_intent_id = intent.id
+            changed.append(order)
+    Order.objects.bulk_update(changed, ["payment_intent_id"])
+
+    logger.info("bulk orders", extra={"orders": len(baskets), "new_orders": len(new), "reused_orders": len(existing),
+                                      "intents": len(payable)})
+    return [results[basket.reference] for basket in baskets]
@@ -0,0 +1,45 @@
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Count, F, QuerySet
+
+from goods.local_cache import ALL, invalidate
+from goods.models import Category, Item, path_ids
+
+# Сколько товаров показывается на странице категории
+CATEGORY_PAGE_SIZE = 24
+
+
+def adjust_item_count(category_id: Optional[int], delta: int) -> None:
+    """Изменяет счётчики товаров категории и всех её предков двумя UPDATE по id из пути."""
+    if category_id is None:
+        return
+    path = Category.objects.filter(pk=category_id).values_list("path", flat=True).first()
+    if path is None:
+        return
+    Category.objects.filter(pk=category_id).update(item_count=F("item_count") + delta)
+    Category.objects.filter(pk__in=path_ids(path)).update(total_item_count=F("total_item_count") + delta)
+    invalidate("category", ALL)
+
+
+def subtree_items(category: Category, after: int = 0, limit: int = CATEGORY_PAGE_SIZE) -> QuerySet:
+    """Товары всего поддерева категории после товара after (keyset-пагинация по id), одним запросом."""
+    subtree = Category.objects.filter(path__startswith=category.path).values("pk")
+    return Item.objects.filter(category_id__in=subtree, id__gt=after).order_by("id")[:limit]
+
+
+def recount_categories() -> int:
+    """Пересчитывает счётчики товаров всех категорий с нуля (после массовых изменений в обход сигналов)."""
+    direct = dict(Item.objects.filter(category__isnull=False).values("category")
+                  .annotate(count=Count("id")).values_list("category", "count"))
+    categories = list(Category.objects.only("id", "path"))
+    totals = dict.fromkeys((category.pk for category in categories), 0)
+    for category in categories:
+        for ancestor_id in path_ids(category.path):
+            totals[ancestor_id] += direct.get(category.pk, 0)
+    for category in categories:
+        category.item_count, category.total_item_count = direct.get(category.pk, 0), totals[category.pk]
+    with transaction.atomic():
+        Category.objects.bulk_update(categories, ["item_count", "total_item_count"], batch_size=1000)
+    invalidate("category", ALL)
+    return len(categories)
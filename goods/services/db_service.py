@@ -1,35 +1,89 @@
+import logging
 from typing import Optional
 
-from goods.models import Item, Order, Discount, Tax
+from django.db import transaction
+from django.db.models import QuerySet
+
+from goods.models import Item, Order, OrderItem, Discount, Tax, PromoCode
+from goods.services.fx_service import unit_amounts
+from goods.services.promo_service import check_promo_code_available
+
+logger = logging.getLogger(__name__)
+
+
+def reusable_orders(session_key: str, discount: Optional[Discount] = None, tax: Optional[Tax] = None,
+                    promo_code: Optional[PromoCode] = None, currency: Optional[str] = None) -> QuerySet:
+    """
+    Неоплаченные заказы покупателя с теми же скидкой, сбором и промокодом (индекс session_key, status).
+    Заказы оптовых запросов (с reference) принадлежат своей корзине и не переиспользуются.
+    """
+    qs = Order.objects.filter(status="Created", session_key=session_key, discount=discount, tax=tax,
+                              promo_code=promo_code, reference="")
+    return qs.filter(currency=currency) if currency else qs
 
 
 def get_order_by_user_data(items: list[Item], session_key: str, discount: Optional[Discount] = None,
-                           tax: Optional[Tax] = None) -> Order | None:
-    """Проверяет есть ли заказ созданный заказ не находящийся в исполнении с этими данными"""
+                           tax: Optional[Tax] = None, quantities: Optional[dict[int, int]] = None,
+                           promo_code: Optional[PromoCode] = None, currency: Optional[str] = None,
+                           amounts: Optional[dict[int, int]] = None) -> Order | None:
+    """
+    Проверяет есть ли заказ созданный заказ не находящийся в исполнении с этими данными.
+    amounts — текущие цены в центах: заказ, оформленный по другой цене или курсу, не переиспользуется.
+    """
     qs = (
-        Order.objects
-        .filter(status="Created", session_key=session_key, discount=discount, tax=tax).select_related('discount','tax').prefetch_related("items")
+        reusable_orders(session_key, discount, tax, promo_code, currency)
+        .select_related('discount','tax').prefetch_related("items", "lines")
     )
-    wanted = {item.pk for item in items}
+    quantities = quantities or {}
+    wanted = {item.pk: quantities.get(item.pk, 1) for item in items}
 
     for order in qs:
-        if {it.pk for it in order.items.all()} == wanted:
-            return order
+        lines = order.lines.all()
+        if {line.item_id: line.quantity for line in lines} != wanted:
+            continue
+        if amounts and any(line.unit_amount not in (None, amounts[line.item_id]) for line in lines):
+            continue
+        logger.debug("order reused", extra={"order_id": order.pk})
+        return order
 
 
 def create_or_get_order(items: list[Item], session_key: str, discount: Optional[Discount] = None,
-                        tax: Optional[Tax] = None) -> Order:
-    """Создает заказ по списку товаров, применяет скидку и сбор, если они переданы"""
-    order = get_order_by_user_data(items, session_key, discount, tax)
+                        tax: Optional[Tax] = None, quantities: Optional[dict[int, int]] = None,
+                        promo_code: Optional[PromoCode] = None, currency: Optional[str] = None) -> Order:
+    """
+    Создает заказ по списку товаров, применяет скидку и сбор, если они переданы.
+    quantities — количество по id товара, по умолчанию 1.
+    promo_code — введённый промокод: новый заказ создается, только если у кода остались использования;
+    использование засчитывается при оплате заказа (redeem_paid_order).
+    currency — валюта показа: цены товаров в других валютах берутся из посчитанных по курсам ItemPrice,
+    без неё все товары должны быть в одной валюте. Цены позиций запоминаются в заказе.
+    """
+    if not currency:
+        currencies = {item.currency for item in items}
+        if len(currencies) > 1:
+            raise ValueError("Все товары в заказе должны быть в одной валюте")
+        currency = currencies.pop() if currencies else "usd"
+    amounts = unit_amounts(items, currency)
+
+    order = get_order_by_user_data(items, session_key, discount, tax, quantities, promo_code, currency, amounts)
     if not order:
-        order = Order.objects.create(session_key=session_key, discount=discount, tax=tax)
-        order.items.add(*items)
+        quantities = quantities or {}
+        if promo_code:
+            check_promo_code_available(promo_code)
+        with transaction.atomic():
+            order = Order.objects.create(session_key=session_key, discount=discount, tax=tax, promo_code=promo_code,
+                                         currency=currency)
+            OrderItem.objects.bulk_create(
+                [OrderItem(order=order, item=item, quantity=quantities.get(item.pk, 1), unit_amount=amounts[item.pk])
+                 for item in items]
+            )
 
         order = (
             Order.objects
             .select_related('discount', 'tax')
-            .prefetch_related('items')
+            .prefetch_related('items', 'lines')
             .get(pk=order.pk)
         )
+        logger.info("order created", extra={"order_id": order.pk, "item_ids": [item.pk for item in items]})
 
     return order
@@ -0,0 +1,146 @@
+import gzip
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from goods.models import FeedShard, Item
+
+# Каталог фидов внутри MEDIA_ROOT, откуда их отдает nginx
+FEEDS_DIR = "feeds"
+# Товар, сохранённый позже now - SETTLE_DELAY, пересоберётся и при следующем запуске:
+# его транзакция могла ещё не закоммититься, пока читалась часть
+SETTLE_DELAY = timedelta(minutes=1)
+ITERATOR_CHUNK_SIZE = 2000
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def feeds_root() -> Path:
+    return Path(settings.MEDIA_ROOT) / FEEDS_DIR
+
+
+def _shard_files(number: int) -> tuple[Path, Path]:
+    root = feeds_root()
+    return root / f"products-{number:05d}.xml.gz", root / f"sitemap-{number:05d}.xml.gz"
+
+
+def _absolute(url: str) -> str:
+    return settings.SITE_URL.rstrip("/") + url
+
+
+@contextmanager
+def _atomic_gzip(path: Path) -> Iterator[io.TextIOWrapper]:
+    """Пишет gzip во временный файл рядом и атомарно подменяет path: читатель видит старый или новый файл целиком."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as compressed:
+            with io.TextIOWrapper(compressed, encoding="utf-8") as out:
+                yield out
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _product_entry(item: Item) -> str:
+    return (
+        "<item>"
+        f"<g:id>{item.pk}</g:id>"
+        f"<title>{escape(item.name)}</title>"
+        f"<description>{escape(item.description)}</description>"
+        f"<link>{escape(_absolute(item.get_absolute_url()))}</link>"
+        f"<g:price>{item.price} {item.currency.upper()}</g:price>"
+        "</item>\n"
+    )
+
+
+def _sitemap_entry(item: Item) -> str:
+    return (f"<url><loc>{escape(_absolute(item.get_absolute_url()))}</loc>"
+            f"<lastmod>{item.updated_at.isoformat(timespec='seconds')}</lastmod></url>\n")
+
+
+def build_shard(number: int) -> int:
+    """
+    Собирает фид товаров и sitemap одной части за один проход по товарам через iterator():
+    в памяти держится только пачка из ITERATOR_CHUNK_SIZE товаров. Возвращает количество товаров.
+    """
+    size = settings.FEED_SHARD_SIZE
+    items = (Item.objects.filter(id__gte=number * size, id__lt=(number + 1) * size)
+             .only("id", "name", "description", "price", "currency", "updated_at")
+             .order_by("id").iterator(chunk_size=ITERATOR_CHUNK_SIZE))
+    products_path, sitemap_path = _shard_files(number)
+    count = 0
+    with _atomic_gzip(products_path) as products, _atomic_gzip(sitemap_path) as sitemap:
+        products.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                       '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>\n')
+        sitemap.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for item in items:
+            products.write(_product_entry(item))
+            sitemap.write(_sitemap_entry(item))
+            count += 1
+        products.write("</channel></rss>\n")
+        sitemap.write("</urlset>\n")
+    return count
+
+
+def _write_index(shards: list[FeedShard]) -> None:
+    """sitemap.xml — индекс частей sitemap для поисковиков; маленький, поэтому пишется при каждой сборке."""
+    path = feeds_root() / "sitemap.xml"
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    with os.fdopen(fd, "w", encoding="utf-8") as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                  '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for shard in shards:
+            url = f"{settings.MEDIA_URL}{FEEDS_DIR}/{_shard_files(shard.number)[1].name}"
+            out.write(f"<sitemap><loc>{escape(_absolute(url))}</loc>"
+                      f"<lastmod>{shard.built_at.isoformat(timespec='seconds')}</lastmod></sitemap>\n")
+        out.write("</sitemapindex>\n")
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def _current_shards() -> dict[int, tuple[int, datetime]]:
+    """Число товаров и последнее изменение по каждой части — один агрегирующий запрос."""
+    rows = (Item.objects.annotate(shard=F("id") / settings.FEED_SHARD_SIZE)
+            .values("shard").annotate(count=Count("id"), last=Max("updated_at")).order_by())
+    return {row["shard"]: (row["count"], row["last"]) for row in rows}
+
+
+def build_feeds(full: bool = False, progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Пересобирает части фида, в которых с прошлой сборки изменился, добавился или удалился товар
+    (с full — все части), удаляет опустевшие части и обновляет индекс. Возвращает количество пересобранных частей.
+    """
+    feeds_root().mkdir(parents=True, exist_ok=True)
+    watermark = timezone.now() - SETTLE_DELAY
+    built = {shard.number: shard for shard in FeedShard.objects.all()}
+    current = _current_shards()
+
+    stale = sorted(
+        number for number, (count, last) in current.items()
+        if full or number not in built or built[number].item_count != count or last > built[number].watermark
+    )
+    for done, number in enumerate(stale, start=1):
+        count = build_shard(number)
+        FeedShard.objects.update_or_create(number=number, defaults={"item_count": count, "watermark": watermark})
+        if progress:
+            progress(done, len(stale))
+
+    for number in set(built) - set(current):
+        for path in _shard_files(number):
+            path.unlink(missing_ok=True)
+        FeedShard.objects.filter(number=number).delete()
+
+    _write_index(list(FeedShard.objects.all()))
+    return len(stale)
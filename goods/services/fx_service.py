@@ -0,0 +1,142 @@
+import json
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from pathlib import Path
+from typing import Iterable, Optional
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.db import transaction
+
+from goods.local_cache import ALL, invalidate
+from goods.models import DISPLAY_CURRENCIES_CHOICES, ExchangeRate, Item, ItemPrice
+from goods.utils import convert_price
+
+# Валюты, в которых показываются цены и оформляются заказы
+CURRENCIES = tuple(code for code, _ in DISPLAY_CURRENCIES_CHOICES)
+# Сколько товаров пересчитывается одним bulk_create
+PRICE_BATCH_SIZE = 2000
+FX_FEED_TIMEOUT = 10
+CENT = Decimal("0.01")
+
+
+class FxError(ValueError):
+    """Некорректные курсы или нет цены товара в валюте заказа"""
+
+
+def parse_rates(data) -> dict[str, Decimal]:
+    """
+    Разбирает {"base": "usd", "rates": {"rub": "92.5", "eur": "0.92"}}: курс — сколько единиц валюты стоит
+    единица базовой. Валюты, которых нет в DISPLAY_CURRENCIES_CHOICES, пропускаются.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("rates"), dict):
+        raise FxError('Ожидается {"base": "usd", "rates": {"rub": "92.5"}}')
+    if data.get("base", settings.FX_BASE_CURRENCY) != settings.FX_BASE_CURRENCY:
+        raise FxError(f"Базовая валюта курсов должна быть {settings.FX_BASE_CURRENCY}")
+    rates = {}
+    for currency, value in data["rates"].items():
+        if currency not in CURRENCIES or currency == settings.FX_BASE_CURRENCY:
+            continue
+        try:
+            rate = Decimal(str(value))
+        except InvalidOperation:
+            raise FxError(f"Курс {currency} не число")
+        if not rate.is_finite() or rate <= 0:
+            raise FxError(f"Курс {currency} должен быть больше нуля")
+        rates[currency] = rate
+    return rates
+
+
+def read_rates_file(path: Path) -> dict[str, Decimal]:
+    with open(path, encoding="utf-8") as source:
+        return parse_rates(json.load(source))
+
+
+def fetch_rates(url: str) -> dict[str, Decimal]:
+    """Курсы из локального фида (JSON того же вида, что и файл)."""
+    with urlopen(url, timeout=FX_FEED_TIMEOUT) as response:
+        return parse_rates(json.load(response))
+
+
+def current_rates() -> dict[str, Decimal]:
+    """Курсы из таблицы exchange_rate вместе с базовой валютой (курс 1)."""
+    rates = dict(ExchangeRate.objects.values_list("currency", "rate"))
+    rates[settings.FX_BASE_CURRENCY] = Decimal(1)
+    return rates
+
+
+def update_rates(rates: dict[str, Decimal]) -> list[str]:
+    """Записывает изменившиеся курсы. Возвращает валюты, курс которых изменился."""
+    known = current_rates()
+    changed = [currency for currency, rate in rates.items() if known.get(currency) != rate]
+    ExchangeRate.objects.bulk_create([ExchangeRate(currency=currency, rate=rates[currency]) for currency in changed],
+                                     update_conflicts=True, unique_fields=["currency"],
+                                     update_fields=["rate", "updated_at"])
+    return changed
+
+
+def convert(amount: Decimal, from_currency: str, to_currency: str, rates: dict[str, Decimal]) -> Decimal:
+    """Переводит сумму через базовую валюту с округлением до цента."""
+    if from_currency == to_currency:
+        return amount
+    return (amount / rates[from_currency] * rates[to_currency]).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _item_prices(item: Item, rates: dict[str, Decimal]) -> list[ItemPrice]:
+    prices = []
+    for currency in CURRENCIES:
+        if item.currency not in rates or currency not in rates:
+            continue
+        amount = convert(item.price, item.currency, currency, rates)
+        prices.append(ItemPrice(item_id=item.pk, currency=currency, amount=amount, unit_amount=convert_price(amount)))
+    return prices
+
+
+def refresh_item_prices(item_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Пересчитывает цены товаров во всех валютах (с item_ids — только этих товаров) по текущим курсам.
+    Товары читаются через iterator(), цены пишутся upsert-ом пачками по PRICE_BATCH_SIZE.
+    Возвращает количество записанных цен.
+    """
+    rates = current_rates()
+    items = Item.objects.only("id", "price", "currency").order_by("id")
+    if item_ids is not None:
+        items = items.filter(id__in=list(item_ids))
+    written = 0
+    batch: list[ItemPrice] = []
+    with transaction.atomic():
+        for item in items.iterator(chunk_size=PRICE_BATCH_SIZE):
+            batch += _item_prices(item, rates)
+            if len(batch) >= PRICE_BATCH_SIZE:
+                written += _write_prices(batch)
+                batch = []
+        written += _write_prices(batch)
+        if item_ids is None:
+            ItemPrice.objects.exclude(currency__in=[currency for currency in CURRENCIES if currency in rates]).delete()
+    invalidate("item_price", ALL)
+    return written
+
+
+def _write_prices(prices: list[ItemPrice]) -> int:
+    ItemPrice.objects.bulk_create(prices, update_conflicts=True, unique_fields=["item", "currency"],
+                                  update_fields=["amount", "unit_amount"])
+    return len(prices)
+
+
+def display_prices(item_ids: list[int], currency: str) -> dict[int, Decimal]:
+    """Цены товаров в валюте показа одним запросом; товары без посчитанной цены в ответ не попадают."""
+    return dict(ItemPrice.objects.filter(item_id__in=item_ids, currency=currency).values_list("item_id", "amount"))
+
+
+def unit_amounts(items: list[Item], currency: str) -> dict[int, int]:
+    """
+    Цены товаров в центах валюты заказа. Товары в своей валюте не требуют запроса,
+    остальные берутся из посчитанных ItemPrice одним запросом.
+    """
+    amounts = {item.pk: convert_price(item.price) for item in items if item.currency == currency}
+    foreign = [item.pk for item in items if item.currency != currency]
+    if foreign:
+        amounts.update(ItemPrice.objects.filter(item_id__in=foreign, currency=currency)
+                       .values_list("item_id", "unit_amount"))
+        if len(amounts) < len(items):
+            raise FxError(f"Цены товаров в валюте {currency} пока недоступны")
+    return amounts
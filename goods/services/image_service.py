@@ -0,0 +1,89 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Optional
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, ImageOps
+
+from goods.local_cache import invalidate
+from goods.models import Item
+
+# Ширины вариантов изображения товара для srcset, в пикселях
+VARIANT_WIDTHS = (320, 640, 1024)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "progressive": True, "optimize": True}),
+}
+
+ImageVariants = dict[str, dict[str, str]]
+
+# Пул для обработки загруженных изображений, чтобы не держать запрос админки
+_upload_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="item-images")
+
+
+def variant_name(content_hash: str, width: int, fmt: str) -> str:
+    """Путь варианта адресуется содержимым оригинала: одинаковые картинки делят одни файлы."""
+    return f"items/variants/{content_hash[:2]}/{content_hash}/{width}.{fmt}"
+
+
+def _render_variant(image: Image.Image, width: int, fmt: str) -> bytes:
+    pil_format, options = VARIANT_FORMATS[fmt]
+    height = round(image.height * width / image.width)
+    resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    if pil_format == "JPEG" and resized.mode != "RGB":
+        resized = resized.convert("RGB")
+    buffer = BytesIO()
+    resized.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+def build_variants(name: str, known_hash: str = "") -> Optional[tuple[str, ImageVariants]]:
+    """
+    Создаёт варианты изображения всех ширин и форматов. Возвращает (хэш, варианты)
+    или None, если хэш оригинала совпал с known_hash и обрабатывать нечего.
+    """
+    with default_storage.open(name) as f:
+        data = f.read()
+    content_hash = hashlib.sha256(data).hexdigest()
+    if content_hash == known_hash:
+        return None
+
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    widths = [width for width in VARIANT_WIDTHS if width <= image.width] or [image.width]
+    variants: ImageVariants = {fmt: {} for fmt in VARIANT_FORMATS}
+    for width in widths:
+        for fmt in VARIANT_FORMATS:
+            path = variant_name(content_hash, width, fmt)
+            if not default_storage.exists(path):
+                default_storage.save(path, ContentFile(_render_variant(image, width, fmt)))
+            variants[fmt][str(width)] = path
+    return content_hash, variants
+
+
+def process_item_image(item_id: int, force: bool = False) -> bool:
+    """Обрабатывает изображение товара и сохраняет варианты. Возвращает False, если изображение не менялось."""
+    item = Item.objects.filter(pk=item_id).only("image", "image_hash").first()
+    if item is None or not item.image:
+        return False
+    result = build_variants(item.image.name, "" if force else item.image_hash)
+    if result is None:
+        return False
+    content_hash, variants = result
+    Item.objects.filter(pk=item_id).update(image_hash=content_hash, image_variants=variants)
+    invalidate("item", item_id)
+    return True
+
+
+def _process_in_background(item_id: int) -> None:
+    try:
+        process_item_image(item_id)
+    finally:
+        connection.close()
+
+
+def schedule_item_image(item_id: int) -> None:
+    """Ставит обработку изображения товара в пул потоков."""
+    _upload_pool.submit(_process_in_background, item_id)
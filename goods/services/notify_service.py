@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[str], None]
+
+# Как часто поток-слушатель выходит из ожидания, чтобы подписаться на новые каналы, в секундах
+LISTEN_POLL_INTERVAL = 1.0
+# Пауза перед переподключением слушателя после ошибки соединения, в секундах
+LISTEN_RECONNECT_DELAY = 5.0
+
+
+class NotificationHub:
+    """
+    Рассылка сообщений по каналам внутри процесса.
+    На PostgreSQL сообщения идут через NOTIFY, а один поток на процесс слушает LISTEN и раздаёт их подписчикам,
+    поэтому сообщение доходит до всех воркеров на всех нодах. На других СУБД рассылка только внутри процесса.
+    """
+
+    def __init__(self, database: str = "default"):
+        self.database = database
+        self._subscribers: dict[str, set[Callback]] = {}
+        self._lock = threading.Lock()
+        self._listener_pid: int | None = None
+
+    @property
+    def uses_postgres(self) -> bool:
+        return connections[self.database].vendor == "postgresql"
+
+    def subscribe(self, channel: str, callback: Callback) -> Callable[[], None]:
+        """Подписывает callback на канал. Возвращает функцию отписки."""
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(callback)
+            # поток слушателя не переживает fork воркера gunicorn, поэтому запускается в каждом процессе
+            if self.uses_postgres and self._listener_pid != os.getpid():
+                threading.Thread(target=self._listen_forever, name="notify-listener", daemon=True).start()
+                self._listener_pid = os.getpid()
+
+        def unsubscribe() -> None:
+            with self._lock:
+                self._subscribers.get(channel, set()).discard(callback)
+
+        return unsubscribe
+
+    def publish(self, channel: str, payload: str) -> None:
+        """Отправляет сообщение всем подписчикам канала во всех процессах."""
+        if self.uses_postgres:
+            with connections[self.database].cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [channel, payload])
+        else:
+            self.dispatch(channel, payload)
+
+    def dispatch(self, channel: str, payload: str) -> None:
+        """
+        Раздаёт сообщение подписчикам текущего процесса. Ошибка подписчика только логируется:
+        она не должна остановить поток слушателя или вернуться в запрос, который опубликовал сообщение.
+        """
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("notification subscriber failed", extra={"channel": channel, "payload": payload})
+
+    def _connect(self):
+        import psycopg
+
+        db = settings.DATABASES[self.database]
+        return psycopg.connect(
+            dbname=db["NAME"], user=db["USER"], password=db["PASSWORD"],
+            host=db["HOST"], port=db["PORT"], autocommit=True,
+        )
+
+    def _listen_forever(self) -> None:
+        import psycopg
+        from psycopg import sql
+
+        while True:
+            try:
+                with self._connect() as conn:
+                    listening: set[str] = set()
+                    while True:
+                        with self._lock:
+                            channels = set(self._subscribers)
+                        for channel in channels - listening:
+                            conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+                            listening.add(channel)
+                        for notify in conn.notifies(timeout=LISTEN_POLL_INTERVAL):
+                            self.dispatch(notify.channel, notify.payload)
+            except psycopg.OperationalError:
+                time.sleep(LISTEN_RECONNECT_DELAY)
+
+
+hub = NotificationHub()
@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import Iterable, Optional
+
+from django.db.models import QuerySet
+
+from goods.models import OrderStatusEvent
+
+
+def status_event(order_id: int, from_status: str, to_status: str, source: str,
+                 stripe_event_id: str = "", occurred_at: Optional[datetime] = None) -> OrderStatusEvent:
+    """Событие смены статуса для record_status_events; время по умолчанию — сейчас."""
+    event = OrderStatusEvent(order_id=order_id, from_status=from_status, to_status=to_status, source=source,
+                             stripe_event_id=stripe_event_id or "")
+    if occurred_at:
+        event.occurred_at = occurred_at
+    return event
+
+
+def record_status_events(events: Iterable[OrderStatusEvent]) -> None:
+    """Добавляет события одним INSERT. Вызывается в транзакции, которая меняет статус заказов."""
+    OrderStatusEvent.objects.bulk_create(list(events), batch_size=1000)
+
+
+def order_timeline(order_id: int) -> list[dict]:
+    """
+    История статусов заказа по времени — только из покрывающего индекса (order_id, occurred_at):
+    все выбранные поля и id для порядка входят в его INCLUDE.
+    """
+    return list(OrderStatusEvent.objects.filter(order_id=order_id).order_by("occurred_at", "id")
+                .values("occurred_at", "from_status", "to_status", "source", "stripe_event_id"))
+
+
+def status_events_between(since: datetime, until: datetime, to_status: Optional[str] = None) -> QuerySet:
+    """
+    События с occurred_at в [since, until). Диапазон отсекается BRIN индексом по времени,
+    поэтому стоимость зависит от размера окна, а не от всей таблицы.
+    """
+    events = OrderStatusEvent.objects.filter(occurred_at__gte=since, occurred_at__lt=until)
+    if to_status:
+        events = events.filter(to_status=to_status)
+    return events
+
+
+def orders_transitioned(since: datetime, until: datetime, to_status: Optional[str] = None,
+                        after: int = 0, limit: int = 1000) -> list[int]:
+    """id заказов, сменивших статус (на to_status) в окне [since, until), по возрастанию id после after."""
+    return list(status_events_between(since, until, to_status).filter(order_id__gt=after)
+                .order_by("order_id").values_list("order_id", flat=True).distinct()[:limit])
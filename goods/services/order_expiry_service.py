@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+from django.db import transaction
+from django.db.models import QuerySet
+
+from goods.models import Order, ArchivedOrder
+from goods.services.order_event_service import record_status_events, status_event
+from goods.services.order_status_service import publish_order_status
+from goods.services.stripe_service import StripeService
+
+ARCHIVE_STATUSES = ("Done", "Expired")
+
+ProgressCallback = Callable[[int], None]
+
+
+def _iter_batches(qs: QuerySet, batch_size: int) -> Iterator[list[Order]]:
+    """Отдает заказы пачками по возрастанию id (keyset-пагинация, без OFFSET)."""
+    last_id = 0
+    while True:
+        batch = list(qs.filter(id__gt=last_id).order_by("id")[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def expire_stale_orders(created_before: datetime, batch_size: int = 500, workers: int = 8,
+                        progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Переводит заказы в статусе Created, созданные раньше created_before, в статус Expired.
+    Payment Intent каждого заказа отменяется в Stripe параллельно; если Stripe отказал, заказ не трогаем.
+    Возвращает количество истёкших заказов.
+    """
+    qs = Order.objects.filter(status="Created", created_at__lt=created_before).only("id", "payment_intent_id")
+    expired = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in _iter_batches(qs, batch_size):
+            with_intent = [order for order in batch if order.payment_intent_id]
+            results = pool.map(StripeService.cancel_payment_intent, [order.payment_intent_id for order in with_intent])
+            cancelled = {order.id for order, ok in zip(with_intent, results) if ok}
+            ids = [order.id for order in batch if not order.payment_intent_id or order.id in cancelled]
+            with transaction.atomic():
+                # блокируем заказы, чтобы журнал содержал ровно те, что перешли в Expired (вебхук мог успеть раньше)
+                ids = list(Order.objects.select_for_update().filter(id__in=ids, status="Created")
+                           .values_list("id", flat=True))
+                expired += Order.objects.filter(id__in=ids).update(status="Expired")
+                record_status_events(status_event(order_id, "Created", "Expired", "expiry") for order_id in ids)
+                for order_id in ids:
+                    publish_order_status(order_id, "Expired")
+            if progress:
+                progress(expired)
+    return expired
+
+
+def archive_orders(created_before: datetime, batch_size: int = 500,
+                   progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Переносит выполненные и истёкшие заказы, созданные раньше created_before, в таблицу order_archive.
+    Каждая пачка переносится в отдельной короткой транзакции. Возвращает количество перенесённых заказов.
+    """
+    qs = Order.objects.filter(status__in=ARCHIVE_STATUSES, created_at__lt=created_before).order_by("id")
+    through = Order.items.through
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(qs.select_for_update(skip_locked=True)[:batch_size])
+            if not batch:
+                break
+            ids = [order.id for order in batch]
+            item_quantities: dict[int, dict[str, int]] = {}
+            lines = through.objects.filter(order_id__in=ids).values_list("order_id", "item_id", "quantity")
+            for order_id, item_id, quantity in lines:
+                item_quantities.setdefault(order_id, {})[str(item_id)] = quantity
+
+            ArchivedOrder.objects.bulk_create(
+                [
+                    ArchivedOrder(
+                        order_id=order.id,
+                        created_at=order.created_at,
+                        status=order.status,
+                        currency=order.currency or "",
+                        session_key=order.session_key,
+                        discount_id=order.discount_id,
+                        tax_id=order.tax_id,
+                        item_ids=sorted(int(item_id) for item_id in item_quantities.get(order.id, {})),
+                        item_quantities=item_quantities.get(order.id, {}),
+                        payment_intent_id=order.payment_intent_id,
+                    )
+                    for order in batch
+                ],
+                ignore_conflicts=True,
+            )
+            through.objects.filter(order_id__in=ids).delete()
+            Order.objects.filter(id__in=ids).delete()
+        archived += len(batch)
+        if progress:
+            progress(archived)
+    return archived
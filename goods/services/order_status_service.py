@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from typing import Callable, Optional
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+from goods.models import Order
+from goods.services.notify_service import hub
+
+ORDER_STATUS_CHANNEL = "order_status"
+ORDER_STATUS_CACHE_TIMEOUT = 60 * 60
+# Интервал keep-alive комментариев и максимальная длительность SSE потока, в секундах
+STREAM_KEEPALIVE = 15
+STREAM_TIMEOUT = 300
+# Через сколько секунд браузер переподключается к закрытому потоку (поле retry)
+STREAM_RETRY = 3
+
+
+def _cache_key(order_id: int) -> str:
+    return f"order_status_{order_id}"
+
+
+def get_order_status(order_id: int) -> Optional[str]:
+    """Возвращает статус заказа из кэша, при промахе — из БД."""
+    status = cache.get(_cache_key(order_id))
+    if status is None:
+        status = Order.objects.filter(pk=order_id).values_list("status", flat=True).first()
+        if status is not None:
+            cache.set(_cache_key(order_id), status, timeout=ORDER_STATUS_CACHE_TIMEOUT)
+    return status
+
+
+def publish_order_status(order_id: int, status: str) -> None:
+    """После коммита транзакции обновляет статус в кэше и оповещает ожидающих клиентов во всех воркерах."""
+
+    def publish():
+        cache.set(_cache_key(order_id), status, timeout=ORDER_STATUS_CACHE_TIMEOUT)
+        hub.publish(ORDER_STATUS_CHANNEL, f"{order_id}:{status}")
+
+    transaction.on_commit(publish)
+
+
+class OrderStatusWaiters:
+    """Ожидающие смены статуса клиенты текущего процесса, сгруппированные по заказу. Одна подписка на канал."""
+
+    def __init__(self):
+        self._waiters: dict[int, set[Callable[[str], None]]] = {}
+        self._lock = threading.Lock()
+        self._subscribed = False
+
+    def add(self, order_id: int, callback: Callable[[str], None]) -> Callable[[], None]:
+        with self._lock:
+            if not self._subscribed:
+                hub.subscribe(ORDER_STATUS_CHANNEL, self._on_message)
+                self._subscribed = True
+            self._waiters.setdefault(order_id, set()).add(callback)
+
+        def remove() -> None:
+            with self._lock:
+                callbacks = self._waiters.get(order_id)
+                if callbacks is not None:
+                    callbacks.discard(callback)
+                    if not callbacks:
+                        del self._waiters[order_id]
+
+        return remove
+
+    def _on_message(self, payload: str) -> None:
+        order_id, _, status = payload.partition(":")
+        with self._lock:
+            callbacks = list(self._waiters.get(int(order_id), ()))
+        for callback in callbacks:
+            callback(status)
+
+
+waiters = OrderStatusWaiters()
+
+
+async def await_status_change(order_id: int, since: str, timeout: float) -> Optional[str]:
+    """Асинхронное ожидание смены статуса для SSE: не занимает поток, пока клиент ждёт."""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    remove = waiters.add(order_id, lambda status: status != since and loop.call_soon_threadsafe(changed.set))
+    try:
+        status = await sync_to_async(get_order_status)(order_id)
+        if status != since:
+            return status
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await sync_to_async(get_order_status)(order_id)
+    finally:
+        remove()
@@ -0,0 +1,107 @@
+import logging
+import random
+import re
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from goods import metrics
+from goods.local_cache import local_cache
+from goods.models import Order, PromoCode, PromoCodeCounter
+
+logger = logging.getLogger(__name__)
+
+# Допустимый вид кода; всё остальное отклоняется без обращения к кэшу и БД
+PROMO_CODE_RE = re.compile(r"^[A-Za-z0-9_-]{3,64}$")
+
+
+class PromoCodeError(ValueError):
+    """Промокод не найден, не действует или исчерпан"""
+
+
+def _load_promo_code(code: str) -> PromoCode | None:
+    return PromoCode.objects.select_related("discount").filter(code__iexact=code).first()
+
+
+def find_promo_code(code: str) -> PromoCode:
+    """
+    Промокод по введённому коду без учёта регистра. Ответ, в том числе «такого кода нет», кэшируется в памяти воркера,
+    поэтому перебор несуществующих кодов не доходит до БД; изменение промокодов сбрасывает кэш всех воркеров.
+    """
+    code = (code or "").strip()
+    if not PROMO_CODE_RE.match(code):
+        raise PromoCodeError("Промокод не найден")
+    promo = local_cache.get_or_load("promo_code", code.upper(), lambda: _load_promo_code(code), cache_none=True)
+    if promo is None or not promo.is_active:
+        raise PromoCodeError("Промокод не найден")
+    if promo.expires_at and promo.expires_at <= timezone.now():
+        raise PromoCodeError("Срок действия промокода истёк")
+    return promo
+
+
+def _split_limit(max_uses: int, shards: int) -> list[int]:
+    return [max_uses // shards + (1 if shard < max_uses % shards else 0) for shard in range(shards)]
+
+
+def sync_counters(promo: PromoCode) -> None:
+    """
+    Создает недостающие части счётчика и делит между ними лимит (сумма лимитов частей равна max_uses).
+    Части не удаляются: в них уже учтены использования.
+    """
+    if promo.max_uses is None:
+        return
+    existing = set(promo.counters.values_list("shard", flat=True))
+    shards = max([promo.counter_shards, *(shard + 1 for shard in existing)])
+    PromoCodeCounter.objects.bulk_create([PromoCodeCounter(promo_code=promo, shard=shard)
+                                          for shard in range(shards) if shard not in existing])
+    for shard, limit in enumerate(_split_limit(promo.max_uses, shards)):
+        PromoCodeCounter.objects.filter(promo_code=promo, shard=shard).exclude(limit=limit).update(limit=limit)
+
+
+def redeem_promo_code(promo: PromoCode) -> None:
+    """
+    Занимает одно использование промокода в текущей транзакции.
+    Части счётчика с остатком перебираются в случайном порядке, каждая — условным UPDATE used = used + 1
+    WHERE used < limit: лимит не превышается при любом числе одновременных покупок, а блокировки
+    расходятся по разным строкам. Для промокода без лимита ничего не пишется.
+    """
+    if promo.max_uses is None:
+        return
+    counters = PromoCodeCounter.objects.filter(promo_code=promo)
+    shards = list(counters.filter(used__lt=F("limit")).values_list("shard", flat=True))
+    random.shuffle(shards)
+    for shard in shards:
+        if counters.filter(shard=shard, used__lt=F("limit")).update(used=F("used") + 1):
+            return
+    raise PromoCodeError("Лимит использований промокода исчерпан")
+
+
+def check_promo_code_available(promo: PromoCode) -> None:
+    """Проверяет без блокировок, что у промокода остались использования; само использование засчитывает оплата."""
+    if promo.max_uses is not None and not promo.counters.filter(used__lt=F("limit")).exists():
+        raise PromoCodeError("Лимит использований промокода исчерпан")
+
+
+def redeem_paid_order(order: Order) -> None:
+    """
+    Засчитывает использование промокода заказа. Вызывается один раз, в транзакции перехода заказа в оплаченный статус,
+    поэтому брошенные и истёкшие заказы лимит не тратят. Деньги к этому моменту уже получены: если лимит успели
+    исчерпать заказы, открытые одновременно с этим, использование засчитывается сверх лимита с предупреждением.
+    """
+    promo = PromoCode.objects.filter(pk=order.promo_code_id).first() if order.promo_code_id else None
+    if promo is None:
+        return
+    try:
+        redeem_promo_code(promo)
+    except PromoCodeError:
+        PromoCodeCounter.objects.filter(promo_code=promo, shard=0).update(used=F("used") + 1)
+        metrics.incr("promo.over_limit")
+        logger.warning("promo code redeemed over limit", extra={"order_id": order.pk, "promo_code": promo.code})
+
+
+def promo_code_usage(promo: PromoCode) -> int:
+    """Сколько раз использован промокод с лимитом"""
+    return promo.counters.aggregate(used=Sum("used"))["used"] or 0
+
+
+metrics.register("promo.over_limit")
@@ -0,0 +1,177 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import partial
+from itertools import permutations
+from typing import Callable, Iterable, Iterator, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max, Q, QuerySet
+from django.utils import timezone
+
+from goods.edge_cache import refresh_pages
+from goods.models import Item, ItemCooccurrence, Order, OrderItem, RecommendationRun, RelatedItem
+from goods.services.sales_service import PAID_STATUSES
+
+# Сколько товаров «часто покупают вместе» хранится и показывается для каждого товара
+RELATED_ITEMS_LIMIT = 4
+RELATED_CACHE_TIMEOUT = 60 * 60
+# Заказы, оплаченные позже now - SETTLE_DELAY, ждут следующего запуска: транзакция вебхука могла ещё не закоммититься
+SETTLE_DELAY = timedelta(minutes=1)
+
+ProgressCallback = Callable[[int], None]
+
+
+def related_items_cache_key(item_id: int) -> str:
+    return f"related_items_{item_id}"
+
+
+def get_related_items(item_id: int) -> list[Item]:
+    """Рекомендуемые товары из кэша, иначе одним запросом по индексу (item, rank)."""
+    key = related_items_cache_key(item_id)
+    items = cache.get(key)
+    if items is None:
+        items = [rel.related for rel in RelatedItem.objects.filter(item_id=item_id).select_related("related")]
+        cache.set(key, items, timeout=RELATED_CACHE_TIMEOUT)
+    return items
+
+
+def forget_related_items(item_ids: Iterable[int]) -> None:
+    """Сбрасывает кэш рекомендаций товаров, чтобы страница собрала их заново."""
+    cache.delete_many([related_items_cache_key(item_id) for item_id in item_ids])
+
+
+def refresh_item_pages(item_ids: list[int]) -> None:
+    """Сбрасывает кэш рекомендаций товаров и обновляет их страницы в кэше nginx (goods.edge_cache)."""
+    forget_related_items(item_ids)
+    refresh_pages(item_ids)
+
+
+def _iter_baskets(orders: QuerySet, batch_size: int) -> Iterator[list[list[int]]]:
+    """Отдает товары заказов пачками: по batch_size заказов, keyset-пагинация по id."""
+    last_id = 0
+    while True:
+        ids = list(orders.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return
+        baskets = defaultdict(list)
+        for order_id, item_id in OrderItem.objects.filter(order_id__in=ids).values_list("order_id", "item_id"):
+            baskets[order_id].append(item_id)
+        yield list(baskets.values())
+        last_id = ids[-1]
+
+
+def _count_pairs(baskets: Iterable[list[int]], counts: Counter, item_range: Optional[range] = None) -> None:
+    """
+    Добавляет в counts пары товаров из одного заказа (в обе стороны).
+    Ключ — кортеж (a, b): id товаров BigAutoField и в 32 бита не упаковываются.
+    item_range ограничивает первый товар пары, чтобы полный пересчёт укладывался в память по частям.
+    """
+    for basket in baskets:
+        for pair in permutations(set(basket), 2):
+            if item_range is None or pair[0] in item_range:
+                counts[pair] += 1
+
+
+def _cooccurrence_rows(counts: Counter) -> Iterator[ItemCooccurrence]:
+    for (item_id, related_id), count in counts.items():
+        yield ItemCooccurrence(item_id=item_id, related_id=related_id, count=count)
+
+
+def _add_counts(counts: Counter) -> None:
+    """Прибавляет счётчики пар к item_cooccurrence."""
+    missing = []
+    for row in _cooccurrence_rows(counts):
+        updated = (ItemCooccurrence.objects.filter(item_id=row.item_id, related_id=row.related_id)
+                   .update(count=F("count") + row.count))
+        if not updated:
+            missing.append(row)
+    ItemCooccurrence.objects.bulk_create(missing)
+
+
+def _refresh_related(item_ids: Iterable[int], limit: int, batch_size: int) -> None:
+    """
+    Пересчитывает top-N рекомендаций для товаров по счётчикам. После коммита у товаров, чьи рекомендации
+    изменились, сбрасывается кэш рекомендаций и обновляются страницы в кэше nginx.
+    """
+    item_ids = sorted(Item.objects.filter(pk__in=list(item_ids)).values_list("pk", flat=True))
+    existing = Item.objects.values("pk")
+    for start in range(0, len(item_ids), batch_size):
+        chunk = item_ids[start:start + batch_size]
+        rows = []
+        for item_id in chunk:
+            top = (ItemCooccurrence.objects.filter(item_id=item_id, related_id__in=existing)
+                   .order_by("-count", "related_id")[:limit])
+            rows += [RelatedItem(item_id=item_id, related_id=pair.related_id, score=pair.count, rank=rank)
+                     for rank, pair in enumerate(top)]
+        with transaction.atomic():
+            old = defaultdict(list)
+            for item_id, related_id in (RelatedItem.objects.filter(item_id__in=chunk).order_by("item_id", "rank")
+                                        .values_list("item_id", "related_id")):
+                old[item_id].append(related_id)
+            RelatedItem.objects.filter(item_id__in=chunk).delete()
+            RelatedItem.objects.bulk_create(rows)
+        new = defaultdict(list)
+        for row in rows:
+            new[row.item_id].append(row.related_id)
+        # на странице видны только рекомендованные товары и их порядок, изменение score её не меняет
+        changed = [item_id for item_id in chunk if old[item_id] != new[item_id]]
+        if changed:
+            transaction.on_commit(partial(refresh_item_pages, changed))
+
+
+def rebuild_recommendations(batch_size: int = 1000, items_per_pass: int = 10000, limit: int = RELATED_ITEMS_LIMIT,
+                            progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Полный пересчёт: счётчики строятся заново по всем оплаченным заказам.
+    Память ограничена: заказы читаются пачками, а пары считаются за несколько проходов по диапазонам
+    items_per_pass id товаров. Возвращает количество обработанных заказов.
+    """
+    paid_before = timezone.now() - SETTLE_DELAY
+    orders = Order.objects.filter(Q(paid_at__lt=paid_before) | Q(paid_at__isnull=True), status__in=PAID_STATUSES)
+    max_item_id = Item.objects.aggregate(last=Max("pk"))["last"] or 0
+
+    ItemCooccurrence.objects.all().delete()
+    processed = 0
+    for lo in range(0, max_item_id + 1, items_per_pass):
+        counts = Counter()
+        processed = 0
+        for baskets in _iter_baskets(orders, batch_size):
+            _count_pairs(baskets, counts, range(lo, lo + items_per_pass))
+            processed += len(baskets)
+        ItemCooccurrence.objects.bulk_create(_cooccurrence_rows(counts), batch_size=batch_size)
+        if progress:
+            progress(processed)
+
+    _refresh_related(Item.objects.values_list("pk", flat=True), limit, batch_size)
+    RecommendationRun.objects.create(paid_before=paid_before, full=True, orders=processed)
+    return processed
+
+
+def update_recommendations(batch_size: int = 1000, limit: int = RELATED_ITEMS_LIMIT,
+                           progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Инкрементальное обновление по заказам, оплаченным после прошлого запуска.
+    Выполняется одной транзакцией вместе с записью запуска, поэтому заказ не учитывается дважды.
+    Без прошлых запусков делает полный пересчёт. Возвращает количество обработанных заказов.
+    """
+    last_run = RecommendationRun.objects.order_by("-id").first()
+    if last_run is None:
+        return rebuild_recommendations(batch_size=batch_size, limit=limit, progress=progress)
+
+    paid_before = timezone.now() - SETTLE_DELAY
+    orders = Order.objects.filter(paid_at__gte=last_run.paid_before, paid_at__lt=paid_before)
+    processed = 0
+    touched = set()
+    with transaction.atomic():
+        for baskets in _iter_baskets(orders, batch_size):
+            counts = Counter()
+            _count_pairs(baskets, counts)
+            _add_counts(counts)
+            touched.update(item_id for basket in baskets if len(set(basket)) > 1 for item_id in basket)
+            processed += len(baskets)
+            if progress:
+                progress(processed)
+        _refresh_related(touched, limit, batch_size)
+        RecommendationRun.objects.create(paid_before=paid_before, full=False, orders=processed)
+    return processed
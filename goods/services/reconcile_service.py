@@ -0,0 +1,145 @@
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from goods.models import Order, StripeReconciliation
+from goods.services.order_event_service import record_status_events, status_event
+from goods.services.order_status_service import publish_order_status
+from goods.services.promo_service import redeem_paid_order
+from goods.services.sales_service import PAID_STATUSES, record_order_sale
+from goods.services.stripe_client import get_stripe
+from goods.services.stripe_service import StripeService
+
+# Статусы Payment Intent, по которым оплата ещё не прошла и intent можно отменить
+CANCELLABLE_INTENT_STATUSES = ("requires_payment_method", "requires_confirmation", "requires_action")
+# Сколько Payment Intent запрашивать у Stripe за страницу (максимум API) и сверять за один запрос к БД
+PAGE_SIZE = 100
+
+
+@dataclass
+class ReconcileStats:
+    """Итоги сверки окна"""
+    intents: int = 0
+    paid: int = 0
+    orphans: int = 0
+    cancelled: int = 0
+    duplicates: int = 0
+
+    def add(self, other: "ReconcileStats") -> None:
+        for field in fields(self):
+            setattr(self, field.name, getattr(self, field.name) + getattr(other, field.name))
+
+
+ProgressCallback = Callable[[datetime, ReconcileStats], None]
+
+
+def iter_payment_intents(created_from: datetime, created_to: datetime) -> Iterator:
+    """Все Payment Intent, созданные в [created_from, created_to), постранично через auto_paging_iter."""
+    return get_stripe().PaymentIntent.list(
+        created={"gte": int(created_from.timestamp()), "lt": int(created_to.timestamp())},
+        limit=PAGE_SIZE,
+    ).auto_paging_iter()
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _order_id(intent) -> Optional[int]:
+    """order_id из metadata intent, созданного create_payment_intent; для чужих intent — None."""
+    order_id = (intent.get("metadata") or {}).get("order_id")
+    try:
+        return int(order_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _mark_paid(intents: dict[int, str]) -> int:
+    """Отмечает оплаченными заказы {order_id: payment_intent_id}, пропущенные вебхуком. Возвращает их количество."""
+    paid_at = timezone.now()
+    with transaction.atomic():
+        # PostgreSQL не блокирует строки необязательной стороны LEFT JOIN: блокируется только заказ
+        orders = list(Order.objects.select_for_update(of=("self",)).select_related("discount", "tax")
+                      .filter(id__in=intents).exclude(status__in=PAID_STATUSES))
+        events = [status_event(order.id, order.status, "InProgress", "reconcile", occurred_at=paid_at)
+                  for order in orders]
+        for order in orders:
+            order.status, order.paid_at, order.payment_intent_id = "InProgress", paid_at, intents[order.id]
+        Order.objects.bulk_update(orders, ["status", "paid_at", "payment_intent_id"])
+        record_status_events(events)
+        for order in orders:
+            redeem_paid_order(order)
+            record_order_sale(order)
+            publish_order_status(order.id, order.status)
+    return len(orders)
+
+
+def reconcile_batch(intents: list, cancel_orphans: bool = False) -> ReconcileStats:
+    """
+    Сверяет пачку Payment Intent с заказами одним запросом in_bulk:
+    успешный intent у неоплаченного заказа — заказ отмечается оплаченным (пропущенный вебхук);
+    успешный intent у заказа, оплаченного другим intent, — повторная оплата, только считается;
+    неоплаченный intent без заказа или вытесненный более новым intent заказа — сирота, отменяется с cancel_orphans.
+    """
+    stats = ReconcileStats(intents=len(intents))
+    ours = [(intent, order_id) for intent in intents if (order_id := _order_id(intent)) is not None]
+    orders = Order.objects.only("id", "status", "payment_intent_id").in_bulk([order_id for _, order_id in ours])
+
+    to_pay = {}
+    orphans = []
+    for intent, order_id in ours:
+        order = orders.get(order_id)
+        if intent["status"] == "succeeded":
+            if order is None:
+                stats.orphans += 1
+            elif order.status not in PAID_STATUSES:
+                to_pay[order_id] = intent["id"]
+            elif order.payment_intent_id and order.payment_intent_id != intent["id"]:
+                stats.duplicates += 1
+        elif intent["status"] in CANCELLABLE_INTENT_STATUSES and (
+                order is None or order.payment_intent_id != intent["id"]):
+            orphans.append(intent["id"])
+
+    stats.paid = _mark_paid(to_pay) if to_pay else 0
+    stats.orphans += len(orphans)
+    if cancel_orphans:
+        stats.cancelled = sum(StripeService.cancel_payment_intent(intent_id) for intent_id in orphans)
+    return stats
+
+
+def _iter_windows(since: datetime, until: datetime, window: timedelta) -> Iterator[tuple[datetime, datetime]]:
+    while since < until:
+        window_end = min(since + window, until)
+        yield since, window_end
+        since = window_end
+
+
+def last_reconciled_until() -> Optional[datetime]:
+    """Конец последнего полностью сверенного окна."""
+    last = StripeReconciliation.objects.order_by("-window_end").first()
+    return last.window_end if last else None
+
+
+def reconcile_stripe(since: datetime, until: datetime, window: timedelta = timedelta(hours=24),
+                     cancel_orphans: bool = False, progress: Optional[ProgressCallback] = None) -> ReconcileStats:
+    """
+    Сверяет Payment Intent, созданные в [since, until), окнами по window.
+    Память ограничена одной страницей Stripe; после каждого окна записывается контрольная точка,
+    прерванная сверка продолжается с окна, на котором остановилась (исправления идемпотентны).
+    """
+    total = ReconcileStats()
+    for window_start, window_end in _iter_windows(since, until, window):
+        stats = ReconcileStats()
+        for batch in _chunks(iter_payment_intents(window_start, window_end), PAGE_SIZE):
+            stats.add(reconcile_batch(batch, cancel_orphans=cancel_orphans))
+        StripeReconciliation.objects.create(window_start=window_start, window_end=window_end, **vars(stats))
+        total.add(stats)
+        if progress:
+            progress(window_end, total)
+    return total
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Iterator, Literal, Optional
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BigIntegerField, Count, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Round, TruncDate
+from django.utils import timezone
+
+from goods.models import Order, OrderItem, SalesRollup
+from goods.utils import convert_price
+
+# Статусы оплаченного заказа, которые попадают в агрегаты продаж
+PAID_STATUSES = ("InProgress", "Done")
+# Статус строки агрегата — статус заказа в момент оплаты. Вебхук пишет продажу один раз и не переносит её
+# при переходе заказа в Done, поэтому пересчёт группирует все оплаченные заказы под тем же статусом
+SALE_STATUS = "InProgress"
+
+AMOUNT_FIELDS = ("orders_count", "quantity", "gross", "discount", "tax")
+
+ProgressCallback = Callable[[int], None]
+
+
+def _line_amounts(price_cents: int, quantity: int, discount_percent: int, tax_percent: int) -> tuple[int, int, int]:
+    """Сумма, скидка и доп. сбор позиции в центах. Формула совпадает с пересчётом в rebuild_rollups."""
+    gross = price_cents * quantity
+    discount = gross * discount_percent // 100
+    tax = (gross - discount) * tax_percent // 100
+    return gross, discount, tax
+
+
+def _increment(key: dict, deltas: dict) -> None:
+    """Прибавляет deltas к строке агрегата с ключом key, создавая её при отсутствии."""
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    if SalesRollup.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            SalesRollup.objects.create(**key, **deltas)
+    except IntegrityError:
+        # строку успел создать параллельный вебхук
+        SalesRollup.objects.filter(**key).update(**increments)
+
+
+def record_order_sale(order: Order) -> None:
+    """
+    Добавляет оплаченный заказ в агрегаты продаж. Вызывается один раз при переходе заказа в оплаченный статус,
+    в той же транзакции, что и смена статуса. День продажи — день создания заказа, как и при пересчёте.
+    """
+    discount_percent = order.discount.percentage if order.discount_id else 0
+    tax_percent = order.tax.percentage if order.tax_id else 0
+    day = timezone.localdate(order.created_at)
+    for line in OrderItem.objects.filter(order=order).select_related("item"):
+        price_cents = line.unit_amount if line.unit_amount is not None else convert_price(line.item.price)
+        gross, discount, tax = _line_amounts(price_cents, line.quantity, discount_percent, tax_percent)
+        _increment(
+            {"day": day, "item_id": line.item_id, "currency": order.currency, "status": SALE_STATUS},
+            {"orders_count": 1, "quantity": line.quantity, "gross": gross, "discount": discount, "tax": tax},
+        )
+
+
+def rebuild_rollups(day_from: date, day_to: date) -> int:
+    """
+    Пересчитывает агрегаты за дни [day_from, day_to] одним запросом к заказам и заменяет их в одной транзакции.
+    Возвращает количество строк агрегата.
+    """
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(day_from, time.min, tzinfo=tz)
+    end = datetime.combine(day_to + timedelta(days=1), time.min, tzinfo=tz)
+
+    price_cents = Coalesce(F("unit_amount"), Cast(Round(F("item__price") * 100), BigIntegerField()))
+    gross = ExpressionWrapper(price_cents * F("quantity"), output_field=BigIntegerField())
+    discount = ExpressionWrapper(gross * Coalesce(F("order__discount__percentage"), Value(0)) / 100,
+                                 output_field=BigIntegerField())
+    tax = ExpressionWrapper((gross - discount) * Coalesce(F("order__tax__percentage"), Value(0)) / 100,
+                            output_field=BigIntegerField())
+    rows = (
+        OrderItem.objects
+        .filter(order__status__in=PAID_STATUSES, order__created_at__gte=start, order__created_at__lt=end)
+        .values("item_id", day=TruncDate("order__created_at", tzinfo=tz), order_currency=F("order__currency"))
+        .annotate(sum_orders=Count("order_id"), sum_quantity=Sum("quantity"),
+                  sum_gross=Sum(gross), sum_discount=Sum(discount), sum_tax=Sum(tax))
+        .order_by()
+    )
+    rollups = [
+        SalesRollup(day=row["day"], item_id=row["item_id"], currency=row["order_currency"],
+                    status=SALE_STATUS, orders_count=row["sum_orders"], quantity=row["sum_quantity"],
+                    gross=row["sum_gross"], discount=row["sum_discount"], tax=row["sum_tax"])
+        for row in rows
+    ]
+    with transaction.atomic():
+        SalesRollup.objects.filter(day__gte=day_from, day__lte=day_to).delete()
+        SalesRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def _iter_day_chunks(day_from: date, day_to: date, chunk_days: int) -> Iterator[tuple[date, date]]:
+    """Делит диапазон дней на отрезки по chunk_days дней."""
+    while day_from <= day_to:
+        chunk_end = min(day_from + timedelta(days=chunk_days - 1), day_to)
+        yield day_from, chunk_end
+        day_from = chunk_end + timedelta(days=1)
+
+
+def _rebuild_chunk_in_thread(chunk: tuple[date, date]) -> int:
+    """Пересчитывает отрезок в потоке пула и закрывает соединение потока с БД."""
+    try:
+        return rebuild_rollups(*chunk)
+    finally:
+        connection.close()
+
+
+def _rebuild_chunks(chunks: list[tuple[date, date]], workers: int) -> Iterator[int]:
+    """Пересчитывает отрезки последовательно или в пуле потоков, отдавая количество строк по каждому."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield rebuild_rollups(*chunk)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_rebuild_chunk_in_thread, chunks)
+
+
+def rebuild_sales_rollups(day_from: date, day_to: date, chunk_days: int = 7, workers: int = 4,
+                          progress: Optional[ProgressCallback] = None) -> int:
+    """
+    Пересчитывает агрегаты продаж за диапазон дней отрезками по chunk_days; отрезки считаются параллельно.
+    Возвращает количество строк агрегата.
+    """
+    total = 0
+    for rows in _rebuild_chunks(list(_iter_day_chunks(day_from, day_to, chunk_days)), workers):
+        total += rows
+        if progress:
+            progress(total)
+    return total
+
+
+def sales_report(day_from: date, day_to: date, group_by: Literal["day", "item"] = "day") -> list[dict]:
+    """Отчет по продажам за диапазон дней. Читает только агрегаты, поэтому стоимость зависит от числа дней и товаров."""
+    group_field = "day" if group_by == "day" else "item_id"
+    rows = (
+        SalesRollup.objects
+        .filter(day__gte=day_from, day__lte=day_to, status__in=PAID_STATUSES)
+        .values(group_field, "currency")
+        .annotate(**{f"total_{field}": Sum(field) for field in AMOUNT_FIELDS})
+        .order_by(group_field, "currency")
+    )
+    report = []
+    for row in rows:
+        entry = {group_field: row[group_field], "currency": row["currency"]}
+        entry.update({field: row[f"total_{field}"] for field in AMOUNT_FIELDS})
+        entry["net"] = entry["gross"] - entry["discount"] + entry["tax"]
+        report.append(entry)
+    return report
@@ -0,0 +1,15 @@
+from types import ModuleType
+
+from django.conf import settings
+
+
+def get_stripe() -> ModuleType:
+    """
+    Единая точка доступа к SDK Stripe.
+    SDK импортируется при первом обращении, а не при импорте приложения, ключ и адрес API берутся из настроек Django.
+    """
+    import stripe
+
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    stripe.api_base = settings.STRIPE_API_BASE
+    return stripe
@@ -1,11 +1,19 @@
+import logging
 from dataclasses import dataclass
 from typing import Literal, Optional, TypedDict, List
 
-import stripe
+from django.core.cache import cache
+from django.db import transaction
 from django.http import JsonResponse, HttpResponse
+from django.utils import timezone
 
-from TestDjangoProject.settings import STRIPE_SECRET_KEY
+from goods.log import get_request_id
 from goods.models import Order
+from goods.services.order_event_service import record_status_events, status_event
+from goods.services.order_status_service import publish_order_status
+from goods.services.promo_service import redeem_paid_order
+from goods.services.sales_service import PAID_STATUSES, record_order_sale
+from goods.services.stripe_client import get_stripe
 from goods.utils import convert_price
 
 
@@ -45,13 +53,62 @@ class SessionParams(TypedDict):
     discounts: Optional[list[dict[str, str]]]
 
 
+logger = logging.getLogger(__name__)
+
+# Проценты купонов и налоговых ставок в Stripe не меняются после создания, поэтому их можно держать в кэше долго
+PRICING_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_coupon_percent_off(stripe_id: str) -> float:
+    """Возвращает процент скидки купона Stripe, кэшируя ответ API."""
+    key = f"stripe_coupon_percent_{stripe_id}"
+    percent_off = cache.get(key)
+    if percent_off is None:
+        percent_off = get_stripe().Coupon.retrieve(stripe_id).percent_off or 0
+        cache.set(key, percent_off, timeout=PRICING_CACHE_TIMEOUT)
+    return percent_off
+
+
+def get_tax_rate_percentage(stripe_id: str) -> float:
+    """Возвращает процент налоговой ставки Stripe, кэшируя ответ API."""
+    key = f"stripe_tax_rate_percent_{stripe_id}"
+    percentage = cache.get(key)
+    if percentage is None:
+        percentage = get_stripe().TaxRate.retrieve(stripe_id).percentage or 0
+        cache.set(key, percentage, timeout=PRICING_CACHE_TIMEOUT)
+    return percentage
+
+
+def _metadata(order: Order) -> dict[str, str | int]:
+    """metadata объектов Stripe: заказ и id запроса, который их создал, — вебхук пишет его в лог"""
+    metadata = {"order_id": order.id}
+    request_id = get_request_id()
+    if request_id:
+        metadata["request_id"] = request_id
+    return metadata
+
+
+def intent_idempotency_key(order: Order, amount: int) -> str:
+    """
+    Ключ идемпотентности Stripe для Payment Intent заказа. Сумма и валюта входят в ключ: если цена или курс
+    изменились, Stripe отклонил бы повтор с прежним ключом и другими параметрами, а нужен новый intent.
+    """
+    return f"order-{order.pk}-payment-intent-{amount}-{order.currency}"
+
+
 class StripeService:
     """Сервис для взаимодействия со Stripe"""
 
     def __init__(self, order: Order):
         self.order = order
         self._items = list(order.items.all())
-        stripe.api_key = STRIPE_SECRET_KEY
+        lines = order.lines.all()
+        self._quantities = {line.item_id: line.quantity for line in lines}
+        # цены, запомненные при оформлении (в том числе пересчитанные по курсу); иначе — цена товара
+        self._unit_amounts = {line.item_id: line.unit_amount for line in lines if line.unit_amount is not None}
+
+    def _unit_amount(self, item) -> int:
+        return self._unit_amounts.get(item.pk, convert_price(item.price))
 
     def _get_discount(self) -> Optional[StripeEntity]:
         """Возвращает Discount объект для Stripe, если скидка есть."""
@@ -74,9 +131,9 @@ class StripeService:
                 "price_data": {
                     "currency": self.order.currency,
                     "product_data": {"name": item.name, "description": item.description},
-                    "unit_amount": convert_price(item.price),
+                    "unit_amount": self._unit_amount(item),
                 },
-                "quantity": 1,
+                "quantity": self._quantities.get(item.pk, 1),
             }
             if tax:
                 li["tax_rates"] = [tax.stripe_id]
@@ -90,7 +147,7 @@ class StripeService:
             "mode": "payment",
             "success_url": f"{success_url}",
             "cancel_url": f"{cancel_url}",
-            "metadata": {"order_id": self.order.id},
+            "metadata": _metadata(self.order),
             "discounts": None,
         }
         discount = self._get_discount()
@@ -101,66 +158,132 @@ class StripeService:
     def create_checkout_session(self, success_url: str, cancel_url: str) -> str:
         """Создает Stripe Checkout Session и возвращает его session_id."""
         params = self._build_session_params(success_url, cancel_url, self._create_line_items())
-        session = stripe.checkout.Session.create(**params)
+        session = get_stripe().checkout.Session.create(**params)
+        logger.info("checkout session created", extra={"order_id": self.order.id, "stripe_id": session.id})
         return session.id
 
     def _calculate_total(self) -> int:
         """Считает итоговую сумму заказа с учётом купона и налога. Возвращает сумму в центах."""
-        total = sum(item.price for item in self._items)
-        total_cents = convert_price(total)
+        total_cents = sum(self._unit_amount(item) * self._quantities.get(item.pk, 1) for item in self._items)
 
         discount = self._get_discount()
         if discount:
-            coupon = stripe.Coupon.retrieve(discount.stripe_id)
-            if coupon.percent_off:
-                total_cents -= int(total_cents * coupon.percent_off / 100)
+            percent_off = get_coupon_percent_off(discount.stripe_id)
+            if percent_off:
+                total_cents -= int(total_cents * percent_off / 100)
 
         tax = self._get_tax()
         if tax:
-            tax_rate = stripe.TaxRate.retrieve(tax.stripe_id)
-            if tax_rate.percentage:
-                total_cents += int(total_cents * tax_rate.percentage / 100)
+            percentage = get_tax_rate_percentage(tax.stripe_id)
+            if percentage:
+                total_cents += int(total_cents * percentage / 100)
 
         return total_cents
 
-    def create_payment_intent(self) -> str:
-        """Создает Stripe Payment Intent и возвращает его client_secret."""
+    def request_payment_intent(self, idempotent: bool = False):
+        """
+        Создает Stripe Payment Intent без записи в БД (можно вызывать из потоков пула) и возвращает его.
+        С idempotent повтор для того же заказа, суммы и валюты возвращает тот же intent (intent_idempotency_key).
+        """
         amount = self._calculate_total()
-        intent = stripe.PaymentIntent.create(
+        options = {"idempotency_key": intent_idempotency_key(self.order, amount)} if idempotent else {}
+        intent = get_stripe().PaymentIntent.create(
             amount=amount,
             currency=self.order.currency,
-            metadata={"order_id": self.order.id},
+            metadata=_metadata(self.order),
+            **options,
         )
+        logger.info("payment intent created",
+                    extra={"order_id": self.order.id, "stripe_id": intent.id, "amount": amount})
+        return intent
+
+    def create_payment_intent(self) -> str:
+        """
+        Создает Stripe Payment Intent и возвращает его client_secret.
+        Прежний intent заказа не отменяется: его client_secret уже у покупателя, который может быть посреди 3DS.
+        Вытесненные intent отменяет reconcile_stripe --cancel-orphans, когда они старше --settle-minutes.
+        """
+        intent = self.request_payment_intent()
+        self.order.payment_intent_id = intent.id
+        self.order.save(update_fields=["payment_intent_id"])
         return intent.client_secret
 
+    @staticmethod
+    def cancel_payment_intent(payment_intent_id: str) -> bool:
+        """
+        Отменяет Stripe Payment Intent. Возвращает False, если Stripe отказал (например, платеж уже прошел)
+        или недоступен: заказ остаётся как есть до следующего запуска.
+        """
+        stripe = get_stripe()
+        try:
+            stripe.PaymentIntent.cancel(payment_intent_id)
+        except stripe.error.InvalidRequestError as e:
+            # уже отменённый intent считаем успешно отменённым
+            intent = getattr(e.error, "payment_intent", None)
+            return bool(intent and intent.get("status") == "canceled")
+        except stripe.error.StripeError as e:
+            logger.warning("payment intent cancel failed", extra={"stripe_id": payment_intent_id, "error": repr(e)})
+            return False
+        return True
+
 
 class WebHookStripeService:
     @classmethod
-    def set_order_from_web_hook(cls, obj_data_from_webhook: dict) -> Order:
-        """Находит заказ по order_id из webhook и ставит статус InProgress."""
+    def set_order_from_web_hook(cls, obj_data_from_webhook: dict, event_id: str = "") -> Order:
+        """
+        Находит заказ по order_id из webhook и ставит статус InProgress.
+        Заказ попадает в агрегаты продаж и журнал статусов только при первом переходе в оплаченный статус,
+        повторные вебхуки его не учитывают.
+        """
         order_id = obj_data_from_webhook['metadata'].get('order_id')
-        order = Order.objects.filter(id=order_id).first()
+        order = Order.objects.select_related("discount", "tax").filter(id=order_id).first()
         if order:
-            order.status = "InProgress"
-            order.save(update_fields=["status"])
+            paid_at = timezone.now()
+            with transaction.atomic():
+                # статус читается под блокировкой: истечение заказа или сверка могли сменить его после чтения выше
+                status = Order.objects.select_for_update().filter(id=order.id).values_list("status", flat=True).first()
+                paid = status is not None and status not in PAID_STATUSES
+                order.status = status or order.status
+                if paid:
+                    Order.objects.filter(id=order.id).update(status="InProgress", paid_at=paid_at)
+                    record_status_events([status_event(order.id, order.status, "InProgress", "webhook",
+                                                       stripe_event_id=event_id, occurred_at=paid_at)])
+                    redeem_paid_order(order)
+            logger.info("order paid" if paid else "order already paid", extra={
+                "order_id": order.id,
+                # id запроса, создавшего платёж: по нему находится вся цепочка покупки
+                "checkout_request_id": obj_data_from_webhook['metadata'].get('request_id'),
+            })
+            if paid:
+                order.status, order.paid_at = "InProgress", paid_at
+                record_order_sale(order)
+            publish_order_status(order.id, order.status)
             return order
 
     @classmethod
     def get_webhook_response(cls, payload, sig_header, endpoint_secret) -> JsonResponse | HttpResponse:
         """Обрабатывает Stripe webhook, проверяет подпись и обновляет заказ."""
+        stripe = get_stripe()
         try:
             event = stripe.Webhook.construct_event(
                 payload=payload, sig_header=sig_header, secret=endpoint_secret
             )
         except ValueError:
+            logger.warning("webhook payload is not valid JSON")
             return HttpResponse(status=400)
         except stripe.error.SignatureVerificationError:
+            logger.warning("webhook signature verification failed")
             return HttpResponse(status=400)
 
         if event['type'] == 'checkout.session.completed' or event["type"] == "payment_intent.succeeded":
             obj_data_from_webhook = event['data']['object']
-            order = cls.set_order_from_web_hook(obj_data_from_webhook)
+            order = cls.set_order_from_web_hook(obj_data_from_webhook, event_id=event.get("id", ""))
             if not order:
+                logger.warning("webhook for unknown order", extra={
+                    "event_type": event["type"],
+                    "order_id": obj_data_from_webhook['metadata'].get('order_id'),
+                    "checkout_request_id": obj_data_from_webhook['metadata'].get('request_id'),
+                })
                 return JsonResponse({"error": "Order not found"}, status=404)
         return HttpResponse(status=200)
 
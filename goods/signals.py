@@ -1,17 +1,33 @@
-from django.db.models.signals import m2m_changed
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
 from django.dispatch import receiver
 
-from .models import Order
+from .edge_cache import pages_showing
+from .local_cache import ALL, invalidate
+from .models import Category, Discount, ExchangeRate, Item, Order, PromoCode, Tax, path_ids
+from .services.category_service import adjust_item_count
+from .services.fx_service import refresh_item_prices
+from .services.image_service import schedule_item_image
+from .services.promo_service import sync_counters
+from .services.recommendation_service import refresh_item_pages
+from .tasks import defer
 
 
 @receiver(m2m_changed, sender=Order.items.through)
 def update_order_currency(sender, instance: Order, action, **kwargs):
     """
     Когда список items в заказе меняется, проверяем валюты и сохраняем currency.
+    Заказ остаётся в своей валюте, если у всех товаров есть цена в ней (своя или посчитанная по курсу).
     """
     if action in ("post_add", "post_remove", "post_clear"):
         currencies = list(instance.items.values_list("currency", flat=True).distinct())
         unique = set(currencies)
+        if instance.currency and unique - {instance.currency}:
+            foreign = instance.items.exclude(currency=instance.currency)
+            if not foreign.exclude(prices__currency=instance.currency).exists():
+                return
         if len(unique) > 1:
             raise ValueError("Все товары в заказе должны быть в одной валюте")
 
@@ -20,3 +36,116 @@ def update_order_currency(sender, instance: Order, action, **kwargs):
             if instance.currency != new_currency:
                 instance.currency = new_currency
                 instance.save(update_fields=["currency"])
+
+
+@receiver(post_save, sender=Item)
+def process_item_image(sender, instance: Item, update_fields=None, **kwargs):
+    """
+    После сохранения товара с изображением ставим генерацию вариантов в пул.
+    Неизменённое изображение отсекается по хэшу содержимого уже в пуле.
+    """
+    if update_fields is not None and "image" not in update_fields:
+        return
+    if instance.image:
+        transaction.on_commit(lambda: schedule_item_image(instance.pk))
+    elif instance.image_variants:
+        Item.objects.filter(pk=instance.pk).update(image_hash="", image_variants={})
+        invalidate("item", instance.pk)
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def refresh_prices_for_rate(sender, instance: ExchangeRate, **kwargs):
+    """
+    Курс изменён вручную (админка) — цены всех товаров пересчитываются в фоне. Задача надёжная:
+    если воркер не успел её выполнить, её выполнит run_background_tasks.
+    """
+    defer(refresh_item_prices, durable=True)
+
+
+def _refresh_showing(item_id: int) -> None:
+    refresh_item_pages(pages_showing([item_id]))
+
+
+@receiver(post_save, sender=Item)
+def refresh_prices(sender, instance: Item, update_fields=None, **kwargs):
+    """
+    Цены товара в других валютах пересчитываются в той же транзакции, если изменилась цена или валюта:
+    заказ не оформится по старой цене. После коммита страницы, где показан товар, обновляются в кэше nginx.
+    """
+    if update_fields is None or {"price", "currency"} & set(update_fields):
+        refresh_item_prices([instance.pk])
+    if settings.EDGE_CACHE_PURGE_URL:
+        defer(_refresh_showing, instance.pk)
+
+
+@receiver(pre_delete, sender=Item)
+def purge_deleted_item(sender, instance: Item, **kwargs):
+    """Рекомендации удаляются каскадом вместе с товаром, поэтому страницы, где он показан, собираются до удаления."""
+    if settings.EDGE_CACHE_PURGE_URL:
+        defer(refresh_item_pages, pages_showing([instance.pk]))
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_item(sender, instance: Item, **kwargs):
+    """Изменённый товар вычищается из кэша всех воркеров."""
+    invalidate("item", instance.pk)
+
+
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+@receiver(post_save, sender=Tax)
+@receiver(post_delete, sender=Tax)
+def invalidate_pricing(sender, instance, **kwargs):
+    """Скидок и сборов мало, поэтому при любом изменении сбрасывается всё пространство."""
+    invalidate(sender._meta.model_name, ALL)
+
+
+@receiver(post_save, sender=PromoCode)
+def sync_promo_code_counters(sender, instance: PromoCode, **kwargs):
+    sync_counters(instance)
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+def invalidate_promo_codes(sender, instance, **kwargs):
+    """Кэш промокодов хранит и «кода нет», и скидку кода, поэтому сбрасывается целиком."""
+    invalidate("promo_code", ALL)
+
+
+@receiver(post_init, sender=Item)
+def remember_item_category(sender, instance: Item, **kwargs):
+    """Запоминаем категорию загруженного товара, чтобы после сохранения понять, сменилась ли она (без запроса)."""
+    instance._loaded_category_id = instance.__dict__.get("category_id")
+
+
+@receiver(post_save, sender=Item)
+def update_category_counts(sender, instance: Item, created, **kwargs):
+    """Товар перешёл в другую категорию — счётчики старой и новой категории и их предков обновляются."""
+    old = None if created else instance._loaded_category_id
+    if old != instance.category_id:
+        adjust_item_count(old, -1)
+        adjust_item_count(instance.category_id, +1)
+        instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Item)
+def decrement_category_counts(sender, instance: Item, **kwargs):
+    adjust_item_count(instance.category_id, -1)
+
+
+@receiver(post_save, sender=Category)
+def invalidate_categories(sender, instance: Category, **kwargs):
+    invalidate("category", ALL)
+
+
+@receiver(post_delete, sender=Category)
+def detach_deleted_category(sender, instance: Category, **kwargs):
+    """Товары удалённой категории остаются без категории: вычитаем их из счётчиков предков."""
+    if instance.total_item_count:
+        Category.objects.filter(pk__in=path_ids(instance.path)[:-1]).update(
+            total_item_count=F("total_item_count") - instance.total_item_count)
+    invalidate("category", ALL)
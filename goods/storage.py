@@ -0,0 +1,56 @@
+import gzip
+
+import brotli
+import rcssmin
+import rjsmin
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+COMPRESSIBLE_EXTENSIONS = (".js", ".css", ".svg", ".json", ".txt", ".map")
+# Файлы меньше этого размера сжимать нет смысла, в байтах
+MIN_COMPRESS_SIZE = 256
+
+
+def minify(name: str, content: bytes) -> bytes:
+    """Минифицирует JS и CSS, остальные файлы возвращает как есть."""
+    if name.endswith(".js"):
+        return rjsmin.jsmin(content)
+    if name.endswith(".css"):
+        return rcssmin.cssmin(content)
+    return content
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Хранилище статики для collectstatic: имена с хэшем содержимого (манифест), минификация JS/CSS
+    и заранее сжатые .gz и .br рядом с каждым файлом, чтобы nginx отдавал их без сжатия на лету.
+    """
+
+    def stored_name(self, name):
+        # без collectstatic (разработка, тесты) отдаём исходное имя файла
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in set(self.hashed_files.values()):
+            if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self._minify_and_compress(hashed_name)
+
+    def _minify_and_compress(self, name: str) -> None:
+        path = self.path(name)
+        with open(path, "rb") as f:
+            content = f.read()
+        minified = minify(name, content)
+        if minified != content:
+            with open(path, "wb") as f:
+                f.write(minified)
+        if len(minified) < MIN_COMPRESS_SIZE:
+            return
+        with open(f"{path}.gz", "wb") as f:
+            f.write(gzip.compress(minified, compresslevel=9, mtime=0))
+        with open(f"{path}.br", "wb") as f:
+            f.write(brotli.compress(minified, quality=11))
@@ -0,0 +1,180 @@
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from goods import metrics
+from goods.models import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором упавшей надёжной задачи растёт с числом попыток, в секундах
+RETRY_BASE_DELAY = 30
+
+_STOP = object()
+
+
+class TaskExecutor:
+    """
+    Пул потоков для некритичной работы запроса (запись кэша, отмена старых Payment Intent и т.п.).
+    Задача ставится в ограниченную очередь BACKGROUND_TASK_QUEUE_SIZE и выполняется одним из
+    BACKGROUND_TASK_WORKERS потоков в копии контекста запроса (request_id попадает в логи).
+    Переполненная очередь не теряет задачи: они выполняются сразу в вызывающем потоке.
+    С BACKGROUND_TASK_WORKERS = 0 все задачи выполняются сразу (удобно в тестах и management-командах).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue: queue.Queue | None = None
+        self._threads: list[threading.Thread] = []
+        self._pid: int | None = None
+        self._stopping = False
+
+    def _ensure_started(self) -> queue.Queue:
+        # потоки не переживают fork воркера gunicorn, поэтому пул создаётся в каждом процессе при первой задаче
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopping = False
+                self._queue = queue.Queue(maxsize=settings.BACKGROUND_TASK_QUEUE_SIZE)
+                self._threads = [
+                    threading.Thread(target=self._work, name=f"background-task-{number}", daemon=True)
+                    for number in range(settings.BACKGROUND_TASK_WORKERS)
+                ]
+                for thread in self._threads:
+                    thread.start()
+            return self._queue
+
+    def depth(self) -> int:
+        """Сколько задач ждёт в очереди текущего процесса."""
+        return self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+
+    def submit(self, func: Callable, *args, **kwargs) -> None:
+        """Ставит func(*args, **kwargs) в очередь."""
+        metrics.incr("tasks.submitted")
+        task = (contextvars.copy_context(), func, args, kwargs, time.monotonic())
+        if settings.BACKGROUND_TASK_WORKERS == 0 or self._stopping:
+            self._run(*task)
+            return
+        try:
+            self._ensure_started().put_nowait(task)
+        except queue.Full:
+            metrics.incr("tasks.overflow")
+            self._run(*task)
+
+    def _work(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                if task is _STOP:
+                    return
+                self._run(*task)
+            finally:
+                self._queue.task_done()
+                # у каждого потока своё соединение с БД; не держим его между задачами
+                connection.close()
+
+    @staticmethod
+    def _run(context: contextvars.Context, func: Callable, args: tuple, kwargs: dict, submitted_at: float) -> None:
+        started_at = time.monotonic()
+        metrics.incr("tasks.wait_ms", int((started_at - submitted_at) * 1000))
+        try:
+            context.run(func, *args, **kwargs)
+        except Exception:
+            metrics.incr("tasks.failed")
+            logger.exception("background task failed", extra={"task": getattr(func, "__qualname__", repr(func))})
+        else:
+            metrics.incr("tasks.completed")
+        finally:
+            metrics.incr("tasks.run_ms", int((time.monotonic() - started_at) * 1000))
+
+    def shutdown(self, timeout: float) -> int:
+        """
+        Дожидается выполнения очереди не дольше timeout секунд (вызывается при остановке воркера gunicorn).
+        Задачи, поставленные после начала остановки, выполняются сразу. Возвращает число невыполненных задач.
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return 0
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        try:
+            for _ in self._threads:
+                self._queue.put(_STOP, timeout=max(deadline - time.monotonic(), 0))
+            for thread in self._threads:
+                thread.join(max(deadline - time.monotonic(), 0))
+        except queue.Full:
+            pass
+        left = sum(1 for task in list(self._queue.queue) if task is not _STOP)
+        if left:
+            logger.warning("background tasks not drained", extra={"tasks_left": left})
+        return left
+
+
+executor = TaskExecutor()
+
+
+def _func_path(func: Callable) -> str:
+    path = f"{func.__module__}.{func.__qualname__}"
+    if "<" in path or "." in func.__qualname__:
+        raise ValueError("Надёжная задача должна быть функцией уровня модуля")
+    return path
+
+
+def run_stored_task(task_id: int) -> bool:
+    """
+    Выполняет надёжную задачу, если её не забрал другой процесс. Строка задачи заблокирована на время выполнения;
+    после успеха она удаляется, после ошибки откладывается с растущей паузой. Возвращает True при успехе.
+    """
+    with transaction.atomic():
+        task = (BackgroundTask.objects.select_for_update(skip_locked=True)
+                .filter(id=task_id, attempts__lt=settings.BACKGROUND_TASK_MAX_ATTEMPTS).first())
+        if task is None:
+            return False
+        try:
+            with transaction.atomic():
+                import_string(task.func)(*task.args, **task.kwargs)
+        except Exception as e:
+            task.attempts += 1
+            task.last_error = repr(e)
+            task.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** task.attempts)
+            task.save(update_fields=["attempts", "last_error", "run_after"])
+            logger.warning("stored background task failed", extra={"task_id": task.id, "task": task.func,
+                                                                  "attempts": task.attempts, "error": repr(e)})
+            return False
+        task.delete()
+    return True
+
+
+def defer(func: Callable, *args, durable: bool = False, **kwargs) -> None:
+    """
+    Выполняет func(*args, **kwargs) в фоне после коммита текущей транзакции, то есть уже после ответа клиенту
+    (при ATOMIC_REQUESTS транзакция запроса коммитится до отправки ответа). Откат транзакции отменяет задачу.
+    С durable задача сначала записывается в background_task в той же транзакции: если процесс умрёт раньше,
+    её выполнит run_background_tasks. Аргументы надёжной задачи должны сериализоваться в JSON.
+    """
+    if durable:
+        task = BackgroundTask.objects.create(func=_func_path(func), args=list(args), kwargs=kwargs)
+        transaction.on_commit(lambda: executor.submit(run_stored_task, task.id))
+    else:
+        transaction.on_commit(lambda: executor.submit(func, *args, **kwargs))
+
+
+def due_tasks(limit: int) -> list[int]:
+    """id надёжных задач, которые пора выполнить (не выполненные вовремя или ждущие повтора)."""
+    return list(BackgroundTask.objects.filter(run_after__lte=timezone.now(),
+                                              attempts__lt=settings.BACKGROUND_TASK_MAX_ATTEMPTS)
+                .order_by("run_after", "id").values_list("id", flat=True)[:limit])
+
+
+metrics.register("tasks.submitted", "tasks.completed", "tasks.failed", "tasks.overflow", "tasks.wait_ms",
+                 "tasks.run_ms")
+metrics.register_gauge("tasks.queue_depth", executor.depth)
@@ -1,6 +1,9 @@
 from typing import Literal
 
 from django import template
+from django.core.files.storage import default_storage
+
+from goods.models import Item
 
 register = template.Library()
 
@@ -10,6 +13,30 @@ def convert_currency_to_fancy_format(value: Literal["usd"] | Literal["rub"]) ->
     """Шаблонный фильтр: по коду валюты возвращает её символ."""
     currencies = {
         "usd": "$",
-        "rub": "₽"
+        "rub": "₽",
+        "eur": "€",
     }
     return currencies.get(value, value)
+
+
+@register.filter()
+def display_price(item: Item, prices: dict) -> str:
+    """Шаблонный фильтр: цена товара в валюте показа из prices ({id: (цена, валюта)}), иначе в валюте товара."""
+    amount, currency = (prices or {}).get(item.pk, (item.price, item.currency))
+    return f"{amount} {convert_currency_to_fancy_format(currency)}"
+
+
+@register.filter()
+def image_srcset(item: Item, fmt: str) -> str:
+    """Шаблонный фильтр: srcset из вариантов изображения товара в нужном формате."""
+    variants = item.image_variants.get(fmt, {})
+    return ", ".join(f"{default_storage.url(path)} {width}w" for width, path in variants.items())
+
+
+@register.filter()
+def image_src(item: Item, fmt: str) -> str:
+    """Шаблонный фильтр: самый крупный вариант изображения товара для браузеров без srcset."""
+    variants = item.image_variants.get(fmt, {})
+    if not variants:
+        return ""
+    return default_storage.url(variants[max(variants, key=int)])
@@ -0,0 +1,418 @@
+import gzip
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
+from unittest.mock import patch, MagicMock
+
+import stripe
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import models
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from goods.models import (Item, Order, ArchivedOrder, Discount, Tax, SalesRollup, RecommendationRun, RelatedItem,
+                          StripeReconciliation, FeedShard, OrderStatusEvent, ItemPrice)
+from goods.services.db_service import create_or_get_order
+from goods.services.feed_service import feeds_root
+from goods.services.order_expiry_service import expire_stale_orders, archive_orders
+from goods.services.recommendation_service import get_related_items
+from goods.services.stripe_service import WebHookStripeService
+
+
+class ExpireOrdersTest(TestCase):
+    def setUp(self):
+        self.item = Item.objects.create(name="A", description="A", price=Decimal("1.00"), currency="usd")
+        self.old = timezone.now() - timedelta(days=2)
+
+    def _order(self, status="Created", payment_intent_id="", created_at=None) -> Order:
+        order = Order.objects.create(session_key="s", status=status, payment_intent_id=payment_intent_id)
+        order.items.add(self.item)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at or self.old)
+        return order
+
+    @patch("goods.services.order_expiry_service.StripeService.cancel_payment_intent")
+    def test_expire_stale_orders_cancels_intents(self, mock_cancel):
+        mock_cancel.side_effect = lambda intent_id: intent_id != "pi_paid"
+        stale = self._order(payment_intent_id="pi_1")
+        paid = self._order(payment_intent_id="pi_paid")
+        no_intent = self._order()
+        fresh = self._order(created_at=timezone.now())
+
+        expired = expire_stale_orders(created_before=timezone.now() - timedelta(days=1), batch_size=2, workers=2)
+
+        self.assertEqual(expired, 2)
+        self.assertEqual(mock_cancel.call_count, 2)
+        statuses = dict(Order.objects.values_list("id", "status"))
+        self.assertEqual(statuses[stale.id], "Expired")
+        self.assertEqual(statuses[no_intent.id], "Expired")
+        self.assertEqual(statuses[paid.id], "Created")
+        self.assertEqual(statuses[fresh.id], "Created")
+        self.assertEqual(sorted(OrderStatusEvent.objects.filter(source="expiry").values_list("order_id", flat=True)),
+                         sorted([stale.id, no_intent.id]))
+
+    @patch("stripe.PaymentIntent.cancel", side_effect=stripe.error.APIConnectionError("Network error"))
+    def test_stripe_outage_leaves_orders_for_next_run(self, _):
+        order = self._order(payment_intent_id="pi_1")
+        with self.assertLogs("goods.services.stripe_service", "WARNING"):
+            expired = expire_stale_orders(created_before=timezone.now() - timedelta(days=1))
+        self.assertEqual(expired, 0)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, "Created")
+
+    def test_archive_orders_moves_rows(self):
+        done = self._order(status="Done", payment_intent_id="pi_done")
+        expired = self._order(status="Expired")
+        in_progress = self._order(status="InProgress")
+
+        archived = archive_orders(created_before=timezone.now() - timedelta(days=1), batch_size=1)
+
+        self.assertEqual(archived, 2)
+        self.assertEqual(list(Order.objects.values_list("id", flat=True)), [in_progress.id])
+        self.assertFalse(Order.items.through.objects.filter(order_id__in=[done.id, expired.id]).exists())
+        row = ArchivedOrder.objects.get(order_id=done.id)
+        self.assertEqual(row.item_ids, [self.item.id])
+        self.assertEqual(row.payment_intent_id, "pi_done")
+        self.assertEqual(row.status, "Done")
+
+    @patch("goods.services.order_expiry_service.StripeService.cancel_payment_intent", return_value=True)
+    def test_command_reports_progress(self, _):
+        self._order(payment_intent_id="pi_1", created_at=timezone.now() - timedelta(days=60))
+        out = StringIO()
+        call_command("expire_orders", stdout=out)
+        self.assertIn("истекло 1, перенесено в архив 1", out.getvalue())
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(ArchivedOrder.objects.count(), 1)
+
+
+class PurgeSessionsTest(TestCase):
+    def test_deletes_only_expired_sessions_in_batches(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key=f"old{i}", session_data="", expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key="alive", session_data="", expire_date=now + timedelta(days=1))
+
+        out = StringIO()
+        call_command("purge_sessions", batch_size=2, stdout=out)
+
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["alive"])
+        self.assertIn("удалено 5 сессий", out.getvalue())
+
+
+@patch("goods.models.Tax._stripe_create", return_value=MagicMock(id="txr_1"))
+@patch("goods.models.Discount._stripe_create", return_value=MagicMock(id="co_1"))
+class SalesRollupTest(TestCase):
+    def _pay(self, order):
+        WebHookStripeService.set_order_from_web_hook({"metadata": {"order_id": str(order.id)}})
+
+    def _rollups(self):
+        return list(SalesRollup.objects.order_by("day", "item_id")
+                    .values("day", "item_id", "currency", "status", "orders_count", "quantity",
+                            "gross", "discount", "tax"))
+
+    def _create_paid_orders(self):
+        discount = Discount.objects.create(name="D", percentage=10)
+        tax = Tax.objects.create(name="T", percentage=5)
+        self.item1 = Item.objects.create(name="A", description="D", price=Decimal("10.29"), currency="usd")
+        self.item2 = Item.objects.create(name="B", description="D", price=Decimal("3.00"), currency="usd")
+        first = create_or_get_order([self.item1, self.item2], session_key="s1", discount=discount, tax=tax,
+                                    quantities={self.item1.pk: 3, self.item2.pk: 1})
+        second = create_or_get_order([self.item1], session_key="s2")
+        create_or_get_order([self.item2], session_key="s3")  # не оплачен
+        self._pay(first)
+        self._pay(second)
+        return first
+
+    def test_webhook_updates_rollup_once(self, *_):
+        first = self._create_paid_orders()
+        self._pay(first)  # повторный вебхук
+
+        row = SalesRollup.objects.get(item_id=self.item1.pk)
+        self.assertEqual((row.orders_count, row.quantity), (2, 4))
+        # 3 * 1029 = 3087, скидка 308, сбор (3087 - 308) * 5% = 138; плюс заказ без скидки на 1029
+        self.assertEqual((row.gross, row.discount, row.tax), (3087 + 1029, 308, 138))
+        self.assertEqual(SalesRollup.objects.get(item_id=self.item2.pk).orders_count, 1)
+
+    def test_backfill_matches_incremental(self, *_):
+        first = self._create_paid_orders()
+        # выполненный заказ пересчёт должен учесть под тем же статусом, что и вебхук при оплате
+        Order.objects.filter(pk=first.pk).update(status="Done")
+        incremental = self._rollups()
+        SalesRollup.objects.all().delete()
+
+        out = StringIO()
+        call_command("rebuild_sales_rollups", "--workers", "1", "--chunk-days", "1", stdout=out)
+        self.assertEqual(self._rollups(), incremental)
+        self.assertIn("Готово", out.getvalue())
+
+    @override_settings(INTERNAL_IPS=["127.0.0.1"])
+    def test_report_reads_rollups(self, *_):
+        self._create_paid_orders()
+        response = self.client.get(reverse("goods:sales_report"), {"group": "item"})
+        rows = {row["item_id"]: row for row in response.json()["rows"]}
+        self.assertEqual(rows[self.item2.pk]["net"], 300 - 30 + 13)
+        self.assertEqual(self.client.get(reverse("goods:sales_report"), {"from": "bad"}).status_code, 400)
+
+
+class BuildRecommendationsTest(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c, self.d = (
+            Item.objects.create(name=name, description="D", price=Decimal("1.00"), currency="usd") for name in "ABCD"
+        )
+        paid_at = timezone.now() - timedelta(hours=1)
+        for basket in ([self.a, self.b], [self.a, self.b, self.c], [self.a, self.c]):
+            self._order(basket, status="InProgress", paid_at=paid_at)
+        self._order([self.a, self.d])  # не оплачен
+
+    def _order(self, items, **fields):
+        order = Order.objects.create(session_key="s", **fields)
+        order.items.set(items)
+        return order
+
+    def _related(self, item):
+        return list(RelatedItem.objects.filter(item=item).values_list("related_id", "score"))
+
+    def test_full_rebuild_in_several_passes(self):
+        out = StringIO()
+        call_command("build_recommendations", "--full", "--items-per-pass", "2", "--batch-size", "2", stdout=out)
+
+        self.assertEqual(self._related(self.a), [(self.b.id, 2), (self.c.id, 2)])
+        self.assertEqual(self._related(self.b), [(self.a.id, 2), (self.c.id, 1)])
+        self.assertEqual(self._related(self.d), [])
+        self.assertTrue(RecommendationRun.objects.get().full)
+        self.assertIn("Готово: обработано заказов 3", out.getvalue())
+
+    def test_item_ids_beyond_32_bits(self):
+        big = Item.objects.create(pk=2 ** 32 + 5, name="Big", description="D", price=Decimal("1.00"), currency="usd")
+        self._order([self.d, big], status="InProgress", paid_at=timezone.now() - timedelta(hours=1))
+        call_command("build_recommendations", "--full", "--items-per-pass", str(2 ** 33), stdout=StringIO())
+        self.assertEqual(self._related(big), [(self.d.id, 1)])
+        self.assertEqual(self._related(self.d), [(big.id, 1)])
+
+    def test_incremental_update_counts_new_orders_once(self):
+        call_command("build_recommendations", stdout=StringIO())  # первый запуск — полный пересчёт
+        RecommendationRun.objects.update(paid_before=timezone.now() - timedelta(minutes=30))
+        self.assertEqual(get_related_items(self.d.id), [])
+
+        self._order([self.c, self.d], status="InProgress", paid_at=timezone.now() - timedelta(minutes=10))
+        # кэш рекомендаций сбрасывается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("build_recommendations", stdout=StringIO())
+        call_command("build_recommendations", stdout=StringIO())
+
+        self.assertEqual(self._related(self.c), [(self.a.id, 2), (self.b.id, 1), (self.d.id, 1)])
+        self.assertEqual(get_related_items(self.d.id), [self.c])
+
+        response = self.client.get(self.d.get_absolute_url())
+        self.assertContains(response, "Часто покупают вместе")
+        self.assertContains(response, self.c.get_absolute_url())
+
+    @patch("goods.services.recommendation_service.refresh_pages")
+    def test_only_changed_pages_are_refreshed(self, mock_refresh):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("build_recommendations", stdout=StringIO())
+        self.assertEqual(mock_refresh.call_args_list[0].args[0], [self.a.id, self.b.id, self.c.id])
+
+        mock_refresh.reset_mock()
+        RecommendationRun.objects.update(paid_before=timezone.now() - timedelta(minutes=30))
+        self._order([self.a, self.b], status="InProgress", paid_at=timezone.now() - timedelta(minutes=10))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("build_recommendations", stdout=StringIO())
+        # у A и B изменились только счётчики, порядок рекомендаций тот же
+        mock_refresh.assert_not_called()
+
+
+class FakeStripeAPI(BaseHTTPRequestHandler):
+    """Локальный фейковый API Stripe: список Payment Intent с пагинацией и их отмена"""
+    intents: list[dict] = []
+    requests: list[str] = []
+
+    def _send(self, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.requests.append(self.path)
+        intents = [intent for intent in sorted(self.intents, key=lambda i: -i["created"])
+                   if int(query["created[gte]"]) <= intent["created"] < int(query["created[lt]"])]
+        if "starting_after" in query:
+            ids = [intent["id"] for intent in intents]
+            intents = intents[ids.index(query["starting_after"]) + 1:]
+        limit = int(query.get("limit", 10))
+        self._send({"object": "list", "url": "/v1/payment_intents", "data": intents[:limit],
+                    "has_more": len(intents) > limit})
+
+    def do_POST(self):
+        intent_id = self.path.split("/")[3]
+        intent = next(intent for intent in self.intents if intent["id"] == intent_id)
+        intent["status"] = "canceled"
+        self._send(intent)
+
+    def log_message(self, *args):
+        pass
+
+
+class ReconcileStripeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStripeAPI)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings = override_settings(STRIPE_SECRET_KEY="sk_test_fake",
+                                         STRIPE_API_BASE=f"http://127.0.0.1:{cls.server.server_port}")
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.item = Item.objects.create(name="A", description="D", price=Decimal("5.00"), currency="usd")
+        self.now = timezone.now()
+        FakeStripeAPI.requests = []
+        FakeStripeAPI.intents = []
+
+    def _order(self, **fields):
+        order = Order.objects.create(session_key="s", **fields)
+        order.items.set([self.item])
+        return order
+
+    def _intent(self, intent_id, status, order=None, hours_ago=2):
+        FakeStripeAPI.intents.append({
+            "id": intent_id, "object": "payment_intent", "status": status,
+            "created": int((self.now - timedelta(hours=hours_ago)).timestamp()),
+            "metadata": {"order_id": str(order.id)} if order else {},
+        })
+
+    def _reconcile(self, *args):
+        out = StringIO()
+        call_command("reconcile_stripe", "--window-hours", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_fixes_missed_webhooks_and_finds_orphans(self):
+        lost = self._order(payment_intent_id="pi_lost")
+        paid = self._order(status="InProgress", payment_intent_id="pi_paid")
+        self._intent("pi_lost", "succeeded", lost)
+        self._intent("pi_paid", "succeeded", paid)
+        self._intent("pi_double", "succeeded", paid)
+        self._intent("pi_stale", "requires_payment_method", lost)  # вытеснен более новым intent заказа
+        self._intent("pi_foreign", "requires_payment_method")  # не из нашего приложения
+        for i in range(150):  # больше одной страницы Stripe
+            self._intent(f"pi_open_{i:03}", "requires_payment_method", self._order(payment_intent_id=f"pi_open_{i:03}"),
+                         hours_ago=3)
+
+        output = self._reconcile("--cancel-orphans", "--days", "1")
+
+        lost.refresh_from_db()
+        self.assertEqual(lost.status, "InProgress")
+        self.assertIsNotNone(lost.paid_at)
+        self.assertEqual(SalesRollup.objects.get().orders_count, 1)
+        self.assertEqual(list(OrderStatusEvent.objects.values_list("order_id", "from_status", "to_status", "source")),
+                         [(lost.id, "Created", "InProgress", "reconcile")])
+        self.assertEqual(next(i for i in FakeStripeAPI.intents if i["id"] == "pi_stale")["status"], "canceled")
+        self.assertEqual(next(i for i in FakeStripeAPI.intents if i["id"] == "pi_foreign")["status"],
+                         "requires_payment_method")
+        self.assertIn("intent 155, отмечено оплаченными 1, сирот 1, отменено 1, повторных оплат 1", output)
+        self.assertTrue(any("starting_after" in path for path in FakeStripeAPI.requests))
+
+    def test_resumes_from_checkpoint(self):
+        order = self._order(payment_intent_id="pi_1")
+        self._intent("pi_1", "succeeded", order, hours_ago=5)
+        until = (self.now - timedelta(hours=1)).isoformat()
+        self._reconcile("--days", "1", "--until", until)
+        self.assertEqual(StripeReconciliation.objects.count(), 23)
+
+        FakeStripeAPI.requests = []
+        output = self._reconcile("--until", until)
+        self.assertEqual(FakeStripeAPI.requests, [])
+        self.assertIn("Нет новых Payment Intent", output)
+        self.assertEqual(StripeReconciliation.objects.aggregate(total=models.Sum("paid"))["total"], 1)
+
+
+class BuildFeedsTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        override = override_settings(MEDIA_ROOT=self.media.name, FEED_SHARD_SIZE=2, SITE_URL="https://shop.test")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self.media.cleanup)
+        self.items = [Item.objects.create(name=f"Item {i} & co", description="D", price=Decimal("2.50"),
+                                          currency="usd") for i in range(3)]
+
+    def _build(self, *args) -> str:
+        # товары «изменены» давно, иначе свежие правки пересобираются повторно до истечения SETTLE_DELAY
+        Item.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        out = StringIO()
+        call_command("build_feeds", *args, stdout=out)
+        return out.getvalue()
+
+    def _read(self, name) -> str:
+        with gzip.open(feeds_root() / name, "rt", encoding="utf-8") as f:
+            return f.read()
+
+    def _shard(self, item) -> int:
+        return item.pk // 2
+
+    def test_builds_compressed_shards_and_index(self):
+        self.assertIn("Готово: пересобрано частей 2", self._build())
+
+        products = self._read(f"products-{self._shard(self.items[0]):05d}.xml.gz")
+        self.assertIn("<title>Item 0 &amp; co</title>", products)
+        self.assertIn(f"<link>https://shop.test{self.items[0].get_absolute_url()}</link>", products)
+        self.assertIn("<g:price>2.50 USD</g:price>", products)
+        self.assertIn(f"https://shop.test{self.items[2].get_absolute_url()}",
+                      self._read(f"sitemap-{self._shard(self.items[2]):05d}.xml.gz"))
+        index = (feeds_root() / "sitemap.xml").read_text()
+        self.assertEqual(index.count("<sitemap>"), 2)
+        self.assertEqual(sorted(p.name for p in feeds_root().iterdir() if p.name.startswith(".")), [])
+
+    def test_rebuilds_only_changed_shards(self):
+        self._build()
+        self.assertIn("пересобрано частей 0", self._build())
+
+        FeedShard.objects.update(watermark=timezone.now() - timedelta(minutes=30))
+        self.items[2].name = "Renamed"
+        self.items[2].save()
+        out = StringIO()
+        call_command("build_feeds", stdout=out)
+        self.assertIn("пересобрано частей 1", out.getvalue())
+        self.assertIn("Renamed", self._read(f"products-{self._shard(self.items[2]):05d}.xml.gz"))
+
+        emptied = self._shard(self.items[2])
+        for item in self.items:
+            if self._shard(item) == emptied:
+                item.delete()
+        self._build()
+        self.assertFalse((feeds_root() / f"products-{emptied:05d}.xml.gz").exists())
+        self.assertEqual(FeedShard.objects.count(), 1)
+
+
+class UpdateFxRatesTest(TestCase):
+    def test_loads_rates_and_refreshes_prices_only_on_change(self):
+        item = Item.objects.create(name="A", description="D", price=Decimal("10.00"), currency="usd")
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as rates:
+            json.dump({"base": "usd", "rates": {"rub": 90, "eur": "0.5"}}, rates)
+            rates.flush()
+            out = StringIO()
+            call_command("update_fx_rates", "--file", rates.name, stdout=out)
+            self.assertIn("пересчитано цен 3", out.getvalue())
+            self.assertEqual(ItemPrice.objects.get(item=item, currency="eur").amount, Decimal("5.00"))
+
+            out = StringIO()
+            call_command("update_fx_rates", "--file", rates.name, stdout=out)
+            self.assertIn("Изменились курсы: нет", out.getvalue())
+            self.assertNotIn("пересчитано", out.getvalue())
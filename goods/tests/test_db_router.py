@@ -0,0 +1,84 @@
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+
+from goods import db_router
+from goods.db_router import PrimaryReplicaRouter, begin_primary_pin, end_primary_pin
+from goods.middleware import PrimaryPinningMiddleware, PRIMARY_PIN_COOKIE
+from goods.models import Item, Order
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], REPLICA_MAX_LAG=2, REPLICA_LAG_CHECK_INTERVAL=5)
+class PrimaryReplicaRouterTest(TestCase):
+    def setUp(self):
+        db_router._replica_lag_cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.token = begin_primary_pin(pinned=False)
+
+    def tearDown(self):
+        end_primary_pin(self.token)
+
+    @patch("goods.db_router._replica_lag", return_value=0.0)
+    def test_catalog_reads_go_to_replica(self, _):
+        self.assertEqual(self.router.db_for_read(Item), "replica")
+
+    @patch("goods.db_router._replica_lag", return_value=0.0)
+    def test_order_reads_stay_on_primary(self, _):
+        self.assertIsNone(self.router.db_for_read(Order))
+
+    @patch("goods.db_router._replica_lag", return_value=10.0)
+    def test_lagging_replica_falls_back_to_primary(self, _):
+        self.assertEqual(self.router.db_for_read(Item), "default")
+
+    @skipUnless(connection.vendor == "postgresql", "отставание реплики проверяется только на PostgreSQL")
+    def test_server_without_streaming_replication_is_not_healthy(self):
+        # основная БД тестов не получает WAL по потоковой репликации, как и реплика без связи с upstream
+        self.assertEqual(db_router._replica_lag("default"), float("inf"))
+
+    @patch("goods.db_router._replica_lag", side_effect=DatabaseError)
+    def test_unavailable_replica_falls_back_to_primary(self, _):
+        self.assertEqual(self.router.db_for_read(Item), "default")
+
+    @patch("goods.db_router._replica_lag", return_value=0.0)
+    def test_lag_is_cached(self, mock_lag):
+        self.router.db_for_read(Item)
+        self.router.db_for_read(Item)
+        mock_lag.assert_called_once_with("replica")
+
+    @patch("goods.db_router._replica_lag", return_value=0.0)
+    def test_reads_after_write_are_pinned_to_primary(self, _):
+        self.assertEqual(self.router.db_for_write(Order), "default")
+        self.assertEqual(self.router.db_for_read(Item), "default")
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate("replica", "goods"))
+        self.assertIsNone(self.router.allow_migrate("default", "goods"))
+
+
+@override_settings(PRIMARY_PIN_SECONDS=5)
+class PrimaryPinningMiddlewareTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_write_sets_pin_cookie(self):
+        def view(request):
+            Item.objects.create(name="A", description="A", price=Decimal("1.00"))
+            return HttpResponse()
+
+        response = PrimaryPinningMiddleware(view)(self.factory.get("/"))
+        self.assertEqual(response.cookies[PRIMARY_PIN_COOKIE]["max-age"], 5)
+
+    def test_read_only_request_does_not_extend_pin(self):
+        request = self.factory.get("/")
+        request.COOKIES[PRIMARY_PIN_COOKIE] = "1"
+
+        def view(request):
+            self.assertTrue(db_router.is_pinned_to_primary())
+            return HttpResponse()
+
+        response = PrimaryPinningMiddleware(view)(request)
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
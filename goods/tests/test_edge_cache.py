@@ -0,0 +1,75 @@
+from unittest.mock import patch
+from urllib.error import HTTPError
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from goods import metrics
+from goods.edge_cache import pages_showing, refresh_pages
+from goods.local_cache import local_cache
+from goods.mixins import DataMixin
+from goods.models import Item, RelatedItem
+from goods.services.recommendation_service import get_related_items, related_items_cache_key
+
+
+@override_settings(EDGE_CACHE_PURGE_URL="http://nginx:8081", SITE_URL="https://shop.example", BACKGROUND_TASK_WORKERS=0,
+                   EDGE_CACHE_PURGE_WORKERS=1)
+class EdgeCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.item = Item.objects.create(name="A", description="D", price=1, currency="usd")
+        self.other = Item.objects.create(name="B", description="D", price=2, currency="usd")
+        RelatedItem.objects.create(item=self.other, related=self.item, score=3, rank=0)
+
+    def _refreshed(self, mock_urlopen) -> list[str]:
+        requests = [call.args[0] for call in mock_urlopen.call_args_list]
+        for request in requests:
+            self.assertEqual(request.get_header("Host"), "shop.example")
+            self.assertEqual(request.get_header("X-forwarded-proto"), "https")
+            self.assertEqual(request.get_header("Cookie"), "pin_primary=1")
+        return [request.full_url for request in requests]
+
+    def test_pages_showing_item(self):
+        self.assertEqual(pages_showing([self.item.pk]), [self.item.pk, self.other.pk])
+        self.assertEqual(pages_showing([self.other.pk]), [self.other.pk])
+
+    @patch("goods.edge_cache.urlopen")
+    def test_save_refreshes_every_variant_of_affected_pages(self, mock_urlopen):
+        get_related_items(self.other.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.name = "A2"
+            self.item.save()
+        urls = self._refreshed(mock_urlopen)
+        path = reverse("goods:item_lookout", kwargs={"id": self.other.pk})
+        self.assertIn(f"http://nginx:8081{path}", urls)
+        self.assertIn(f"http://nginx:8081{path}?currency=eur", urls)
+        self.assertEqual(len(urls), 8)
+        # рекомендации страницы пересобираются с новым товаром, а не берутся из кэша
+        self.assertIsNone(cache.get(related_items_cache_key(self.other.pk)))
+        self.assertEqual(metrics.snapshot()["edge_cache.refreshed"], 8)
+
+    @patch("goods.edge_cache.urlopen")
+    def test_delete_refreshes_pages_collected_before_cascade(self, mock_urlopen):
+        mock_urlopen.side_effect = HTTPError("url", 404, "Not Found", {}, None)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.delete()
+        self.assertEqual(len(self._refreshed(mock_urlopen)), 8)
+        self.assertEqual(metrics.snapshot()["edge_cache.refresh_failed"], 0)
+
+    @override_settings(EDGE_CACHE_PURGE_URL="")
+    @patch("goods.edge_cache.urlopen")
+    def test_disabled_without_purge_url(self, mock_urlopen):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+        self.assertEqual(refresh_pages([self.item.pk]), 0)
+        mock_urlopen.assert_not_called()
+
+    def test_refresh_request_bypasses_worker_cache(self):
+        local_cache.clear()
+        DataMixin().get_item(self.item.pk)
+        # NOTIFY об изменении ещё не дошёл до воркера
+        Item.objects.filter(pk=self.item.pk).update(name="Fresh name")
+        url = reverse("goods:item_lookout", kwargs={"id": self.item.pk})
+        self.assertNotContains(self.client.get(url), "Fresh name")
+        self.assertContains(self.client.get(url, HTTP_X_EDGE_REFRESH="1"), "Fresh name")
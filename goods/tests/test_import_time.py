@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# Бюджет на импорт Django и приложения goods, в микросекундах
+IMPORT_TIME_BUDGET_US = 1_500_000
+
+IMPORT_SCRIPT = "import django; django.setup(); import goods.urls, goods.admin"
+
+
+class ImportTimeTest(SimpleTestCase):
+    """Замер `python -X importtime`: SDK Stripe не должен импортироваться при старте приложения."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "TestDjangoProject.settings")
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        cls.imports = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, _, name = line.removeprefix("import time:").split("|")
+            cls.imports[name.strip()] = int(self_us)
+
+    def test_stripe_sdk_is_not_imported(self):
+        self.assertIn("goods.services.stripe_service", self.imports)
+        self.assertNotIn("stripe", self.imports)
+        self.assertNotIn("aiohttp", self.imports)
+
+    def test_import_time_budget(self):
+        total = sum(self.imports.values())
+        self.assertLess(total, IMPORT_TIME_BUDGET_US, f"Импорт занял {total} мкс")
@@ -0,0 +1,86 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+
+from goods.local_cache import ALL, INVALIDATION_CHANNEL, invalidate, local_cache
+from goods.mixins import DataMixin
+from goods.models import CacheVersion, Item
+from goods.services.notify_service import NotificationHub
+
+
+@override_settings(LOCAL_CACHE_VERSION_CHECK=60)
+class LocalCacheTests(TestCase):
+    def setUp(self):
+        local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = Item.objects.create(name="A", description="D", price=1, currency="usd")
+
+    def _version(self, namespace="item"):
+        return CacheVersion.objects.get(namespace=namespace).version
+
+    def test_item_served_from_worker_memory(self):
+        DataMixin().get_item(self.item.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(DataMixin().get_item(self.item.pk).name, "A")
+
+    def test_save_evicts_item(self):
+        DataMixin().get_item(self.item.pk)
+        self.item.name = "B"
+        self.item.save()
+        self.assertEqual(DataMixin().get_item(self.item.pk).name, "B")
+
+    def test_invalidation_published_after_commit(self):
+        with patch("goods.local_cache.hub.publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate("item", self.item.pk)
+        publish.assert_called_once_with(INVALIDATION_CHANNEL, f"item:{self.item.pk}:{self._version()}")
+
+    def test_message_from_other_worker_evicts_key(self):
+        other = Item.objects.create(name="O", description="D", price=1, currency="usd")
+        local_cache.get_or_load("item", self.item.pk, lambda: "cached")
+        local_cache.get_or_load("item", other.pk, lambda: "other")
+        version = self._version()
+
+        local_cache.handle_message(f"item:{self.item.pk}:{version + 1}")
+        self.assertEqual(local_cache.get_or_load("item", self.item.pk, lambda: "fresh"), "fresh")
+        self.assertEqual(local_cache.get_or_load("item", other.pk, lambda: "reloaded"), "other")
+
+        # сообщение с версией version + 2 потерялось: неизвестно, что устарело, сбрасывается всё пространство
+        local_cache.handle_message(f"item:{self.item.pk}:{version + 3}")
+        self.assertEqual(local_cache.get_or_load("item", other.pk, lambda: "reloaded"), "reloaded")
+
+    def test_version_check_catches_missed_messages(self):
+        local_cache.get_or_load("discount", ALL, lambda: "stale")
+        # другая нода изменила данные, а сообщение до нас не дошло
+        CacheVersion.objects.update_or_create(namespace="discount", defaults={"version": 100})
+        with override_settings(LOCAL_CACHE_VERSION_CHECK=0):
+            self.assertEqual(local_cache.get_or_load("discount", ALL, lambda: "fresh"), "fresh")
+
+    def test_value_loaded_during_invalidation_is_not_stored(self):
+        def loader():
+            local_cache.evict("item", self.item.pk)
+            return "stale"
+
+        self.assertEqual(local_cache.get_or_load("item", self.item.pk, loader), "stale")
+        self.assertEqual(local_cache.get_or_load("item", self.item.pk, lambda: "fresh"), "fresh")
+
+    def test_failing_subscriber_does_not_stop_dispatch(self):
+        hub, received = NotificationHub(), MagicMock()
+        # поток слушателя не запускаем, сообщение раздаётся вручную, как его раздал бы слушатель
+        with patch("goods.services.notify_service.threading.Thread"):
+            hub.subscribe(INVALIDATION_CHANNEL, local_cache.handle_message)
+            hub.subscribe(INVALIDATION_CHANNEL, received)
+        with self.assertLogs("goods.services.notify_service", "ERROR"):
+            hub.dispatch(INVALIDATION_CHANNEL, "bad payload")
+        received.assert_called_once_with("bad payload")
+
+    def test_version_bumped_after_commit(self):
+        version = self._version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.item.name = "B"
+            self.item.save()
+            # до коммита строка версии не тронута и не заблокирована транзакцией записи
+            self.assertEqual(self._version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self._version(), version + 1)
@@ -0,0 +1,87 @@
+import io
+import json
+import logging
+from unittest.mock import patch, MagicMock
+
+from django.test import TestCase
+
+from goods.log import JsonFormatter, NonBlockingHandler, RequestIdFilter, SamplingFilter, begin_request_id, \
+    end_request_id
+from goods.models import Item, Order
+from goods.services.stripe_service import StripeService, WebHookStripeService
+
+
+class RequestIdMiddlewareTests(TestCase):
+    def setUp(self):
+        self.item = Item.objects.create(name="A", description="D", price=1, currency="usd")
+
+    def test_generates_and_accepts_request_id(self):
+        response = self.client.get(self.item.get_absolute_url())
+        self.assertRegex(response["X-Request-ID"], r"^[0-9a-f]{32}$")
+
+        response = self.client.get(self.item.get_absolute_url(), HTTP_X_REQUEST_ID="nginx-1234abcd")
+        self.assertEqual(response["X-Request-ID"], "nginx-1234abcd")
+
+        response = self.client.get(self.item.get_absolute_url(), HTTP_X_REQUEST_ID="bad id\n")
+        self.assertNotEqual(response["X-Request-ID"], "bad id\n")
+
+    @patch("stripe.PaymentIntent.create", return_value=MagicMock(id="pi_1", client_secret="secret"))
+    def test_request_id_travels_through_stripe_and_back(self, mock_create):
+        order = Order.objects.create(session_key="s")
+        order.items.set([self.item])
+        token = begin_request_id("req-checkout-1")
+        try:
+            with self.assertLogs("goods.services.stripe_service", level="INFO") as logs:
+                StripeService(order=order).create_payment_intent()
+        finally:
+            end_request_id(token)
+        self.assertEqual(mock_create.call_args.kwargs["metadata"],
+                         {"order_id": order.id, "request_id": "req-checkout-1"})
+        self.assertEqual(logs.records[0].order_id, order.id)
+
+        with self.assertLogs("goods.services.stripe_service", level="INFO") as logs:
+            WebHookStripeService.set_order_from_web_hook({"metadata": mock_create.call_args.kwargs["metadata"]})
+        self.assertEqual(logs.records[0].checkout_request_id, "req-checkout-1")
+
+
+class LogHandlerTests(TestCase):
+    def _record(self, level=logging.INFO, name="goods.test", **extra):
+        record = logging.LogRecord(name, level, __file__, 1, "hello %s", ("world",), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter(self):
+        record = self._record(order_id=5)
+        token = begin_request_id("req-1")
+        try:
+            RequestIdFilter().filter(record)
+        finally:
+            end_request_id(token)
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data["message"], "hello world")
+        self.assertEqual(data["request_id"], "req-1")
+        self.assertEqual(data["order_id"], 5)
+
+    def test_request_id_from_django_request_record(self):
+        record = self._record(request=MagicMock(request_id="req-404"))
+        RequestIdFilter().filter(record)
+        self.assertEqual(record.request_id, "req-404")
+
+    def test_sampling_by_logger_prefix(self):
+        sampling = SamplingFilter({"goods": 1.0, "goods.noisy": 0.0})
+        self.assertFalse(sampling.filter(self._record(logging.DEBUG, "goods.noisy.sub")))
+        self.assertTrue(sampling.filter(self._record(logging.INFO, "goods.noisy")))
+        self.assertTrue(sampling.filter(self._record(logging.DEBUG, "goods.quiet")))
+
+    def test_queue_handler_writes_in_background_and_drops_on_overflow(self):
+        stream = io.StringIO()
+        handler = NonBlockingHandler(stream=stream)
+        handler.handle(self._record(order_id=1))
+        handler.flush()
+        self.assertEqual(json.loads(stream.getvalue())["order_id"], 1)
+        handler.stop()
+
+        full = NonBlockingHandler(maxsize=1, stream=stream)
+        full.enqueue(self._record())
+        full.enqueue(self._record())
+        self.assertEqual(full.dropped, 1)
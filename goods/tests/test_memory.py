@@ -0,0 +1,83 @@
+import json
+import tracemalloc
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from goods import memory, metrics
+
+leaked = []
+
+
+class Leaky:
+    pass
+
+
+def leak(count):
+    leaked.extend(Leaky() for _ in range(count))
+
+
+@override_settings(MEMORY_RECYCLE_RSS_MB=100, MEMORY_SAMPLES_KEPT=3)
+class MemorySamplerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.sampler = memory.MemorySampler()
+        self.recycle = MagicMock()
+        # поток замеров не запускаем, замеры делаются вручную
+        with patch("goods.memory.threading.Thread"):
+            self.sampler.start(on_threshold=self.recycle)
+
+    @patch("goods.memory.rss_bytes", side_effect=[50 << 20, 150 << 20, 160 << 20, 170 << 20])
+    def test_recycles_once_over_threshold(self, _rss):
+        self.sampler.sample()
+        self.recycle.assert_not_called()
+        for _ in range(3):
+            self.sampler.sample()
+        self.recycle.assert_called_once_with()
+        self.assertEqual(metrics.snapshot()["memory.recycles"], 1)
+        self.assertEqual([rss for _, rss in self.sampler.samples()], [150 << 20, 160 << 20, 170 << 20])
+
+    def test_rss_is_measured(self):
+        self.assertGreater(memory.rss_bytes(), 0)
+
+
+@override_settings(INTERNAL_IPS=["127.0.0.1"])
+class MemoryViewTests(TestCase):
+    url = reverse("goods:memory")
+
+    def setUp(self):
+        leaked.clear()
+        self.addCleanup(leaked.clear)
+        self.addCleanup(memory.stop_tracing)
+
+    def test_internal_only(self):
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR="8.8.8.8").status_code, 404)
+
+    def test_allocation_diff_points_at_leaking_line(self):
+        response = self.client.get(self.url).json()
+        self.assertFalse(response["tracing"])
+        self.assertIsNone(response["allocations"])
+
+        response = self.client.post(self.url, json.dumps({"tracemalloc": "start"}), content_type="application/json")
+        self.assertTrue(response.json()["tracing"])
+        self.assertTrue(tracemalloc.is_tracing())
+        leak(5000)
+        response = self.client.get(self.url, {"limit": 5}).json()
+        self.assertIn("test_memory.py", response["allocations"][0]["site"])
+        self.assertGreater(response["allocations"][0]["size_diff"], 0)
+
+        self.client.post(self.url, json.dumps({"tracemalloc": "stop"}), content_type="application/json")
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_type_growth(self):
+        self.client.get(self.url, {"types": "1"})
+        leak(1000)
+        types = self.client.get(self.url, {"types": "1"}).json()["types"]
+        self.assertEqual(types[0]["type"], f"{__name__}.Leaky")
+        self.assertEqual(types[0]["count_diff"], 1000)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {"group": "x"}).status_code, 400)
+        self.assertEqual(self.client.post(self.url, "[]", content_type="application/json").status_code, 400)
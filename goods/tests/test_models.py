@@ -2,9 +2,12 @@ from decimal import Decimal
 from unittest.mock import patch
 
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from goods.models import Item, Order, Discount, Tax
+from goods.models import Item, Order, Discount, Tax, Category
+from goods.services.category_service import recount_categories, subtree_items
 
 
 class ItemModelTest(TestCase):
@@ -64,7 +67,7 @@ class OrderModelTest(TestCase):
 
 
 class DiscountModelTest(TestCase):
-    @patch("goods.models.stripe.Coupon.create")
+    @patch("stripe.Coupon.create")
     def test_save_creates_coupon_and_saves_id(self, mock_coupon_create):
         mock_coupon_create.return_value = type("C", (), {"id": "coupon_12345"})()
         disc = Discount(name="TestSale", percentage=15)
@@ -84,7 +87,7 @@ class DiscountModelTest(TestCase):
 
 
 class TaxModelTest(TestCase):
-    @patch("goods.models.stripe.TaxRate.create")
+    @patch("stripe.TaxRate.create")
     def test_save_creates_taxrate_and_saves_id(self, mock_taxrate_create):
         mock_taxrate_create.return_value = type("T", (), {"id": "txr_67890"})()
 
@@ -102,3 +105,71 @@ class TaxModelTest(TestCase):
         with self.assertRaises(ValidationError):
             t = Tax(name="TooMuch", percentage=150)
             t.full_clean()
+
+
+class CategoryModelTest(TestCase):
+    def setUp(self):
+        self.root = Category.objects.create(name="Root", slug="root")
+        self.child = Category.objects.create(name="Child", slug="child", parent=self.root)
+        self.leaf = Category.objects.create(name="Leaf", slug="leaf", parent=self.child)
+        self.other = Category.objects.create(name="Other", slug="other")
+
+    def _item(self, category, name="I"):
+        return Item.objects.create(name=name, description="D", price=Decimal("1.00"), currency="usd",
+                                   category=category)
+
+    def _counts(self, category):
+        category.refresh_from_db()
+        return category.item_count, category.total_item_count
+
+    def test_materialized_path(self):
+        self.assertEqual(self.leaf.path, f"/{self.root.pk}/{self.child.pk}/{self.leaf.pk}/")
+        self.assertEqual(self.leaf.depth, 2)
+
+    def test_subtree_fetched_in_one_query(self):
+        items = [self._item(self.root), self._item(self.leaf), self._item(self.other)]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(subtree_items(self.root)), items[:2])
+        # silk после запросов тестового клиента дописывает к каждому запросу свой EXPLAIN
+        self.assertEqual(len([q for q in queries if not q["sql"].startswith("EXPLAIN")]), 1)
+        self.assertEqual(list(subtree_items(self.root, after=items[0].pk)), [items[1]])
+
+    def test_item_counts_are_incremental(self):
+        item = self._item(self.leaf)
+        self._item(self.child)
+        self.assertEqual(self._counts(self.root), (0, 2))
+        self.assertEqual(self._counts(self.leaf), (1, 1))
+
+        item.category = self.other
+        item.save()
+        self.assertEqual(self._counts(self.root), (0, 1))
+        self.assertEqual(self._counts(self.other), (1, 1))
+
+        item.delete()
+        self.assertEqual(self._counts(self.other), (0, 0))
+
+    def test_move_subtree(self):
+        self._item(self.leaf)
+        self.child.parent = self.other
+        self.child.save()
+
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f"/{self.other.pk}/{self.child.pk}/{self.leaf.pk}/")
+        self.assertEqual(self.leaf.depth, 2)
+        self.assertEqual(self._counts(self.root), (0, 0))
+        self.assertEqual(self._counts(self.other), (0, 1))
+
+    def test_cannot_move_into_own_subtree(self):
+        self.root.parent = self.leaf
+        with self.assertRaises(ValidationError) as error:
+            self.root.full_clean()
+        self.assertIn("parent", error.exception.message_dict)
+        with self.assertRaises(IntegrityError):
+            self.root.save()
+
+    def test_recount(self):
+        self._item(self.leaf)
+        Category.objects.update(item_count=0, total_item_count=0)
+        recount_categories()
+        self.assertEqual(self._counts(self.root), (0, 1))
+        self.assertEqual(self._counts(self.leaf), (1, 1))
@@ -0,0 +1,45 @@
+import difflib
+import json
+import os
+from pathlib import Path
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from goods.query_plans import HOT_QUERIES, check_plan, explain, plan_shape, seed_dataset
+
+BASELINES = Path(__file__).with_name("query_plan_baselines.json")
+# UPDATE_QUERY_PLAN_BASELINES=1 python manage.py test goods.tests.test_query_plans — записать текущие планы как эталон
+UPDATE_BASELINES = os.getenv("UPDATE_QUERY_PLAN_BASELINES") == "1"
+
+
+@skipUnless(connection.vendor == "postgresql", "планы проверяются только на PostgreSQL")
+class HotQueryPlanTests(TestCase):
+    """
+    Планы горячих запросов на данных боевого размера: нужные индексы, отсутствие полного чтения больших таблиц,
+    границы оценки строк и совпадение формы плана с эталоном из query_plan_baselines.json.
+    Миграция или изменение ORM, ломающие план, валят этот тест. Только на PostgreSQL.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset()
+
+    def test_hot_query_plans(self):
+        baselines = json.loads(BASELINES.read_text(encoding="utf-8"))
+        shapes = {}
+        for query in HOT_QUERIES:
+            plan = explain(query.build())
+            shapes[query.name] = plan_shape(plan)
+            with self.subTest(query=query.name):
+                self.assertEqual(check_plan(query, plan), [], "\n" + "\n".join(shapes[query.name]))
+                if UPDATE_BASELINES:
+                    continue
+                self.assertIn(query.name, baselines, f"нет эталона плана {query.name}: запишите его "
+                                                     "с UPDATE_QUERY_PLAN_BASELINES=1")
+                diff = "\n".join(difflib.unified_diff(baselines[query.name], shapes[query.name],
+                                                      "эталон", "сейчас", lineterm=""))
+                self.assertEqual(diff, "", f"план {query.name} изменился:\n{diff}")
+        if UPDATE_BASELINES:
+            BASELINES.write_text(json.dumps(shapes, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
@@ -1,17 +1,40 @@
 import json
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from decimal import Decimal
+from io import BytesIO, StringIO
 from unittest.mock import patch, MagicMock
 
 import stripe
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
 from django.http import HttpResponse, JsonResponse
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from PIL import Image
 
-from goods.models import Item, Discount, Tax
+from goods import metrics
+from goods.models import Item, Discount, Tax, PromoCode, OrderStatusEvent, ExchangeRate, ItemPrice
 from goods.models import Order
 from goods.services.db_service import create_or_get_order, get_order_by_user_data
-from goods.services.stripe_service import StripeService, StripeEntity
+from goods.services.fx_service import FxError, parse_rates, refresh_item_prices, unit_amounts, update_rates
+from goods.services.image_service import process_item_image, variant_name
+from goods.services.order_event_service import order_timeline, orders_transitioned, status_events_between
+from goods.services.order_expiry_service import archive_orders, expire_stale_orders
+from goods.services.promo_service import PromoCodeError, find_promo_code, promo_code_usage, redeem_promo_code
+from goods.services.order_status_service import (ORDER_STATUS_CHANNEL, await_status_change, get_order_status,
+                                                 publish_order_status)
+from goods.services.stripe_service import StripeService, StripeEntity, get_coupon_percent_off, get_tax_rate_percentage
 from goods.services.stripe_service import WebHookStripeService
 from goods.utils import convert_price
+from goods.warmup import migrations_applied, warm_up
 
 
 class StripeServiceLineItemsTest(TestCase):
@@ -52,6 +75,36 @@ class StripeServiceLineItemsTest(TestCase):
                 self.assertEqual(li["tax_rates"], ["txr_123"])
 
 
+class StripeServiceQuantityTest(TestCase):
+    def setUp(self):
+        self.item1 = Item.objects.create(name="First", description="D", price=Decimal("10.00"), currency="usd")
+        self.item2 = Item.objects.create(name="Second", description="D", price=Decimal("2.50"), currency="usd")
+        self.order = create_or_get_order([self.item1, self.item2], session_key="basket",
+                                         quantities={self.item1.pk: 3, self.item2.pk: 2})
+
+    def test_line_items_carry_quantity(self):
+        line_items = StripeService(order=self.order)._create_line_items()
+        self.assertEqual(sorted(li["quantity"] for li in line_items), [2, 3])
+
+    @patch("stripe.Coupon.retrieve", side_effect=Exception("no coupon"))
+    @patch("stripe.TaxRate.retrieve", side_effect=Exception("no tax"))
+    def test_total_multiplies_by_quantity(self, *_):
+        self.assertEqual(StripeService(order=self.order)._calculate_total(), 3 * 1000 + 2 * 250)
+
+    def test_order_reused_only_for_same_quantities(self):
+        same = create_or_get_order([self.item1, self.item2], session_key="basket",
+                                   quantities={self.item1.pk: 3, self.item2.pk: 2})
+        other = create_or_get_order([self.item1, self.item2], session_key="basket",
+                                    quantities={self.item1.pk: 1, self.item2.pk: 2})
+        self.assertEqual(same.pk, self.order.pk)
+        self.assertNotEqual(other.pk, self.order.pk)
+
+    def test_mixed_currencies_rejected(self):
+        eur = Item.objects.create(name="Euro", description="D", price=Decimal("1.00"), currency="eur")
+        with self.assertRaises(ValueError):
+            create_or_get_order([self.item1, eur], session_key="basket")
+
+
 class StripeServiceTaxDiscountTest(TestCase):
     def setUp(self):
         self.item = Item.objects.create(
@@ -172,7 +225,7 @@ class StripeServicePaymentIntentTest(TestCase):
 
     @patch("stripe.PaymentIntent.create")
     def test_create_payment_intent(self, mock_create_intent):
-        mock_intent = MagicMock(client_secret="secret_123")
+        mock_intent = MagicMock(id="pi_123", client_secret="secret_123")
         mock_create_intent.return_value = mock_intent
 
         client_secret = self.stripe_service.create_payment_intent()
@@ -182,6 +235,8 @@ class StripeServicePaymentIntentTest(TestCase):
             metadata={"order_id": self.order.id},
         )
         self.assertEqual(client_secret, "secret_123")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_intent_id, "pi_123")
 
 
 class CreateOrderTests(TestCase):
@@ -309,3 +364,318 @@ class WebHookStripeServiceTests(TestCase):
         obj = {"metadata": {}}
         updated = WebHookStripeService.set_order_from_web_hook(obj)
         self.assertIsNone(updated)
+
+
+class OrderStatusEventTest(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(session_key="s", status="Created")
+
+    def _webhook(self, event_id):
+        payload = {"id": event_id, "type": "payment_intent.succeeded",
+                   "data": {"object": {"metadata": {"order_id": str(self.order.id)}}}}
+        with patch("stripe.Webhook.construct_event", return_value=payload):
+            return WebHookStripeService.get_webhook_response(b"{}", "t=1,v1=s", "whsec_test")
+
+    def test_webhook_records_event_once(self):
+        self._webhook("evt_1")
+        self._webhook("evt_2")  # повторная доставка: статус уже оплачен
+        timeline = order_timeline(self.order.id)
+        self.assertEqual(len(timeline), 1)
+        self.assertEqual((timeline[0]["from_status"], timeline[0]["to_status"], timeline[0]["source"],
+                          timeline[0]["stripe_event_id"]), ("Created", "InProgress", "webhook", "evt_1"))
+
+    def test_webhook_takes_from_status_under_lock(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        # заказ истёк между чтением в вебхуке и его транзакцией
+        Order.objects.filter(pk=self.order.pk).update(status="Expired")
+        with patch("goods.services.stripe_service.Order.objects.select_related") as select_related:
+            select_related.return_value.filter.return_value.first.return_value = stale
+            WebHookStripeService.set_order_from_web_hook({"metadata": {"order_id": str(self.order.id)}})
+        self.assertEqual([(event["from_status"], event["to_status"]) for event in order_timeline(self.order.id)],
+                         [("Expired", "InProgress")])
+
+    def test_timeline_and_window(self):
+        now = timezone.now()
+        other = Order.objects.create(session_key="s", status="Created")
+        OrderStatusEvent.objects.bulk_create([
+            OrderStatusEvent(order_id=self.order.id, from_status="InProgress", to_status="Done", source="webhook",
+                             occurred_at=now - timedelta(hours=1)),
+            OrderStatusEvent(order_id=self.order.id, from_status="Created", to_status="InProgress",
+                             source="webhook", occurred_at=now - timedelta(hours=2)),
+            OrderStatusEvent(order_id=other.id, from_status="Created", to_status="Expired", source="expiry",
+                             occurred_at=now - timedelta(days=2)),
+        ])
+        self.assertEqual([event["to_status"] for event in order_timeline(self.order.id)], ["InProgress", "Done"])
+        self.assertEqual(status_events_between(now - timedelta(days=1), now).count(), 2)
+        self.assertEqual(orders_transitioned(now - timedelta(days=3), now), [self.order.id, other.id])
+        self.assertEqual(orders_transitioned(now - timedelta(days=3), now, to_status="Expired"), [other.id])
+
+    def test_events_survive_archiving(self):
+        OrderStatusEvent.objects.create(order_id=self.order.id, from_status="Created", to_status="Expired",
+                                        source="expiry")
+        Order.objects.filter(pk=self.order.pk).update(status="Expired", created_at=timezone.now() - timedelta(days=2))
+        archive_orders(created_before=timezone.now() - timedelta(days=1))
+        self.assertFalse(Order.objects.filter(pk=self.order.pk).exists())
+        self.assertEqual(len(order_timeline(self.order.id)), 1)
+
+
+class PricingCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch("stripe.Coupon.retrieve")
+    def test_coupon_percent_is_cached(self, mock_coupon):
+        mock_coupon.return_value = MagicMock(percent_off=15)
+        self.assertEqual(get_coupon_percent_off("coupon_cached"), 15)
+        self.assertEqual(get_coupon_percent_off("coupon_cached"), 15)
+        mock_coupon.assert_called_once_with("coupon_cached")
+
+    @patch("stripe.TaxRate.retrieve")
+    def test_tax_rate_percent_is_cached(self, mock_tax_rate):
+        mock_tax_rate.return_value = MagicMock(percentage=None)
+        self.assertEqual(get_tax_rate_percentage("txr_cached"), 0)
+        self.assertEqual(get_tax_rate_percentage("txr_cached"), 0)
+        mock_tax_rate.assert_called_once_with("txr_cached")
+
+
+class WarmUpTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_migrations_applied(self):
+        self.assertTrue(migrations_applied())
+
+    @patch("goods.warmup.migrations_applied", return_value=False)
+    def test_warm_up_refuses_unapplied_migrations(self, _):
+        with self.assertRaises(RuntimeError):
+            warm_up()
+
+    @patch("stripe.Coupon.create", return_value=MagicMock(id="coupon_warm"))
+    @patch("stripe.Coupon.retrieve", return_value=MagicMock(percent_off=5))
+    def test_warm_up_primes_pricing_cache(self, mock_retrieve, _):
+        Discount.objects.create(name="Warm", percentage=5)
+        warm_up()
+        mock_retrieve.assert_called_once_with("coupon_warm")
+        self.assertEqual(get_coupon_percent_off("coupon_warm"), 5)
+        mock_retrieve.assert_called_once()
+
+
+class OrderStatusServiceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.order = Order.objects.create(session_key="s")
+
+    # на PostgreSQL NOTIFY доставляется только после настоящего коммита, поэтому проверяется сама публикация
+    @patch("goods.services.order_status_service.hub.publish")
+    def test_webhook_publishes_status_after_commit(self, publish):
+        with self.captureOnCommitCallbacks(execute=True):
+            WebHookStripeService.set_order_from_web_hook({"metadata": {"order_id": str(self.order.id)}})
+        publish.assert_called_once_with(ORDER_STATUS_CHANNEL, f"{self.order.id}:InProgress")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_order_status(self.order.id), "InProgress")
+
+    def test_await_status_change_wakes_on_publish(self):
+        timer = threading.Timer(0.05, publish_order_status, (self.order.id, "InProgress"))
+        timer.start()
+        status = async_to_sync(await_status_change)(self.order.id, "Created", timeout=5)
+        timer.join()
+        self.assertEqual(status, "InProgress")
+
+    @patch("goods.services.order_status_service.hub.publish")
+    def test_expired_orders_published(self, publish):
+        with self.captureOnCommitCallbacks(execute=True):
+            expire_stale_orders(timezone.now() + timedelta(minutes=1), workers=1)
+        publish.assert_called_once_with(ORDER_STATUS_CHANNEL, f"{self.order.id}:Expired")
+        self.assertEqual(get_order_status(self.order.id), "Expired")
+
+
+def make_image_file(name: str = "photo.png", size=(800, 600), color="red") -> SimpleUploadedFile:
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+@override_settings(BACKGROUND_TASK_WORKERS=0)
+class ItemImageServiceTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self.media.cleanup)
+        self.item = Item.objects.create(name="Photo", description="D", price=Decimal("1.00"), image=make_image_file())
+
+    def test_process_item_image_builds_content_addressed_variants(self):
+        self.assertTrue(process_item_image(self.item.pk))
+        self.item.refresh_from_db()
+        self.assertEqual(len(self.item.image_hash), 64)
+        self.assertEqual(set(self.item.image_variants), {"webp", "jpeg"})
+        self.assertEqual(set(self.item.image_variants["webp"]), {"320", "640"})
+        path = self.item.image_variants["webp"]["320"]
+        self.assertEqual(path, variant_name(self.item.image_hash, 320, "webp"))
+        with default_storage.open(path) as f:
+            self.assertEqual(Image.open(f).size, (320, 240))
+
+    def test_unchanged_image_is_skipped(self):
+        process_item_image(self.item.pk)
+        self.assertFalse(process_item_image(self.item.pk))
+        self.assertTrue(process_item_image(self.item.pk, force=True))
+
+    @patch("goods.signals.schedule_item_image")
+    def test_saving_item_schedules_processing_after_commit(self, mock_schedule):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item.save()
+        mock_schedule.assert_called_once_with(self.item.pk)
+
+    def test_rebuild_command_skips_unchanged(self):
+        process_item_image(self.item.pk)
+        Item.objects.create(name="New", description="D", price=Decimal("1.00"),
+                            image=make_image_file("new.png", color="blue"))
+        out = StringIO()
+        with patch("goods.management.commands.rebuild_item_images.ProcessPoolExecutor",
+                   lambda max_workers, mp_context, initializer: ThreadPoolExecutor(max_workers=1)):
+            call_command("rebuild_item_images", stdout=out)
+        self.assertIn("обработано 1, без изменений 1", out.getvalue())
+
+
+def _discount() -> Discount:
+    # bulk_create не вызывает save(), поэтому купон в Stripe не создаётся
+    return Discount.objects.bulk_create([Discount(name="Promo", percentage=15, stripe_id="coupon_promo")])[0]
+
+
+class FxServiceTest(TestCase):
+    def setUp(self):
+        self.usd = Item.objects.create(name="A", description="D", price=Decimal("10.00"), currency="usd")
+        self.rub = Item.objects.create(name="B", description="D", price=Decimal("925.00"), currency="rub")
+        update_rates(parse_rates({"base": "usd", "rates": {"rub": "92.5", "eur": "0.9", "jpy": "150"}}))
+        refresh_item_prices()
+
+    def test_parse_rates_rejects_bad_feed(self):
+        for data in ({"rates": {"rub": "-1"}}, {"base": "eur", "rates": {}}, {"rates": {"rub": "x"}}, []):
+            with self.assertRaises(FxError):
+                parse_rates(data)
+
+    def test_prices_precomputed_for_every_currency(self):
+        prices = {(price.item_id, price.currency): (price.amount, price.unit_amount)
+                  for price in ItemPrice.objects.all()}
+        self.assertEqual(prices[(self.usd.pk, "rub")], (Decimal("925.00"), 92500))
+        self.assertEqual(prices[(self.rub.pk, "eur")], (Decimal("9.00"), 900))
+        self.assertEqual(prices[(self.usd.pk, "usd")], (Decimal("10.00"), 1000))
+        self.assertEqual(update_rates({"rub": Decimal("92.5"), "eur": Decimal("0.95")}), ["eur"])
+        self.assertEqual(ExchangeRate.objects.get(currency="eur").rate, Decimal("0.95"))
+
+    def test_mixed_currency_order_in_display_currency(self):
+        order = create_or_get_order([self.usd, self.rub], "s", currency="eur")
+        self.assertEqual(order.currency, "eur")
+        self.assertEqual({line.item_id: line.unit_amount for line in order.lines.all()},
+                         {self.usd.pk: 900, self.rub.pk: 900})
+        self.assertEqual(create_or_get_order([self.usd, self.rub], "s", currency="eur").pk, order.pk)
+
+        # курс изменился — старый заказ с прежними ценами не переиспользуется
+        update_rates({"eur": Decimal("1.0")})
+        refresh_item_prices()
+        fresh = create_or_get_order([self.usd, self.rub], "s", currency="eur")
+        self.assertNotEqual(fresh.pk, order.pk)
+        self.assertEqual(StripeService(order=fresh)._calculate_total(), 2000)
+
+        with self.assertRaises(ValueError):
+            create_or_get_order([self.usd, self.rub], "s")
+
+    def test_item_prices_refreshed_in_save_transaction(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.usd.price = Decimal("20.00")
+            self.usd.save()
+            self.assertEqual(ItemPrice.objects.get(item=self.usd, currency="rub").unit_amount, 185000)
+
+    def test_rate_must_be_positive(self):
+        with self.assertRaises(ValidationError):
+            ExchangeRate(currency="eur", rate=Decimal("0")).full_clean()
+
+    def test_missing_price_is_an_error(self):
+        ItemPrice.objects.filter(item=self.rub, currency="eur").delete()
+        with self.assertRaises(FxError):
+            unit_amounts([self.rub], "eur")
+        with self.assertNumQueries(0):
+            self.assertEqual(unit_amounts([self.rub], "rub"), {self.rub.pk: 92500})
+
+
+class PromoCodeTest(TestCase):
+    def setUp(self):
+        self.discount = _discount()
+        self.item = Item.objects.create(name="A", description="D", price=Decimal("10.00"), currency="usd")
+
+    def test_case_insensitive_lookup_and_negative_cache(self):
+        PromoCode.objects.create(code="Summer-25", discount=self.discount)
+        self.assertEqual(find_promo_code(" summer-25 ").discount, self.discount)
+
+        with self.assertRaises(PromoCodeError):
+            find_promo_code("NOPE123")
+        with self.assertNumQueries(0):
+            with self.assertRaises(PromoCodeError):
+                find_promo_code("nope123")
+            with self.assertRaises(PromoCodeError):
+                find_promo_code("bad code!")
+
+        PromoCode.objects.create(code="NOPE123", discount=self.discount)
+        self.assertEqual(find_promo_code("nope123").code, "NOPE123")
+
+    def test_limit_split_between_counter_shards(self):
+        promo = PromoCode.objects.create(code="CAP", discount=self.discount, max_uses=5, counter_shards=3)
+        self.assertEqual(sorted(promo.counters.values_list("limit", flat=True)), [1, 2, 2])
+        for _ in range(5):
+            redeem_promo_code(promo)
+        with self.assertRaises(PromoCodeError):
+            redeem_promo_code(promo)
+        self.assertEqual(promo_code_usage(promo), 5)
+
+        promo.max_uses = 6
+        promo.save()
+        redeem_promo_code(promo)
+        self.assertEqual(promo_code_usage(promo), 6)
+
+    def test_use_counted_when_order_is_paid(self):
+        promo = PromoCode.objects.create(code="ONCE", discount=self.discount, max_uses=1)
+        first = create_or_get_order([self.item], session_key="s", discount=self.discount, promo_code=promo)
+        again = create_or_get_order([self.item], session_key="s", discount=self.discount, promo_code=promo)
+        self.assertEqual(first, again)
+        self.assertEqual(first.promo_code, promo)
+        # неоплаченный заказ использование не занимает
+        self.assertEqual(promo_code_usage(promo), 0)
+        WebHookStripeService.set_order_from_web_hook({"metadata": {"order_id": str(first.id)}})
+        WebHookStripeService.set_order_from_web_hook({"metadata": {"order_id": str(first.id)}})
+        self.assertEqual(promo_code_usage(promo), 1)
+        with self.assertRaises(PromoCodeError):
+            create_or_get_order([self.item], session_key="other", discount=self.discount, promo_code=promo)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_concurrent_payment_counted_over_limit(self):
+        cache.clear()
+        promo = PromoCode.objects.create(code="RACE", discount=self.discount, max_uses=1)
+        orders = [create_or_get_order([self.item], session_key=key, discount=self.discount, promo_code=promo)
+                  for key in ("a", "b")]
+        with self.assertLogs("goods.services.promo_service", "WARNING"):
+            for order in orders:
+                WebHookStripeService.set_order_from_web_hook({"metadata": {"order_id": str(order.id)}})
+        self.assertEqual(promo_code_usage(promo), 2)
+        self.assertEqual(metrics.snapshot()["promo.over_limit"], 1)
+
+
+# SQLite блокирует таблицу целиком, одновременные покупки проверяются на PostgreSQL
+@skipUnlessDBFeature("has_select_for_update")
+class PromoCodeConcurrencyTest(TransactionTestCase):
+    def _redeem(self, promo_id: int) -> bool:
+        try:
+            with transaction.atomic():
+                redeem_promo_code(PromoCode.objects.get(pk=promo_id))
+            return True
+        except PromoCodeError:
+            return False
+        finally:
+            connection.close()
+
+    def test_no_over_redemption_under_concurrent_checkouts(self):
+        promo = PromoCode.objects.create(code="RUSH", discount=_discount(), max_uses=50, counter_shards=4)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(self._redeem, [promo.pk] * 300))
+        self.assertEqual(sum(results), 50)
+        self.assertEqual(promo_code_usage(promo), 50)
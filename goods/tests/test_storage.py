@@ -0,0 +1,43 @@
+import gzip
+import tempfile
+
+import brotli
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase
+
+from goods.storage import CompressedManifestStaticFilesStorage
+
+
+class CompressedManifestStaticFilesStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = CompressedManifestStaticFilesStorage(location=self.tmp.name, base_url="/static/")
+        self.source = FileSystemStorage(location=settings.BASE_DIR / "static")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _collect(self, *names):
+        for name in names:
+            with self.source.open(name) as f:
+                self.storage.save(name, f)
+        paths = {name: (self.source, name) for name in names}
+        return list(self.storage.post_process(paths))
+
+    def test_hashed_minified_and_precompressed(self):
+        self._collect("deps/js/complete.js", "deps/css/shop.css")
+        for name in ("deps/js/complete.js", "deps/css/shop.css"):
+            hashed = self.storage.stored_name(name)
+            self.assertNotEqual(hashed, name)
+            with self.storage.open(hashed) as f:
+                content = f.read()
+            with self.source.open(name) as f:
+                self.assertLess(len(content), len(f.read()))
+            with self.storage.open(f"{hashed}.gz") as f:
+                self.assertEqual(gzip.decompress(f.read()), content)
+            with self.storage.open(f"{hashed}.br") as f:
+                self.assertEqual(brotli.decompress(f.read()), content)
+
+    def test_uncollected_file_falls_back_to_source_name(self):
+        self.assertEqual(self.storage.url("deps/js/item_intent.js"), "/static/deps/js/item_intent.js")
@@ -0,0 +1,119 @@
+import contextvars
+import threading
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from goods import metrics
+from goods.mixins import CacheMixin
+from goods.models import BackgroundTask, Order
+from goods.services.stripe_service import StripeService
+from goods.tasks import TaskExecutor, defer, run_stored_task
+
+request_var = contextvars.ContextVar("request_var", default=None)
+calls = []
+
+
+def record(value):
+    calls.append(value)
+
+
+def fail(value):
+    raise RuntimeError(value)
+
+
+@override_settings(BACKGROUND_TASK_WORKERS=2, BACKGROUND_TASK_QUEUE_SIZE=10)
+class TaskExecutorTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.executor = TaskExecutor()
+
+    def test_runs_in_worker_thread_with_request_context(self):
+        seen = []
+        request_var.set("req-1")
+        self.executor.submit(lambda: seen.append((threading.current_thread().name, request_var.get())))
+        self.assertEqual(self.executor.shutdown(timeout=5), 0)
+        self.assertEqual(len(seen), 1)
+        self.assertTrue(seen[0][0].startswith("background-task-"))
+        self.assertEqual(seen[0][1], "req-1")
+
+    @override_settings(BACKGROUND_TASK_WORKERS=1, BACKGROUND_TASK_QUEUE_SIZE=1)
+    def test_full_queue_runs_inline(self):
+        release = threading.Event()
+        started = threading.Event()
+        ran_in = []
+        self.executor.submit(lambda: (started.set(), release.wait(5)))
+        started.wait(5)
+        self.executor.submit(lambda: None)  # занимает единственное место в очереди
+        self.assertEqual(self.executor.depth(), 1)
+        self.executor.submit(lambda: ran_in.append(threading.current_thread()))
+        self.assertEqual(ran_in, [threading.current_thread()])
+        release.set()
+        self.executor.shutdown(timeout=5)
+        self.assertEqual(metrics.snapshot()["tasks.overflow"], 1)
+
+    def test_failed_task_is_counted(self):
+        self.executor.submit(fail, "boom")
+        self.executor.shutdown(timeout=5)
+        self.assertEqual(metrics.snapshot()["tasks.failed"], 1)
+        self.assertEqual(metrics.snapshot()["tasks.submitted"], 1)
+        self.assertIn("tasks.queue_depth", metrics.snapshot())
+
+
+@override_settings(BACKGROUND_TASK_WORKERS=0)
+class DeferTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            defer(record, "a")
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, ["a"])
+
+    def test_durable_task_is_stored_and_removed_after_run(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            defer(record, "b", durable=True)
+        task = BackgroundTask.objects.get()
+        self.assertEqual((task.func, task.args), ("goods.tests.test_tasks.record", ["b"]))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(calls, ["b"])
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    def test_failed_durable_task_is_retried_by_command(self):
+        task = BackgroundTask.objects.create(func="goods.tests.test_tasks.fail", args=["boom"])
+        self.assertFalse(run_stored_task(task.id))
+        task.refresh_from_db()
+        self.assertEqual(task.attempts, 1)
+        self.assertIn("boom", task.last_error)
+
+        BackgroundTask.objects.filter(pk=task.pk).update(func="goods.tests.test_tasks.record", run_after=task.created_at)
+        out = StringIO()
+        call_command("run_background_tasks", stdout=out)
+        self.assertIn("выполнено задач 1, не выполнено 0", out.getvalue())
+        self.assertEqual(calls, ["boom"])
+
+    @patch("goods.services.stripe_service.StripeService._calculate_total", return_value=100)
+    @patch("stripe.PaymentIntent.create")
+    def test_superseded_intent_left_to_reconciliation(self, mock_create, _total):
+        mock_create.return_value.id, mock_create.return_value.client_secret = "pi_new", "secret"
+        order = Order.objects.create(session_key="s", payment_intent_id="pi_old")
+        # покупатель со старым client_secret может быть посреди 3DS
+        with patch("stripe.PaymentIntent.cancel") as mock_cancel:
+            with self.captureOnCommitCallbacks(execute=True):
+                StripeService(order=order).create_payment_intent()
+        mock_cancel.assert_not_called()
+        order.refresh_from_db()
+        self.assertEqual(order.payment_intent_id, "pi_new")
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    def test_buy_response_cached_before_reply(self):
+        cache.clear()
+        view = CacheMixin()
+        with self.captureOnCommitCallbacks(execute=False):
+            view.set_cached_response("s", 1, {"clientSecret": "secret"}, 60)
+            self.assertEqual(view.get_cached_response("s", 1), {"clientSecret": "secret"})
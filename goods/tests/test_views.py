@@ -1,11 +1,28 @@
 import json
-from unittest.mock import patch
+import re
+import shutil
+import subprocess
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import MagicMock, patch
 
+from django.conf import settings
 from django.http import HttpResponse, JsonResponse
-from django.test import TestCase, Client, override_settings
+from django.test import TestCase, Client, modify_settings, override_settings
 from django.urls import reverse
 
-from goods.models import Item
+from django.contrib.sessions.models import Session
+from django.core import signing
+from django.core.cache import cache
+
+from goods.local_cache import local_cache
+from goods.middleware import BUYER_KEY_COOKIE, BUYER_KEY_SALT
+from goods.ratelimit import STRIPE_IN_FLIGHT_KEY, StripeOverloaded, counters, stripe_call_slot
+from goods.models import Item, Order, Category, Discount, PromoCode, ItemPrice, RelatedItem, Tax
+from goods.services.db_service import create_or_get_order, get_order_by_user_data
+from goods.services.stripe_service import WebHookStripeService
 
 
 class ItemViewTestCase(TestCase):
@@ -26,6 +43,58 @@ class ItemViewTestCase(TestCase):
         self.assertContains(response, self.item.price)
         self.assertContains(response, "₽")
 
+    def test_image_variants_render_srcset(self):
+        self.item.image_variants = {
+            "webp": {"320": "items/variants/ab/abc/320.webp", "640": "items/variants/ab/abc/640.webp"},
+            "jpeg": {"320": "items/variants/ab/abc/320.jpeg", "640": "items/variants/ab/abc/640.jpeg"},
+        }
+        self.item.save(update_fields=["image_variants"])
+        response = self.client.get(reverse("goods:item_lookout", kwargs={"id": self.item.id}))
+        self.assertContains(
+            response, 'srcset="/media/items/variants/ab/abc/320.webp 320w, /media/items/variants/ab/abc/640.webp 640w"'
+        )
+        self.assertContains(response, 'src="/media/items/variants/ab/abc/640.jpeg"')
+        self.assertNotContains(response, "default_product.png")
+
+    def test_price_in_display_currency(self):
+        ItemPrice.objects.create(item=self.item, currency="eur", amount=Decimal("1.08"), unit_amount=108)
+        response = self.client.get(reverse("goods:item_lookout", kwargs={"id": self.item.id}), {"currency": "eur"})
+        self.assertContains(response, "1.08 €")
+        self.assertContains(response, "?currency=eur")
+        self.client.cookies["currency"] = "eur"
+        self.assertContains(self.client.get(reverse("goods:item_lookout", kwargs={"id": self.item.id})), "1.08 €")
+
+    @override_settings(EDGE_CACHE_TTL=30)
+    def test_anonymous_page_is_cached_at_edge(self):
+        related = Item.objects.create(name="R", description="D", price=1, currency="rub")
+        RelatedItem.objects.create(item=self.item, related=related, score=1, rank=0)
+        response = self.client.get(reverse("goods:item_lookout", kwargs={"id": self.item.id}),
+                                   HTTP_X_DISPLAY_CURRENCY="none")
+        self.assertEqual(response["X-Accel-Expires"], "30")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("s-maxage=30", response["Cache-Control"])
+        self.assertEqual(response["Surrogate-Key"], f"item-{self.item.id} item-{related.id}")
+        self.assertFalse(response.cookies)
+        self.assertNotIn("Cookie", response.get("Vary", ""))
+
+        # без nginx валюту никто не нормализовал — ответ не для общего кэша
+        response = self.client.get(reverse("goods:item_lookout", kwargs={"id": self.item.id}))
+        self.assertIn("private", response["Cache-Control"])
+
+        self.client.cookies["sessionid"] = "staff"
+        response = self.client.get(reverse("goods:item_lookout", kwargs={"id": self.item.id}),
+                                   HTTP_X_DISPLAY_CURRENCY="none")
+        self.assertIn("private", response["Cache-Control"])
+        self.assertFalse(response.has_header("Surrogate-Key"))
+
+    def test_edge_page_rendered_in_currency_of_cache_key(self):
+        ItemPrice.objects.create(item=self.item, currency="eur", amount=Decimal("1.08"), unit_amount=108)
+        url = reverse("goods:item_lookout", kwargs={"id": self.item.id})
+        # nginx не узнал валюту в ?currency=%65ur и положит ответ под ключ без валюты
+        response = self.client.get(f"{url}?currency=%65ur&currency=eur", HTTP_X_DISPLAY_CURRENCY="none")
+        self.assertNotContains(response, "1.08 €")
+        self.assertContains(self.client.get(url, HTTP_X_DISPLAY_CURRENCY="eur"), "1.08 €")
+
     @patch("goods.views.ItemBuyView.get_session")
     def test_invalid_item(self, mock_session):
         mock_session.return_value = "session_123"
@@ -55,6 +124,41 @@ class ItemBuyViewTestCase(TestCase):
         response = self.client.get(reverse("goods:item_buy", kwargs={"id": self.item.id + 213}))
         self.assertEqual(response.status_code, 404)
 
+    @patch("goods.views.StripeService.create_payment_intent", return_value="pi_123_secret")
+    def test_buyer_key_is_stable_and_session_written_once(self, _):
+        url = reverse("goods:item_buy", kwargs={"id": self.item.id})
+        first = self.client.get(url)
+        self.assertIn(BUYER_KEY_COOKIE, first.cookies)
+        self.assertEqual(Session.objects.count(), 1)
+
+        cache.clear()
+        second = self.client.get(url)
+        self.assertNotIn(BUYER_KEY_COOKIE, second.cookies)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertEqual(self.client.session["order_id"], Order.objects.get().pk)
+
+    def test_invalid_item_does_not_create_session(self):
+        self.client.get(reverse("goods:item_buy", kwargs={"id": self.item.id + 213}))
+        self.assertEqual(Session.objects.count(), 0)
+
+    @patch("goods.views.StripeService.create_payment_intent", return_value="pi_123_secret")
+    def test_promo_code_applies_its_discount(self, _):
+        discount = Discount.objects.bulk_create([Discount(name="Promo", percentage=15, stripe_id="coupon_promo")])[0]
+        PromoCode.objects.create(code="SPRING", discount=discount, max_uses=1)
+        url = reverse("goods:item_buy", kwargs={"id": self.item.id})
+
+        self.assertEqual(self.client.get(url, {"code": "spring"}).status_code, 200)
+        order = Order.objects.get()
+        self.assertEqual((order.discount, order.promo_code.code), (discount, "SPRING"))
+        self.assertEqual(self.client.get(url, {"code": "unknown"}).status_code, 400)
+
+        WebHookStripeService.set_order_from_web_hook({"metadata": {"order_id": str(order.id)}})
+        other = Client()
+        response = other.get(url, {"code": "SPRING"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Лимит", response.json()["error"])
+
 
 @override_settings(STRIPE_WEBHOOK_SECRET="whsec_testsecret")
 class StripeWebhookViewTests(TestCase):
@@ -95,3 +199,314 @@ class StripeWebhookViewTests(TestCase):
         args, kwargs = mock_service.call_args
         self.assertIsNone(args[1])
         self.assertEqual(resp.status_code, 400)
+
+
+class OrderStatusViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.order = Order.objects.create(session_key="s", payment_intent_id="pi_status")
+        self.url = reverse("goods:order_status")
+        buyer_cookie = signing.get_cookie_signer(salt=BUYER_KEY_COOKIE + BUYER_KEY_SALT).sign("s")
+        self.client.cookies[BUYER_KEY_COOKIE] = self.async_client.cookies[BUYER_KEY_COOKIE] = buyer_cookie
+
+    def test_status_by_payment_intent(self):
+        response = self.client.get(self.url, {"payment_intent": "pi_status"})
+        self.assertJSONEqual(response.content, {"order_id": self.order.id, "status": "Created"})
+
+    def test_other_buyer_cannot_read_status(self):
+        self.assertEqual(Client().get(self.url, {"payment_intent": "pi_status"}).status_code, 404)
+        other = Client()
+        other.cookies[BUYER_KEY_COOKIE] = signing.get_cookie_signer(salt=BUYER_KEY_COOKIE + BUYER_KEY_SALT).sign("x")
+        self.assertEqual(other.get(self.url, {"payment_intent": "pi_status"}).status_code, 404)
+        stream = other.get(reverse("goods:order_status_stream"), {"payment_intent": "pi_status"})
+        self.assertEqual(stream.status_code, 404)
+
+    def test_status_from_session(self):
+        session = self.client.session
+        session["order_id"] = self.order.id
+        session.save()
+        response = self.client.get(self.url)
+        self.assertJSONEqual(response.content, {"order_id": self.order.id, "status": "Created"})
+
+    def test_unknown_order(self):
+        response = self.client.get(self.url, {"payment_intent": "pi_missing"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_under_wsgi_does_not_wait(self):
+        response = self.client.get(reverse("goods:order_status_stream"), {"payment_intent": "pi_status"})
+        chunks = list(response)
+        self.assertEqual(len(chunks), 1)
+        self.assertIn(b"retry: 3000", chunks[0])
+        self.assertIn(b'"status": "Created"', chunks[0])
+
+    async def test_stream_sends_status_event(self):
+        await Order.objects.filter(pk=self.order.pk).aupdate(status="InProgress")
+        response = await self.async_client.get(reverse("goods:order_status_stream"), {"payment_intent": "pi_status"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 1)
+        self.assertIn(b'"status": "InProgress"', chunks[0])
+
+
+# Минимальный DOM для complete.js: элементы по селектору, адрес возврата Stripe и fetch статуса
+COMPLETE_PAGE_HARNESS = """
+const elements = {};
+const element = () => ({style: {}, classList: {add() {}}, innerHTML: "", textContent: "", href: ""});
+const requested = [];
+globalThis.window = {location: {search: "?payment_intent=pi_page"}};
+globalThis.document = {querySelector: (selector) => elements[selector] ??= element()};
+globalThis.fetch = async (url) => {
+  requested.push(url);
+  return {ok: true, json: async () => ({status: "Done"})};
+};
+process.on("exit", () => console.log(JSON.stringify({requested, text: elements["#status-text"]?.textContent})));
+"""
+
+
+class CompletePageTests(TestCase):
+    """Страница возврата из Stripe: скрипт страницы запускается в node и опрашивает статус заказа"""
+
+    def test_page_polls_order_status(self):
+        node = shutil.which("node")
+        if not node:
+            self.skipTest("node не установлен")
+        page = self.client.get(reverse("goods:complete_page")).content.decode()
+        inline = re.search(r"<script>(.*?)</script>", page, re.S).group(1)
+        script = (Path(settings.BASE_DIR) / "static/deps/js/complete.js").read_text()
+        result = subprocess.run([node, "-e", COMPLETE_PAGE_HARNESS + inline + script],
+                                capture_output=True, text=True, timeout=30)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        output = json.loads(result.stdout)
+        self.assertEqual(output["requested"], [f"{reverse('goods:order_status')}?payment_intent=pi_page"])
+        self.assertEqual(output["text"], "Платеж успешен")
+
+
+@override_settings(RATE_LIMITS={"buy": {"session": (5, 60), "ip": (2, 60)}, "webhook": {"global": (1, 60)}},
+                   INTERNAL_IPS=["127.0.0.1"])
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        counters().clear()
+        self.item = Item.objects.create(name="Limited", description="D", price=100, currency="usd")
+
+    def test_buy_rejected_with_retry_after(self):
+        url = reverse("goods:item_buy", kwargs={"id": self.item.id + 1000})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.2").status_code, 404)
+
+        metrics = self.client.get(reverse("goods:metrics")).json()
+        self.assertEqual(metrics["ratelimit.rejected.buy.ip"], 1)
+
+    @patch("goods.views.WebHookStripeService.get_webhook_response", return_value=HttpResponse(status=200))
+    def test_webhook_has_separate_limit(self, _):
+        url = reverse("goods:stripe_webhook")
+        self.assertEqual(self.client.post(url, data=b"{}", content_type="application/json").status_code, 200)
+        self.assertEqual(self.client.post(url, data=b"{}", content_type="application/json").status_code, 429)
+
+    @override_settings(STRIPE_MAX_IN_FLIGHT=0)
+    @patch("goods.views.StripeService.create_payment_intent", return_value="pi_secret")
+    def test_load_is_shed_when_stripe_is_busy(self, mock_intent):
+        response = self.client.get(reverse("goods:item_buy", kwargs={"id": self.item.id}))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        mock_intent.assert_not_called()
+
+    @patch("goods.views.StripeService.create_payment_intent", side_effect=StripeOverloaded)
+    def test_shed_request_does_not_keep_order(self, _):
+        response = self.client.get(reverse("goods:item_buy", kwargs={"id": self.item.id}))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Order.objects.exists())
+
+    def test_counters_kept_in_shared_cache(self):
+        with stripe_call_slot():
+            self.assertEqual(counters().get(STRIPE_IN_FLIGHT_KEY), 1)
+            self.assertIsNone(cache.get(STRIPE_IN_FLIGHT_KEY))
+        self.assertEqual(counters().get(STRIPE_IN_FLIGHT_KEY), 0)
+
+    def test_metrics_are_internal_only(self):
+        response = self.client.get(reverse("goods:metrics"), REMOTE_ADDR="8.8.8.8")
+        self.assertEqual(response.status_code, 404)
+
+
+class BasketViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        counters().clear()
+        self.item1 = Item.objects.create(name="A", description="D", price=10, currency="usd")
+        self.item2 = Item.objects.create(name="B", description="D", price=5, currency="usd")
+
+    def _item_url(self, item_id):
+        return reverse("goods:basket_item", kwargs={"id": item_id})
+
+    def test_add_update_remove(self):
+        response = self.client.post(self._item_url(self.item1.id), data={"quantity": 2},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.client.post(self._item_url(self.item1.id), content_type="application/json")
+        self.client.post(self._item_url(self.item2.id), content_type="application/json")
+
+        basket = self.client.get(reverse("goods:basket")).json()
+        self.assertEqual({line["id"]: line["quantity"] for line in basket["items"]},
+                         {self.item1.id: 3, self.item2.id: 1})
+        self.assertEqual(basket["total"], "35.00")
+
+        self.client.put(self._item_url(self.item1.id), data={"quantity": 0}, content_type="application/json")
+        self.client.delete(self._item_url(self.item2.id))
+        self.assertEqual(self.client.get(reverse("goods:basket")).json()["items"], [])
+
+    def test_invalid_input(self):
+        response = self.client.post(self._item_url(self.item1.id), data={"quantity": "many"},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+        self.assertEqual(self.client.post(self._item_url(self.item1.id + 1000)).status_code, 404)
+
+    def test_mixed_currency_rejected(self):
+        eur = Item.objects.create(name="E", description="D", price=1, currency="eur")
+        self.client.post(self._item_url(self.item1.id))
+        self.assertEqual(self.client.post(self._item_url(eur.id)).status_code, 400)
+
+    def test_empty_checkout(self):
+        self.assertEqual(self.client.post(reverse("goods:basket_checkout")).status_code, 400)
+
+    @patch("goods.views.StripeService.create_payment_intent", return_value="pi_secret")
+    def test_checkout_creates_single_order(self, mock_intent):
+        self.client.post(self._item_url(self.item1.id), data={"quantity": 2}, content_type="application/json")
+        self.client.post(self._item_url(self.item2.id), data={"quantity": 4}, content_type="application/json")
+
+        response = self.client.post(reverse("goods:basket_checkout"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["clientSecret"], "pi_secret")
+        mock_intent.assert_called_once()
+
+        order = Order.objects.get()
+        self.assertEqual({line.item_id: line.quantity for line in order.lines.all()},
+                         {self.item1.id: 2, self.item2.id: 4})
+        self.assertEqual(self.client.session["order_id"], order.id)
+        self.assertEqual(self.client.get(reverse("goods:basket")).json()["items"], [])
+
+
+    @patch("goods.views.StripeService.create_payment_intent", return_value="pi_secret")
+    def test_checkout_discount_from_promo_code_or_default(self, _):
+        local_cache.clear()
+        # bulk_create не шлёт сигналов: скидка и сбор по умолчанию не должны остаться в кэше воркера
+        self.addCleanup(local_cache.clear)
+        default, promo = Discount.objects.bulk_create([Discount(name="Default", percentage=5, stripe_id="c_default"),
+                                                       Discount(name="Promo", percentage=15, stripe_id="c_promo")])
+        tax = Tax.objects.bulk_create([Tax(name="VAT", percentage=20, stripe_id="txr_vat")])[0]
+        PromoCode.objects.create(code="SPRING", discount=promo, max_uses=5)
+
+        self.client.post(self._item_url(self.item1.id))
+        self.client.post(reverse("goods:basket_checkout"), data={"code": "spring"}, content_type="application/json")
+        self.client.post(self._item_url(self.item2.id))
+        self.client.post(reverse("goods:basket_checkout"))
+        self.assertEqual([(order.discount, order.tax) for order in Order.objects.order_by("id")],
+                         [(promo, tax), (default, tax)])
+
+@override_settings(STRIPE_BULK_CONCURRENCY=2)
+class BulkOrderViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        counters().clear()
+        self.usd = Item.objects.create(name="A", description="D", price=10, currency="usd")
+        self.usd2 = Item.objects.create(name="B", description="D", price=5, currency="usd")
+        self.rub = Item.objects.create(name="R", description="D", price=100, currency="rub")
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def _create_intent(self, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        key = kwargs["idempotency_key"]
+        return MagicMock(id=f"pi_{key}", client_secret=f"secret_{key}")
+
+    def _post(self, orders):
+        return self.client.post(reverse("goods:bulk_orders"), data={"orders": orders}, content_type="application/json")
+
+    def test_creates_orders_and_intents_with_bounded_concurrency(self):
+        orders = [{"reference": f"PO-{i}", "items": [{"id": self.usd.id, "quantity": 2}, {"id": self.usd2.id}]}
+                  for i in range(6)]
+        orders += [{"reference": "missing", "items": [{"id": self.usd.id + 1000}]},
+                   {"reference": "mixed", "items": [{"id": self.usd.id}, {"id": self.rub.id}]}]
+        with patch("stripe.PaymentIntent.create", side_effect=self._create_intent) as mock_create:
+            results = self._post(orders).json()["orders"]
+
+        self.assertEqual([result["reference"] for result in results], [order["reference"] for order in orders])
+        self.assertIn("error", results[6])
+        self.assertIn("error", results[7])
+        self.assertEqual(mock_create.call_count, 6)
+        self.assertLessEqual(self.max_in_flight, 2)
+        self.assertEqual(mock_create.call_args.kwargs["amount"], 2500)
+
+        order = Order.objects.get(reference="PO-0")
+        self.assertEqual({line.item_id: line.quantity for line in order.lines.all()}, {self.usd.id: 2, self.usd2.id: 1})
+        self.assertEqual(results[0]["orderId"], order.id)
+        self.assertEqual(results[0]["clientSecret"], f"secret_order-{order.id}-payment-intent-2500-usd")
+        self.assertEqual(order.payment_intent_id, f"pi_order-{order.id}-payment-intent-2500-usd")
+
+    def test_retry_reuses_orders_and_idempotency_keys(self):
+        orders = [{"reference": "PO-1", "items": [{"id": self.usd.id}]}]
+        with patch("stripe.PaymentIntent.create", side_effect=self._create_intent) as mock_create:
+            first = self._post(orders).json()["orders"]
+            second = self._post(orders).json()["orders"]
+        self.assertEqual(first, second)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(mock_create.call_args_list[0].kwargs["idempotency_key"],
+                         mock_create.call_args_list[1].kwargs["idempotency_key"])
+
+    def test_bulk_order_not_reused_by_buy(self):
+        with patch("stripe.PaymentIntent.create", side_effect=self._create_intent):
+            self._post([{"reference": "PO-1", "items": [{"id": self.usd.id}]}])
+        bulk = Order.objects.get(reference="PO-1")
+        self.assertIsNone(get_order_by_user_data([self.usd], bulk.session_key))
+        self.assertNotEqual(create_or_get_order([self.usd], bulk.session_key), bulk)
+
+    def test_invalid_payload_rejected(self):
+        self.assertEqual(self._post([]).status_code, 400)
+        self.assertEqual(self._post([{"reference": "A", "items": [{"id": "x"}]}]).status_code, 400)
+        duplicate = {"reference": "A", "items": [{"id": self.usd.id}]}
+        self.assertEqual(self._post([duplicate, duplicate]).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(LOCAL_CACHE_VERSION_CHECK=60)
+@modify_settings(MIDDLEWARE={"remove": "silk.middleware.SilkyMiddleware"})
+class CategoryViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.root = Category.objects.create(name="Root", slug="root")
+        self.child = Category.objects.create(name="Child", slug="child", parent=self.root)
+        self.items = [Item.objects.create(name=f"Item {i}", description="D", price=1, currency="usd",
+                                          category=self.child) for i in range(30)]
+
+    def test_keyset_pages_of_subtree(self):
+        response = self.client.get(reverse("goods:category", kwargs={"slug": "root"}))
+        self.assertContains(response, "Item 23")
+        self.assertNotContains(response, "Item 24")
+        self.assertContains(response, f"?after={self.items[23].pk}")
+
+        response = self.client.get(reverse("goods:category", kwargs={"slug": "root"}), {"after": self.items[23].pk})
+        self.assertContains(response, "Item 29")
+        self.assertNotContains(response, "?after=")
+        self.assertEqual(self.client.get(reverse("goods:category", kwargs={"slug": "missing"})).status_code, 404)
+
+    def test_rendered_page_is_cached_until_catalog_changes(self):
+        url = reverse("goods:category", kwargs={"slug": "child"})
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        # версия пространства растёт после коммита записи
+        with self.captureOnCommitCallbacks(execute=True):
+            self.items[0].name = "Renamed"
+            self.items[0].save()
+        self.assertContains(self.client.get(url), "Renamed")
@@ -1,14 +1,28 @@
 from django.urls import path
 
-from goods.views import ItemView, ItemBuyView, SuccessView, CancelView, CompleteView, StripeWebhookView
+from goods.views import (ItemView, ItemBuyView, SuccessView, CancelView, CompleteView, StripeWebhookView,
+                         OrderStatusView, OrderStatusStreamView, MetricsView, BasketView, BasketItemView,
+                         BasketCheckoutView, SalesReportView, CategoryView, BulkOrderView,
+                         OrderEventsView, MemoryView)
 
 app_name = "goods"
 
 urlpatterns = [
     path('item/<int:id>', ItemView.as_view(), name="item_lookout"),
+    path('category/<slug:slug>/', CategoryView.as_view(), name="category"),
     path('buy/<int:id>', ItemBuyView.as_view(), name="item_buy"),
+    path('basket/', BasketView.as_view(), name="basket"),
+    path('basket/items/<int:id>', BasketItemView.as_view(), name="basket_item"),
+    path('basket/checkout/', BasketCheckoutView.as_view(), name="basket_checkout"),
+    path('orders/bulk/', BulkOrderView.as_view(), name="bulk_orders"),
     path('complete/', CompleteView.as_view(), name="complete_page"),
+    path('order/status/', OrderStatusView.as_view(), name="order_status"),
+    path('order/status/stream/', OrderStatusStreamView.as_view(), name="order_status_stream"),
     path('success/', SuccessView.as_view(), name="success_page"),
     path('cancel/', CancelView.as_view(), name="cancel_page"),
-    path('webhooks/stripe/', StripeWebhookView.as_view(), name="stripe_webhook")
+    path('webhooks/stripe/', StripeWebhookView.as_view(), name="stripe_webhook"),
+    path('internal/reports/sales/', SalesReportView.as_view(), name="sales_report"),
+    path('internal/orders/<int:id>/events/', OrderEventsView.as_view(), name="order_events"),
+    path('internal/metrics/', MetricsView.as_view(), name="metrics"),
+    path('internal/memory/', MemoryView.as_view(), name="memory"),
 ]
@@ -5,3 +5,7 @@ def convert_price(price: float) -> int:
     """Переводит цену в нужные единицы (копейки или центы)"""
     return int(price * 100)
 
+
+def get_client_ip(request) -> str:
+    """IP клиента: за nginx берём X-Real-IP, иначе адрес соединения"""
+    return request.META.get("HTTP_X_REAL_IP") or request.META.get("REMOTE_ADDR", "")
@@ -1,52 +1,129 @@
-from django.http import JsonResponse
+import asyncio
+import json
+import os
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import DetailView, TemplateView
 
-from TestDjangoProject import settings
-from goods.mixins import DataMixin, CacheMixin
-from goods.models import Discount, Tax
+from goods import edge_cache, memory, metrics
+from goods.local_cache import local_cache
+from goods.mixins import DataMixin, CacheMixin, RateLimitMixin, InternalOnlyMixin, BasketMixin, EdgeCacheMixin
+from goods.services.basket_service import Basket
+from goods.services.bulk_order_service import BulkOrderError, create_bulk_orders, parse_bulk_orders
+from goods.services.category_service import CATEGORY_PAGE_SIZE, subtree_items
 from goods.services.db_service import create_or_get_order
+from goods.services.fx_service import FxError
+from goods.services.order_event_service import order_timeline
+from goods.services.order_status_service import (get_order_status, await_status_change, STREAM_KEEPALIVE,
+                                                 STREAM_RETRY, STREAM_TIMEOUT)
+from goods.ratelimit import stripe_call_slot
+from goods.services.promo_service import PromoCodeError, find_promo_code
+from goods.services.recommendation_service import get_related_items
+from goods.services.sales_service import sales_report
 from goods.services.stripe_service import StripeService, WebHookStripeService
 
 
-class ItemView(DataMixin, DetailView):
+class ItemView(EdgeCacheMixin, DataMixin, DetailView):
+    """Страница товара; одинакова для всех анонимных посетителей, поэтому кэшируется в nginx"""
     template_name = 'item.html'
     context_object_name = "item"
 
     def get_object(self, queryset=None):
-        item = self.get_item(pk=int(self.kwargs.get("id")))
+        item = self.get_item(pk=int(self.kwargs.get("id")), fresh=edge_cache.is_refresh(self.request))
         return item
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        related_items = get_related_items(self.object.pk)
+        currency = self.get_display_currency(self.request)
+        self.edge_item_ids = [self.object.pk, *(item.pk for item in related_items)]
+        item_buy_url = reverse('goods:item_buy', kwargs={"id": self.object.pk})
+        if currency:
+            item_buy_url += f"?currency={currency}"
         user_context = self.get_user_context(title="Страница товара", stripe_public_key=True,
-                                             item_buy_url=self.request.build_absolute_uri(
-                                                 reverse('goods:item_buy', kwargs={"id": self.object.pk})),
+                                             item_buy_url=self.request.build_absolute_uri(item_buy_url),
                                              complete_url=self.request.build_absolute_uri(
-                                                 reverse('goods:complete_page')))
+                                                 reverse('goods:complete_page')),
+                                             related_items=related_items,
+                                             currency=currency or self.object.currency,
+                                             prices=self.get_display_prices([self.object, *related_items], currency))
         return context | user_context
 
 
-class ItemBuyView(CacheMixin, DataMixin, View):
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class CategoryView(DataMixin, View):
+    """
+    Товары категории вместе с подкатегориями, keyset-пагинация ?after=<id последнего товара>.
+    Отрисованная страница кэшируется; ключ содержит версии товаров и категорий, поэтому изменения видны сразу.
+    Вид только читает, поэтому без транзакции ATOMIC_REQUESTS: попадание в кэш не обращается к БД вовсе.
+    """
+
+    def get(self, request, slug):
+        category = self.get_category(slug)
+        try:
+            after = int(request.GET.get("after", 0))
+        except ValueError:
+            raise Http404("Page not found")
+
+        currency = self.get_display_currency(request)
+        key = (f"category_page_{category.pk}_{after}_{currency}_{local_cache.version('category')}_"
+               f"{local_cache.version('item')}_{local_cache.version('item_price')}")
+        html = cache.get(key)
+        if html is None:
+            items = list(subtree_items(category, after=after, limit=CATEGORY_PAGE_SIZE + 1))
+            has_next = len(items) > CATEGORY_PAGE_SIZE
+            items = items[:CATEGORY_PAGE_SIZE]
+            context = self.get_user_context(
+                title=category.name, category=category, items=items,
+                prices=self.get_display_prices(items, currency),
+                ancestors=self.get_category_ancestors(category),
+                children=list(category.children.all()),
+                next_after=items[-1].pk if has_next else None,
+            )
+            html = render_to_string("category.html", context)
+            cache.set(key, html, timeout=settings.CATEGORY_PAGE_CACHE_TIMEOUT)
+        return HttpResponse(html)
+
+
+class ItemBuyView(RateLimitMixin, CacheMixin, DataMixin, View):
     """Обработка покупки при помощи StripeService; получает id возвращает либо сlientSecret либо sessionId"""
+    rate_limit_scope = "buy"
 
     def get(self, request, id):
         session_key = self.get_session(request)
+        try:
+            promo_code = find_promo_code(request.GET["code"]) if request.GET.get("code") else None
+        except PromoCodeError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        currency = self.get_display_currency(request)
+        cache_id = "_".join(str(part) for part in (id, promo_code and promo_code.pk, currency) if part)
 
-        cached_response = self.get_cached_response(session_key, id)
+        cached_response = self.get_cached_response(session_key, cache_id)
         if cached_response:
             return JsonResponse(cached_response)
 
-        # TODO: В продакшене тут логика получения скидки (из корзины/по купону и др.) и доп сбора (по типу товара, фиксированный и др.), для теста берем первую скидку и доп сбор по pk=1.
         item = self.get_item(pk=id)
-        discount = Discount.objects.first()
-        tax = Tax.objects.first()
+        discount, tax = self.get_order_adjustments(promo_code)
 
         # TODO: В продакшене тут логика составления заказа, например, по корзине с последующей привязкой по пользователю, для теста берем тот item, по которому поступил get запрос.
-        order = create_or_get_order(items=[item], session_key=session_key, discount=discount, tax=tax)
+        try:
+            order = create_or_get_order(items=[item], session_key=session_key, discount=discount, tax=tax,
+                                        promo_code=promo_code, currency=currency)
+        except (PromoCodeError, FxError) as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        self.remember_order(request, order.pk)
 
         stripe_service = StripeService(order=order)
 
@@ -57,21 +134,147 @@ class ItemBuyView(CacheMixin, DataMixin, View):
         # response_data = {"sessionId": session_id}
 
         # Реализация со stripe payment intent
-        client_secret = stripe_service.create_payment_intent()
+        with stripe_call_slot():
+            client_secret = stripe_service.create_payment_intent()
         response_data = {"clientSecret": client_secret}
-        self.set_cached_response(session_key, id, response_data, 60)
+        self.set_cached_response(session_key, cache_id, response_data, 60)
         return JsonResponse(response_data)
 
 
+class BasketView(View):
+    """Содержимое корзины покупателя"""
+
+    def get(self, request):
+        return JsonResponse(Basket(request.buyer_key).as_dict())
+
+
+class BasketItemView(BasketMixin, DataMixin, View):
+    """Позиция корзины: POST — добавить товар, PUT — установить количество (0 — убрать), DELETE — убрать товар"""
+
+    def post(self, request, id):
+        item = self.get_item(pk=id)
+        basket = Basket(self.get_session(request))
+        basket.add(item, self.get_quantity(request))
+        return JsonResponse(basket.as_dict())
+
+    def put(self, request, id):
+        basket = Basket(request.buyer_key)
+        basket.update(id, self.get_quantity(request))
+        return JsonResponse(basket.as_dict())
+
+    def delete(self, request, id):
+        basket = Basket(request.buyer_key)
+        basket.remove(id)
+        return JsonResponse(basket.as_dict())
+
+
+class BasketCheckoutView(RateLimitMixin, BasketMixin, DataMixin, View):
+    """Оформление корзины: один заказ с количествами и один Payment Intent на всю корзину"""
+    rate_limit_scope = "buy"
+
+    def post(self, request):
+        session_key = self.get_session(request)
+        basket = Basket(session_key)
+        lines = basket.get_items()
+        if not lines:
+            return JsonResponse({"error": "Корзина пуста"}, status=400)
+
+        promo_code = self.get_promo_code(request)
+        discount, tax = self.get_order_adjustments(promo_code)
+        try:
+            order = create_or_get_order(items=[item for item, _ in lines], session_key=session_key,
+                                        discount=discount, tax=tax, promo_code=promo_code,
+                                        quantities={item.pk: quantity for item, quantity in lines},
+                                        currency=self.get_display_currency(request))
+        except FxError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        self.remember_order(request, order.pk)
+
+        with stripe_call_slot():
+            client_secret = StripeService(order=order).create_payment_intent()
+        basket.clear()
+        return JsonResponse({"clientSecret": client_secret, "orderId": order.pk})
+
+
+class BulkOrderView(RateLimitMixin, DataMixin, View):
+    """
+    Оптовый заказ: много корзин в одном запросе, по заказу и Payment Intent на каждую.
+    Возвращает результат по каждому заказу; повтор с теми же reference безопасен.
+    """
+    rate_limit_scope = "bulk_order"
+
+    def post(self, request):
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "Некорректный JSON"}, status=400)
+        try:
+            baskets = parse_bulk_orders(data)
+            discount, tax = self.get_order_adjustments()
+            results = create_bulk_orders(baskets, self.get_session(request), discount=discount, tax=tax)
+        except BulkOrderError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        return JsonResponse({"orders": results})
+
+
 class CompleteView(DataMixin, TemplateView):
     template_name = "complete.html"
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user_context = self.get_user_context(title="Оплата завершена", stripe_public_key=True)
+        user_context = self.get_user_context(title="Оплата завершена",
+                                             order_status_url=reverse('goods:order_status'),
+                                             order_status_stream_url=reverse('goods:order_status_stream'))
         return context | user_context
 
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class OrderStatusView(DataMixin, View):
+    """
+    Статус заказа из кэша или БД, без запросов к Stripe. Отвечает сразу: под WSGI клиент опрашивает его
+    с интервалом и не занимает воркер ожиданием.
+    """
+
+    def get(self, request):
+        order_id = self.get_order_id(request)
+        if order_id is None:
+            raise Http404("Order not found")
+        return JsonResponse({"order_id": order_id, "status": get_order_status(order_id)})
+
+
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
+class OrderStatusStreamView(DataMixin, View):
+    """
+    Server-Sent Events со статусом заказа; под ASGI ожидающий клиент не занимает поток воркера.
+    Под WSGI ожидание заняло бы синхронный воркер, поэтому поток отдаёт текущий статус и закрывается.
+    """
+
+    async def get(self, request):
+        order_id = await sync_to_async(self.get_order_id)(request)
+        if order_id is None:
+            raise Http404("Order not found")
+        return StreamingHttpResponse(self._stream(order_id, wait=isinstance(request, ASGIRequest)),
+                                     content_type="text/event-stream",
+                                     headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @staticmethod
+    def _event(order_id: int, status: str | None) -> str:
+        return f"event: status\ndata: {json.dumps({'order_id': order_id, 'status': status})}\n\n"
+
+    async def _stream(self, order_id: int, wait: bool):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STREAM_TIMEOUT
+        status = await sync_to_async(get_order_status)(order_id)
+        yield f"retry: {STREAM_RETRY * 1000}\n" + self._event(order_id, status)
+        while wait and status == "Created" and loop.time() < deadline:
+            new_status = await await_status_change(order_id, status, STREAM_KEEPALIVE)
+            if new_status == status:
+                yield ": keep-alive\n\n"
+            else:
+                status = new_status
+                yield self._event(order_id, status)
+
+
 class SuccessView(DataMixin, TemplateView):
     template_name = "success.html"
 
@@ -91,10 +294,11 @@ class CancelView(DataMixin, TemplateView):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
-class StripeWebhookView(View):
+class StripeWebhookView(RateLimitMixin, View):
     """
     Обработка Stripe вебхуков.
     """
+    rate_limit_scope = "webhook"
 
     def post(self, request, *args, **kwargs):
         payload = request.body
@@ -102,3 +306,69 @@ class StripeWebhookView(View):
         endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
         result = WebHookStripeService().get_webhook_response(payload, sig_header, endpoint_secret)
         return result
+
+
+class SalesReportView(InternalOnlyMixin, View):
+    """
+    Отчет по продажам из агрегатов: ?from=YYYY-MM-DD&to=YYYY-MM-DD&group=day|item.
+    По умолчанию последние 30 дней по дням, суммы в центах.
+    """
+
+    def get(self, request):
+        try:
+            day_to = date.fromisoformat(request.GET["to"]) if "to" in request.GET else timezone.localdate()
+            day_from = (date.fromisoformat(request.GET["from"]) if "from" in request.GET
+                        else day_to - timedelta(days=29))
+        except ValueError:
+            return JsonResponse({"error": "Дата должна быть в формате YYYY-MM-DD"}, status=400)
+        group_by = request.GET.get("group", "day")
+        if group_by not in ("day", "item"):
+            return JsonResponse({"error": "group должен быть day или item"}, status=400)
+        return JsonResponse({"from": day_from, "to": day_to, "rows": sales_report(day_from, day_to, group_by)})
+
+
+class OrderEventsView(InternalOnlyMixin, View):
+    """История смен статуса заказа из журнала order_status_event, в том числе для архивированных заказов."""
+
+    def get(self, request, id):
+        return JsonResponse({"orderId": id, "events": order_timeline(id)})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class MemoryView(InternalOnlyMixin, View):
+    """
+    Память воркера, ответившего на запрос: RSS, последние замеры и рост выделений tracemalloc с прошлого запроса
+    (?limit=20&group=lineno|filename|traceback, ?types=1 — рост числа объектов по типам).
+    POST {"tracemalloc": "start"|"stop"} включает или выключает трассировку в этом воркере.
+    """
+
+    def get(self, request):
+        try:
+            limit = min(int(request.GET.get("limit", 20)), 100)
+        except ValueError:
+            return JsonResponse({"error": "limit должен быть числом"}, status=400)
+        group = request.GET.get("group", "lineno")
+        if group not in ("lineno", "filename", "traceback"):
+            return JsonResponse({"error": "group: lineno, filename или traceback"}, status=400)
+        return JsonResponse(memory.report(limit, group, types=request.GET.get("types") == "1"))
+
+    def post(self, request):
+        try:
+            action = json.loads(request.body).get("tracemalloc")
+        except (ValueError, AttributeError):
+            action = None
+        if action == "start":
+            memory.start_tracing()
+        elif action == "stop":
+            memory.stop_tracing()
+        else:
+            return JsonResponse({"error": 'Ожидается {"tracemalloc": "start"} или {"tracemalloc": "stop"}'},
+                                status=400)
+        return JsonResponse({"pid": os.getpid(), "tracing": action == "start"})
+
+
+class MetricsView(InternalOnlyMixin, View):
+    """Счётчики приложения (отказы лимитов и т.п.) для внутреннего мониторинга."""
+
+    def get(self, request):
+        return JsonResponse(metrics.snapshot())
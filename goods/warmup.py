@@ -0,0 +1,42 @@
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+from django.template.loader import get_template
+from django.urls import reverse
+
+from goods.models import Discount, Tax
+from goods.services.stripe_client import get_stripe
+from goods.services.stripe_service import get_coupon_percent_off, get_tax_rate_percentage
+
+WARMUP_TEMPLATES = ("item.html", "complete.html", "success.html", "cancel.html")
+
+
+def migrations_applied(database: str = "default") -> bool:
+    """Быстрая проверка: все ли миграции применены (один запрос к django_migrations, без интроспекции схемы)."""
+    executor = MigrationExecutor(connections[database])
+    return not executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def warm_up() -> None:
+    """
+    Прогрев приложения до форка воркеров gunicorn (preload_app):
+    импортируем urls/views и SDK stripe, компилируем шаблоны, кладём в кэш проценты скидок и сборов.
+    """
+    if not migrations_applied():
+        raise RuntimeError("Не все миграции применены: запустите сервис migrate перед web")
+
+    reverse("goods:item_lookout", kwargs={"id": 1})
+    for template_name in WARMUP_TEMPLATES:
+        get_template(template_name)
+
+    stripe = get_stripe()
+    try:
+        for stripe_id in Discount.objects.exclude(stripe_id="").values_list("stripe_id", flat=True):
+            get_coupon_percent_off(stripe_id)
+        for stripe_id in Tax.objects.exclude(stripe_id="").values_list("stripe_id", flat=True):
+            get_tax_rate_percentage(stripe_id)
+    except stripe.error.StripeError:
+        # недоступность Stripe не должна мешать старту: кэш заполнится на первых запросах
+        pass
+
+    # соединения с БД не должны наследоваться воркерами после fork
+    connections.close_all()
@@ -0,0 +1,37 @@
+import multiprocessing
+import os
+import signal
+
+wsgi_app = "TestDjangoProject.wsgi:application"
+bind = "0.0.0.0:8000"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+timeout = 300
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+# Страховка от медленного роста памяти, если порог MEMORY_RECYCLE_RSS_MB не задан (0 — без ограничения)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# Django, stripe и приложение goods загружаются один раз в мастере, воркеры получают их через fork
+preload_app = True
+
+
+def on_starting(server):
+    from goods.warmup import warm_up
+
+    warm_up()
+
+
+def post_fork(server, worker):
+    from goods.memory import sampler
+
+    # SIGTERM самому себе — мягкая остановка: воркер дорабатывает текущий запрос, мастер запускает новый
+    sampler.start(on_threshold=lambda: os.kill(os.getpid(), signal.SIGTERM))
+
+
+def worker_exit(server, worker):
+    from django.conf import settings
+
+    from goods.tasks import executor
+
+    # дорабатываем фоновые задачи воркера; оставшиеся надёжные задачи выполнит run_background_tasks
+    executor.shutdown(timeout=settings.BACKGROUND_TASK_DRAIN_TIMEOUT)
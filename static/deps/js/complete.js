@@ -19,29 +19,30 @@ const InfoIcon =
 </svg>`;
 
 // ------- UI helpers -------
-function setPaymentDetails(intent) {
+function setPaymentDetails(intentId, orderStatus) {
   let statusText = "Something went wrong, please try again.";
   let iconColor = "#DF1B41";
   let icon = ErrorIcon;
 
 
-  if (!intent) {
+  if (!orderStatus) {
     setErrorState();
     return;
   }
 
-  switch (intent.status) {
-    case "succeeded":
+  switch (orderStatus) {
+    case "InProgress":
+    case "Done":
       statusText = "Платеж успешен";
       iconColor = "#30B130";
       icon = SuccessIcon;
       break;
-    case "processing":
+    case "Created":
       statusText = "Платеж в обработке.";
       iconColor = "#6D6E78";
       icon = InfoIcon;
       break;
-    case "requires_payment_method":
+    case "Expired":
       statusText = "Платеж не прошел. Попробуйте снова.";
       break;
     default:
@@ -51,9 +52,9 @@ function setPaymentDetails(intent) {
   document.querySelector("#status-icon").style.backgroundColor = iconColor;
   document.querySelector("#status-icon").innerHTML = icon;
   document.querySelector("#status-text").textContent= statusText;
-  document.querySelector("#intent-id").textContent = intent.id;
-  document.querySelector("#intent-status").textContent = intent.status;
-  document.querySelector("#view-details").href = `https://dashboard.stripe.com/payments/${intent.id}`;
+  document.querySelector("#intent-id").textContent = intentId;
+  document.querySelector("#intent-status").textContent = orderStatus;
+  document.querySelector("#view-details").href = `https://dashboard.stripe.com/payments/${intentId}`;
 }
 
 function setErrorState() {
@@ -64,20 +65,53 @@ function setErrorState() {
   document.querySelector("#view-details").classList.add("hidden");
 }
 
-checkStatus();
+// Получает статус заказа с нашего сервера. SSE под ASGI присылает смену статуса сразу; закрытый поток
+// (под WSGI сервер отдаёт текущий статус и закрывает его) браузер переоткрывает через retry из ответа.
+// Без EventSource — короткий опрос /order/status/.
+const POLL_INTERVAL = 3000;
+const POLL_TIMEOUT = 5 * 60 * 1000;
 
-// Fetches the payment intent status after payment submission
-async function checkStatus() {
-  const clientSecret = new URLSearchParams(window.location.search).get(
-    "payment_intent_client_secret"
-  );
+function checkStatus() {
+  const intentId = new URLSearchParams(window.location.search).get("payment_intent");
 
-  if (!clientSecret) {
+  if (!intentId) {
     setErrorState();
     return;
   }
 
-  const { paymentIntent } = await stripe.retrievePaymentIntent(clientSecret);
+  const query = `payment_intent=${encodeURIComponent(intentId)}`;
+  const deadline = Date.now() + POLL_TIMEOUT;
+  if (window.EventSource) {
+    const source = new EventSource(`${order_status_stream_url}?${query}`);
+    source.addEventListener("status", (event) => {
+      const {status} = JSON.parse(event.data);
+      setPaymentDetails(intentId, status);
+      if (status !== "Created" || Date.now() > deadline) {
+        source.close();
+      }
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        pollStatus(intentId, query, deadline);
+      }
+    };
+  } else {
+    pollStatus(intentId, query, deadline);
+  }
+}
 
-  setPaymentDetails(paymentIntent);
-}
\ No newline at end of file
+async function pollStatus(intentId, query, deadline) {
+  const response = await fetch(`${order_status_url}?${query}`);
+  if (!response.ok) {
+    setErrorState();
+    return;
+  }
+
+  const {status} = await response.json();
+  setPaymentDetails(intentId, status);
+  if (status === "Created" && Date.now() < deadline) {
+    setTimeout(() => pollStatus(intentId, query, deadline), POLL_INTERVAL);
+  }
+}
+
+checkStatus();